@@ -2,7 +2,10 @@ from flask import Flask
 from routes.github_routes import github_bp
 from routes.taiga_routes import taiga_bp
 from routes.excel_routes import excel_bp
+from routes.metrics_routes import metrics_bp
+from routes.request_body import CodecJSONProvider
 from config.logger_config import setup_logging
+from processing.ingest import start as start_ingestion
 import logging
 
 setup_logging()
@@ -10,12 +13,17 @@ logger = logging.getLogger(__name__)
 
 def create_app():
     app = Flask(__name__)
+    app.json = CodecJSONProvider(app)      # orjson / msgspec for the responses when installed
 
     # Register  blueprint routes
     app.register_blueprint(github_bp)
     app.register_blueprint(taiga_bp)
     app.register_blueprint(excel_bp)
+    app.register_blueprint(metrics_bp)
     logger.info("Flask created and Blueprints registered successfully.")
+
+    # Open the spool of this worker and replay the deliveries left by a previous run
+    start_ingestion()
     return app
 
 if __name__ == "__main__":
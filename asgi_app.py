@@ -0,0 +1,156 @@
+import logging
+import os
+from contextlib import asynccontextmanager
+
+import anyio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from config.settings import GITHUB_SIGNATURE_KEY, TAIGA_SIGNATURE_KEY, ASGI_DRAIN_SECONDS
+from config.logger_config import setup_logging
+from database import motor_client
+from datasources.github_decoders import decode_github_payload
+from datasources.requests import async_http_client
+from processing import async_processing, delivery_dedup, taiga_dedup
+from processing.ingest import start as start_ingestion
+from processing.taiga_processor import TAIGA_COLLECTIONS
+from routes.github_event_filter import fast_reject
+from routes.verify_signature.verify_signature_github import verify_github_signature
+from routes.verify_signature.verify_signature_taiga import verify_taiga_signature
+from utils import json_codec, metrics
+from utils.metrics import snapshot
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+class CodecJSONResponse(JSONResponse):
+    '''
+    JSON response encoded with json_codec (orjson / msgspec when installed).
+    '''
+    def render(self, content) -> bytes:
+        return json_codec.dumps(content)
+
+
+def _response(result) -> JSONResponse:
+    '''
+    (body, status[, headers]) as returned by the processors -> JSONResponse.
+    '''
+    body, status, *headers = result
+    return CodecJSONResponse(body, status_code=status, headers=headers[0] if headers else None)
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # Open the spool of this worker, replay the deliveries left by a previous run and start the background workers
+    start_ingestion()
+    metrics.register_gauge("asgi.inflight", async_processing.inflight)
+    yield
+    if not await async_processing.drain(ASGI_DRAIN_SECONDS):
+        logger.warning(f"Deliveries still in flight after {ASGI_DRAIN_SECONDS}s, they will be replayed from the spool.")
+    await async_http_client.aclose()
+    motor_client.close()
+
+
+def create_asgi_app() -> FastAPI:
+    '''
+    ASGI counterpart of app.create_app(), with the same /webhook/github|taiga|excel contracts and /metrics.
+    '''
+    app = FastAPI(title="LD Connect", lifespan=_lifespan, default_response_class=CodecJSONResponse)
+
+    @app.post("/webhook/github")
+    async def github_webhook(request: Request):
+        logger.info("Received Github webhook request.")
+        body = await request.body()
+        view = memoryview(body)
+        if not verify_github_signature(view, request.headers.get("X-Hub-Signature-256", ""), GITHUB_SIGNATURE_KEY.encode()):
+            logger.warning("Invalid Github webhook signature.")
+            return CodecJSONResponse({"error": "Invalid Signature"}, status_code=403)
+
+        event_name = request.headers.get("X-GitHub-Event")
+        if fast_reject(event_name, view):
+            return CodecJSONResponse({"status": "ignored", "event": event_name}, status_code=200)
+
+        prj = request.query_params.get("prj")
+        quality_model = request.query_params.get("quality_model")
+        if not prj:
+            logger.warning("Missing required query param: prj")
+            return CodecJSONResponse({"error": "prj is required as query parameter"}, status_code=400)
+
+        delivery_id = request.headers.get("X-GitHub-Delivery", "")
+        duplicate = await anyio.to_thread.run_sync(delivery_dedup.claim, delivery_id)
+        if duplicate:
+            return _response(duplicate)
+
+        raw_payload = decode_github_payload(event_name, view)
+        if not raw_payload:
+            logger.warning("Github webhook called without JSON payload.")
+            await anyio.to_thread.run_sync(delivery_dedup.release, delivery_id)
+            return CodecJSONResponse({"error": "No JSON received"}, status_code=400)
+
+        headers = {"X-GitHub-Event": event_name, "X-GitHub-Delivery": delivery_id}
+        try:
+            return _response(async_processing.ingest("github", raw_payload, body, prj, quality_model, headers))
+        except Exception:
+            await anyio.to_thread.run_sync(delivery_dedup.release, delivery_id)
+            raise
+
+    @app.post("/webhook/taiga")
+    async def taiga_webhook(request: Request):
+        logger.info("Received Taiga webhook request.")
+        body = await request.body()
+        view = memoryview(body)
+        if not verify_taiga_signature(view, request.headers.get("X-TAIGA-WEBHOOK-SIGNATURE", ""), TAIGA_SIGNATURE_KEY.encode()):
+            logger.warning("Invalid Taiga webhook signature.")
+            return CodecJSONResponse({"error": "Invalid Signature"}, status_code=403)
+
+        prj = request.query_params.get("prj")
+        quality_model = request.query_params.get("quality_model")
+        raw_payload = json_codec.loads_or_none(view)
+        if not raw_payload:
+            logger.warning("Taiga webhook called without JSON payload.")
+            return CodecJSONResponse({"error": "No JSON"}, status_code=400)
+
+        if raw_payload.get("type", "") not in TAIGA_COLLECTIONS:
+            return CodecJSONResponse({"status": "ignored", "reason": "unsupported type"}, status_code=200)
+
+        content_key = taiga_dedup.content_key(view, prj)
+        duplicate = await anyio.to_thread.run_sync(taiga_dedup.claim, content_key)
+        if duplicate:
+            return _response(duplicate)
+
+        try:
+            result = async_processing.ingest("taiga", raw_payload, body, prj, quality_model,
+                                             {taiga_dedup.CONTENT_KEY_HEADER: content_key})
+        except Exception:
+            await anyio.to_thread.run_sync(taiga_dedup.release, content_key)
+            raise
+        await anyio.to_thread.run_sync(taiga_dedup.finish, content_key, result)
+        return _response(result)
+
+    @app.post("/webhook/excel")
+    async def excel_webhook(request: Request):
+        logger.info("Received Excel webhook request.")
+        body = await request.body()
+        raw_json = json_codec.loads_or_none(memoryview(body))
+        if not raw_json:
+            logger.warning("Excel webhook called without JSON payload.")
+            return CodecJSONResponse({"error": "No JSON received"}, status_code=400)
+
+        prj = request.query_params.get("prj")
+        quality_model = request.query_params.get("quality_model")
+        if not prj:
+            logger.warning("Missing required query param: prj")
+            return CodecJSONResponse({"error": "prj is required as query parameter"}, status_code=400)
+
+        return _response(async_processing.ingest("excel", raw_json, body, prj, quality_model, {}))
+
+    @app.get("/metrics")
+    async def metrics_endpoint():
+        # Counters are per worker process, the pid tells the scrapes of each worker apart
+        return {"pid": os.getpid(), "metrics": snapshot()}
+
+    logger.info("FastAPI app created and routes registered successfully.")
+    return app
+
+# In order to run it: uvicorn asgi_app:create_asgi_app --factory --host 0.0.0.0 --port 5000
@@ -0,0 +1,55 @@
+'''
+Benchmark of the compiled field extractors (datasources/field_spec.py) against the same specs walked field by field
+from the payload root, which is what the hand-written parsers did. Also checks both give the same documents.
+
+In order to execute this script: python -m benchmarks.bench_field_spec --number 20000
+'''
+
+import argparse
+import timeit
+
+from datasources.field_spec import compile_spec, interpret_spec
+from datasources import taiga_handler, github_handler
+
+_MILESTONE = {"id": 7, "name": "Sprint 1", "closed": False, "created_date": "2025-03-01T10:00:00Z",
+              "modified_date": "2025-03-02T10:00:00.123Z", "estimated_start": "2025-03-01", "estimated_finish": "2025-03-15"}
+
+TAIGA_PAYLOAD = {
+    "action": "change", "type": "task", "by": {"username": "student"},
+    "data": {"id": 11, "ref": 3, "subject": "Implement login", "project": {"id": 5, "name": "TeamA"},
+             "status": {"name": "Closed", "is_closed": True}, "is_closed": True,
+             "created_date": "2025-03-03T08:00:00Z", "modified_date": "2025-03-04T08:00:00Z", "finished_date": None,
+             "milestone": _MILESTONE, "assigned_to": {"username": "student"}, "user_story": {"id": 9, "is_closed": False},
+             "custom_attributes_values": {"Priority": "High"}, "points": [{"value": 2}, {"value": 3}],
+             "description": "As a student I want to log in so that I see my marks"},
+}
+
+GITHUB_PAYLOAD = {
+    "action": "closed", "organization": {"login": "TeamA"}, "repository": {"full_name": "TeamA/app"},
+    "sender": {"id": 1, "login": "student", "url": "https://api.github.com/users/student", "type": "User", "site_admin": False},
+    "pull_request": {"number": 2, "title": "Login", "created_at": "2025-03-03T08:00:00Z", "closed_at": "2025-03-04T08:00:00Z",
+                     "merged": True, "merged_by": {"login": "teacher"}, "assignee": None, "requested_reviewers": [{"login": "peer"}]},
+}
+
+CASES = [
+    ("taiga task",        taiga_handler.TASK_SPEC,            TAIGA_PAYLOAD),
+    ("taiga userstory",   taiga_handler.USERSTORY_SPEC,       TAIGA_PAYLOAD),
+    ("taiga issue",       taiga_handler.ISSUE_SPEC,           TAIGA_PAYLOAD),
+    ("github pull_request", github_handler.PULL_REQUEST_SPEC, GITHUB_PAYLOAD),
+]
+
+
+def main(number: int) -> None:
+    print(f"{'spec':<22}{'walked (us)':>14}{'compiled (us)':>15}{'speed-up':>10}")
+    for name, spec, payload in CASES:
+        walked, compiled = interpret_spec(spec, "webhook"), compile_spec(spec, "webhook")
+        assert walked(payload) == compiled(payload), f"{name}: compiled extractor differs"
+        t_walked = min(timeit.repeat(lambda: walked(payload), number=number, repeat=3)) / number * 1e6
+        t_compiled = min(timeit.repeat(lambda: compiled(payload), number=number, repeat=3)) / number * 1e6
+        print(f"{name:<22}{t_walked:>14.2f}{t_compiled:>15.2f}{t_walked / t_compiled:>9.1f}x")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark of the compiled field extractors")
+    ap.add_argument("--number", type=int, default=20000, help="Extractions per measure")
+    main(ap.parse_args().number)
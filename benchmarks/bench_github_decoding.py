@@ -0,0 +1,128 @@
+'''
+Decode time and peak memory of the GitHub payloads: standard json, json_codec (orjson / msgspec / json) and the
+selective decoders of datasources/github_decoders.py. Also checks the parsers give the same documents either way.
+
+The corpus is a directory of delivery bodies named after their event (push-1.json, pull_request-2.json, issues-3.json…),
+e.g. saved from the GitHub "Recent deliveries" page. Without --corpus, synthetic payloads shaped like the real ones
+(full repository / organization / pusher / head_commit objects) are used.
+
+In order to execute this script: python -m benchmarks.bench_github_decoding --corpus payloads/ --number 200
+'''
+
+import argparse
+import json
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import List, Tuple
+
+from datasources.github_decoders import EVENT_TREES, decode_typed
+from datasources.github_handler import parse_github_event
+from utils import json_codec
+
+_URL = "https://api.github.com/repos/TeamA/app"
+
+
+def _user(login: str) -> dict:
+    return {"login": login, "id": 1000, "node_id": "MDQ6VXNlcjE=", "avatar_url": f"https://avatars.githubusercontent.com/{login}",
+            "gravatar_id": "", "type": "User", "site_admin": False,
+            **{f"{k}_url": f"https://api.github.com/users/{login}/{k}" for k in
+               ("html", "followers", "following", "gists", "starred", "subscriptions", "organizations", "repos",
+                "events", "received_events")}}
+
+
+def _repository() -> dict:
+    repo = {"id": 1, "node_id": "R_1", "name": "app", "full_name": "TeamA/app", "private": True, "owner": _user("TeamA"),
+            "description": "Project of the software engineering course " * 4, "fork": False, "size": 2048,
+            "default_branch": "main", "topics": ["course", "team-a"], "visibility": "private"}
+    repo.update({f"{k}_url": f"{_URL}/{k}{{/sha}}" for k in
+                 ("keys", "collaborators", "teams", "hooks", "issue_events", "events", "assignees", "branches", "tags",
+                  "blobs", "git_tags", "git_refs", "trees", "statuses", "languages", "stargazers", "contributors",
+                  "subscribers", "subscription", "commits", "git_commits", "comments", "issue_comment", "contents",
+                  "compare", "merges", "archive", "downloads", "issues", "pulls", "milestones", "notifications",
+                  "labels", "releases", "deployments")})
+    repo.update({f"has_{k}": True for k in ("issues", "projects", "downloads", "wiki", "pages", "discussions")})
+    return repo
+
+
+def _commit(i: int) -> dict:
+    return {"id": f"{i:040x}", "tree_id": f"{i + 1:040x}", "distinct": True, "message": f"task #{i} Implement the login form\n\n" + "Details. " * 20,
+            "timestamp": "2025-03-03T08:00:00+01:00", "url": f"https://github.com/TeamA/app/commit/{i:040x}",
+            "author": {"name": "Student", "email": "student@example.com", "username": "student"},
+            "committer": {"name": "Student", "email": "student@example.com", "username": "student"},
+            "added": [f"src/module_{i}/file_{j}.py" for j in range(10)],
+            "removed": [], "modified": [f"src/common/file_{j}.py" for j in range(20)]}
+
+
+def synthetic_corpus() -> List[Tuple[str, str, bytes]]:
+    org = {"login": "TeamA", "id": 2, "description": "", **{f"{k}_url": f"https://api.github.com/orgs/TeamA/{k}" for k in
+                                                               ("repos", "events", "hooks", "issues", "members", "public_members")}}
+    base = {"repository": _repository(), "organization": org, "sender": _user("student"), "installation": {"id": 3}}
+    corpus = []
+    for n in (1, 20, 200):
+        commits = [_commit(i) for i in range(n)]
+        push = {"ref": "refs/heads/main", "before": "0" * 40, "after": commits[-1]["id"], "created": False, "deleted": False,
+                "forced": False, "compare": f"https://github.com/TeamA/app/compare/{n}", "pusher": {"name": "student"},
+                "commits": commits, "head_commit": commits[-1], **base}
+        corpus.append((f"push, {n} commits", "push", json.dumps(push).encode()))
+    issue = {"number": 4, "title": "Login fails", "state": "open", "body": "Steps to reproduce... " * 30, "user": _user("student"),
+             "labels": [{"name": "bug", "color": "d73a4a"}], "comments": 2, "assignees": [_user("peer")]}
+    corpus.append(("issues", "issues", json.dumps({"action": "opened", "issue": issue, **base}).encode()))
+    pr = {"number": 2, "title": "Login", "body": "Closes #4 " * 30, "state": "closed", "created_at": "2025-03-03T08:00:00Z",
+          "closed_at": "2025-03-04T08:00:00Z", "merged": True, "merged_by": _user("teacher"), "assignee": None,
+          "requested_reviewers": [_user("peer")], "user": _user("student"),
+          "head": {"ref": "login", "sha": "a" * 40, "repo": _repository()}, "base": {"ref": "main", "sha": "b" * 40, "repo": _repository()}}
+    corpus.append(("pull_request", "pull_request", json.dumps({"action": "closed", "pull_request": pr, **base}).encode()))
+    return corpus
+
+
+def load_corpus(directory: str) -> List[Tuple[str, str, bytes]]:
+    corpus = []
+    events = sorted(EVENT_TREES, key=len, reverse=True)
+    for path in sorted(Path(directory).glob("*.json")):
+        event = next((e for e in events if path.name.startswith(e)), None)
+        if event is None:
+            print(f"skipped {path.name}: not named after push / issues / pull_request")
+            continue
+        corpus.append((path.name, event, path.read_bytes()))
+    return corpus
+
+
+def _peak_kib(fn) -> float:
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak / 1024
+
+
+def main(corpus: List[Tuple[str, str, bytes]], number: int) -> None:
+    print(f"selective decoding {'enabled' if decode_typed('push', b'{}') is not None else 'UNAVAILABLE (msgspec not installed)'}, "
+          f"json_codec uses {json_codec.CODEC}")
+    print(f"{'payload':<22}{'KiB':>8}{'json (us)':>12}{'codec (us)':>12}{'typed (us)':>12}"
+          f"{'json peak':>11}{'codec peak':>12}{'typed peak':>12}   (peaks in KiB)")
+    for name, event, body in corpus:
+        full = json.loads(body)
+        typed = decode_typed(event, body)
+        if typed is not None:
+            assert parse_github_event({**typed, "X-GitHub-Event": event}, "TeamA", enrich=False) == \
+                   parse_github_event({**full, "X-GitHub-Event": event}, "TeamA", enrich=False), f"{name}: documents differ"
+
+        decoders = [lambda: json.loads(body), lambda: json_codec.loads(body)]
+        if typed is not None:
+            decoders.append(lambda: decode_typed(event, body))
+        times = [min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6 for fn in decoders]
+        peaks = [_peak_kib(fn) for fn in decoders]
+        times += [float("nan")] * (3 - len(times))
+        peaks += [float("nan")] * (3 - len(peaks))
+        print(f"{name[:21]:<22}{len(body) / 1024:>8.1f}{times[0]:>12.1f}{times[1]:>12.1f}{times[2]:>12.1f}"
+              f"{peaks[0]:>11.1f}{peaks[1]:>12.1f}{peaks[2]:>12.1f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Decode time and peak memory of the GitHub payloads")
+    ap.add_argument("--corpus", help="Directory of payloads named <event>*.json, synthetic payloads if not given")
+    ap.add_argument("--number", type=int, default=200, help="Decodings per measure")
+    ns = ap.parse_args()
+    main(load_corpus(ns.corpus) if ns.corpus else synthetic_corpus(), ns.number)
@@ -0,0 +1,120 @@
+'''
+Throughput of the gunicorn profiles of gunicorn.conf.py (GUNICORN_PROFILE) on signed GitHub push deliveries.
+
+Each profile is started on a local port, loaded by --concurrency keep-alive clients for --duration seconds and stopped
+with SIGTERM (so the graceful drain is exercised too). The request path measured is the production one: signature
+check, spool and 202. Run it with MongoDB reachable (MONGO_* settings) if the deliveries must be processed as well.
+
+In order to execute this script: python -m benchmarks.bench_gunicorn_profiles --profiles gthread sync uvicorn
+'''
+
+import argparse
+import hashlib
+import hmac
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SECRET = "benchmark-secret"
+
+PUSH_PAYLOAD = {
+    "ref": "refs/heads/main", "organization": {"login": "TeamA"}, "repository": {"full_name": "TeamA/app"},
+    "sender": {"id": 1, "login": "student", "url": "https://api.github.com/users/student", "type": "User", "site_admin": False},
+    "commits": [{"id": f"{i:040x}", "url": "", "message": f"task #{i} Implement login", "timestamp": "2025-03-03T08:00:00+01:00",
+                 "author": {"username": "student", "name": "Student", "email": "student@example.com"}} for i in range(3)],
+}
+
+
+def _wait_port(port: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def _client(port: int, body: bytes, headers: dict, stop: float, latencies: list, statuses: Counter, lock: threading.Lock):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    local, codes = [], Counter()
+    while time.monotonic() < stop:
+        start = time.perf_counter()
+        try:
+            conn.request("POST", "/webhook/github?prj=TeamA", body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            codes[resp.status] += 1
+        except (OSError, http.client.HTTPException):
+            codes["error"] += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        local.append(time.perf_counter() - start)
+    conn.close()
+    with lock:
+        latencies.extend(local)
+        statuses.update(codes)
+
+
+def run_profile(profile: str, port: int, concurrency: int, duration: float, workers: str) -> dict:
+    env = dict(os.environ, GUNICORN_PROFILE=profile, GUNICORN_BIND=f"127.0.0.1:{port}", GITHUB_SIGNATURE_KEY=SECRET)
+    if workers:
+        env["GUNICORN_WORKERS"] = workers
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not _wait_port(port, 30):
+            return {"profile": profile, "error": "did not start"}
+        body = json.dumps(PUSH_PAYLOAD).encode()
+        headers = {"Content-Type": "application/json", "X-GitHub-Event": "push",
+                   "X-Hub-Signature-256": "sha256=" + hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()}
+        latencies, statuses, lock = [], Counter(), threading.Lock()
+        stop = time.monotonic() + duration
+        clients = [threading.Thread(target=_client, args=(port, body, headers, stop, latencies, statuses, lock))
+                   for _ in range(concurrency)]
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    latencies.sort()
+    pct = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000 if latencies else 0
+    return {"profile": profile, "rps": len(latencies) / duration, "p50": pct(0.5), "p99": pct(0.99),
+            "statuses": dict(statuses)}
+
+
+def main(profiles, concurrency: int, duration: float, port: int, workers: str) -> None:
+    print(f"{'profile':<10}{'req/s':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}  statuses")
+    for profile in profiles:
+        r = run_profile(profile, port, concurrency, duration, workers)
+        if "error" in r:
+            print(f"{profile:<10}  {r['error']}")
+            continue
+        print(f"{profile:<10}{r['rps']:>10.1f}{r['p50']:>10.1f}{r['p99']:>10.1f}  {r['statuses']}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Throughput of the gunicorn profiles on signed GitHub deliveries")
+    ap.add_argument("--profiles", nargs="+", default=["sync", "gthread", "gevent", "uvicorn"])
+    ap.add_argument("--concurrency", type=int, default=64, help="Concurrent keep-alive clients")
+    ap.add_argument("--duration", type=float, default=10, help="Seconds of load per profile")
+    ap.add_argument("--port", type=int, default=5099)
+    ap.add_argument("--workers", default="", help="GUNICORN_WORKERS for every profile, by default the CPU-aware one")
+    ns = ap.parse_args()
+    main(ns.profiles, ns.concurrency, ns.duration, ns.port, ns.workers)
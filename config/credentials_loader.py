@@ -1,24 +1,75 @@
-import json, os
-from typing import Optional
+import json, logging, os, threading, time
+from typing import Dict, Optional
 CONFIG_FILE = os.getenv("CREDENTIALS_FILE",
                         "config_files/credentials_config.json")
 
+# Minimum seconds between two mtime checks of the file, so hot lookups do not stat() it on every call
+RELOAD_CHECK_SECONDS = float(os.getenv("CREDENTIALS_RELOAD_CHECK_SECONDS", "2"))
+
+# Registry built from the file: (mtime, {prj -> course properties}). Replaced as a whole on reload.
+_REGISTRY = (None, {})
+_LAST_CHECK = 0.0
+_LOCK = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
 
 def load():
     with open(CONFIG_FILE, "r", encoding="utf-8") as fh:
         return json.load(fh)
 
 
+def _build_index(cfg: dict) -> Dict[str, dict]:
+    '''
+    Builds the prj -> course properties dictionary. Every team of a course shares the same properties dict.
+    '''
+    index = {}
+    for course, props in cfg.items():
+        creds = {k: v for k, v in props.items() if k != "teams"}
+        creds["course"] = course
+        for team in props.get("teams", []):
+            index[team] = creds
+    return index
+
+
+def _registry() -> Dict[str, dict]:
+    '''
+    Returns the prj index, reloading the file if its mtime changed since it was loaded.
+    The new index is built aside and swapped in one assignment, readers never see a half built registry.
+    '''
+    global _REGISTRY, _LAST_CHECK
+    now = time.monotonic()
+    if now - _LAST_CHECK < RELOAD_CHECK_SECONDS and _REGISTRY[0] is not None:
+        return _REGISTRY[1]
+    with _LOCK:
+        _LAST_CHECK = now
+        mtime = os.stat(CONFIG_FILE).st_mtime_ns
+        if mtime != _REGISTRY[0]:
+            try:
+                _REGISTRY = (mtime, _build_index(load()))
+            except ValueError as e:
+                # The file is being edited, keep serving the previous version until it is valid again
+                if _REGISTRY[0] is None:
+                    raise
+                logger.error(f"Invalid {CONFIG_FILE}, keeping the previous credentials: {e}")
+    return _REGISTRY[1]
+
+
+def lookup(prj: str) -> Dict[str, Optional[str]]:
+    """
+    Return all the credential fields (github_token, taiga_user, taiga_password, course…)
+    that correspond to <prj> in one call. Raise KeyError if not configured.
+    The returned dict is shared by every team of the course, do not modify it.
+    """
+    creds = _registry().get(prj)
+    if creds is None:
+        raise KeyError(f"Project {prj!r} not found in {CONFIG_FILE}")
+    return creds
+
+
 def resolve(prj: str, field: str) -> Optional[str]:
     """
     Return the credential <field> (github_token, taiga_user, …)
     that corresponds to <prj>. Raise KeyError if not configured.
     """
-    cfg = load()
-    for course, props in cfg.items():
-        if prj in props["teams"]:            
-
-            return props.get(field)
-    raise KeyError(f"Project {prj!r} not found in {CONFIG_FILE}")
-
-
+    return lookup(prj).get(field)
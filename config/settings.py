@@ -1,4 +1,5 @@
 import os
+from urllib.parse import quote_plus
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -17,14 +18,25 @@ MONGO_USER     = os.getenv("MONGO_USER", "")
 MONGO_PASS     = os.getenv("MONGO_PASS", "")
 MONGO_AUTHSRC  = os.getenv("MONGO_AUTHSRC", MONGO_DB)
 
-# if MONGO_USER and MONGO_PASS:
-#     MONGO_URI = (f"mongodb://{MONGO_USER}:{MONGO_PASS}"
-#                  f"@{MONGO_HOST}:{MONGO_PORT}/{MONGO_DB}"
-#                  f"?authSource={MONGO_AUTHSRC}")
-# else:
-#     MONGO_URI = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/{MONGO_DB}"
+# MONGO_URI overrides the URI built from the MONGO_* variables (e.g. for a replica set or mongodb+srv://)
+if os.getenv("MONGO_URI"):
+    MONGO_URI = os.getenv("MONGO_URI")
+elif MONGO_USER and MONGO_PASS:
+    MONGO_URI = (f"mongodb://{quote_plus(MONGO_USER)}:{quote_plus(MONGO_PASS)}"
+                 f"@{MONGO_HOST}:{MONGO_PORT}/{MONGO_DB}"
+                 f"?authSource={MONGO_AUTHSRC}")
+else:
+    MONGO_URI = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/{MONGO_DB}"
 
-MONGO_URI = "mongodb://localhost:27017"
+# Client of each worker process, created on its first use after the fork
+MONGO_MAX_POOL_SIZE               = int(os.getenv("MONGO_MAX_POOL_SIZE", "20"))          # Connections per worker process
+MONGO_MIN_POOL_SIZE               = int(os.getenv("MONGO_MIN_POOL_SIZE", "2"))           # Opened at worker boot and kept open
+MONGO_COMPRESSORS                 = os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib")   # By preference, the ones not installed are skipped
+MONGO_WRITE_CONCERN               = os.getenv("MONGO_WRITE_CONCERN", "1")                # w: a number of nodes or "majority"
+MONGO_WTIMEOUT_MS                 = int(os.getenv("MONGO_WTIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS          = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS           = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
 
 # Load the GitHub token from the environment
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")
@@ -40,4 +52,105 @@ TAIGA_PASSWORD= os.getenv("TAIGA_PASSWORD", "")
 
 # Load the webhook URLs from the environment to enable the deletion of webhooks
 WEBHOOK_URL_GITHUB = os.getenv("WEBHOOK_URL_GITHUB", "")
-WEBHOOK_URL_TAIGA = os.getenv("WEBHOOK_URL_TAIGA", "")
\ No newline at end of file
+WEBHOOK_URL_TAIGA = os.getenv("WEBHOOK_URL_TAIGA", "")
+
+
+# Ingestion queue settings. The webhooks are acknowledged right after the signature check and the heavy work
+# (parsing, API calls, Mongo writes, LD Eval notification) is done by a pool of background workers.
+INGEST_QUEUE_SIZE      = int(os.getenv("INGEST_QUEUE_SIZE", "1000"))    # Max number of deliveries waiting to be processed
+INGEST_WORKERS         = int(os.getenv("INGEST_WORKERS", "4"))          # Number of worker threads per process
+INGEST_OVERFLOW_POLICY = os.getenv("INGEST_OVERFLOW_POLICY", "reject").lower()  # reject | block | inline
+INGEST_BLOCK_TIMEOUT   = float(os.getenv("INGEST_BLOCK_TIMEOUT", "2"))  # Seconds to wait for a free slot with the 'block' policy
+
+
+# Durable spool of verified webhook bodies. Every delivery is appended to a memory-mapped segment file before it is
+# queued, and replayed on restart if it was not processed. Leave SPOOL_DIR empty to disable it.
+SPOOL_DIR               = os.getenv("SPOOL_DIR", "")
+SPOOL_SEGMENT_MB        = int(os.getenv("SPOOL_SEGMENT_MB", "64"))        # Size of each segment file before rotating
+SPOOL_FSYNC_INTERVAL_MS = int(os.getenv("SPOOL_FSYNC_INTERVAL_MS", "50")) # Max time a record stays in memory before being synced to disk
+SPOOL_FSYNC_BATCH       = int(os.getenv("SPOOL_FSYNC_BATCH", "256"))      # Sync earlier if this many records are waiting
+
+
+# Suppression of GitHub redeliveries, keyed on X-GitHub-Delivery. Processed deliveries are remembered in memory and in
+# the github_deliveries collection (TTL index), a delivery claimed by a worker is in progress until it finishes or its
+# lease runs out (then a redelivery takes it over). Set DELIVERY_DEDUP_TTL to 0 to disable it.
+DELIVERY_DEDUP_TTL    = int(os.getenv("DELIVERY_DEDUP_TTL", str(3 * 24 * 3600)))  # GitHub lets a delivery be redelivered for 3 days
+DELIVERY_DEDUP_LEASE  = int(os.getenv("DELIVERY_DEDUP_LEASE", "600"))            # Seconds a delivery stays in progress
+DELIVERY_DEDUP_MEMORY = int(os.getenv("DELIVERY_DEDUP_MEMORY", "20000"))         # Delivery IDs kept in memory per process
+
+
+# Commit stats enrichment of push events. The stats of the commits of one push are fetched concurrently, commits
+# whose stats are not back before the deadline are stored with "stats_pending": True.
+GITHUB_STATS_WORKERS  = int(os.getenv("GITHUB_STATS_WORKERS", "8"))       # Concurrent stats requests per process
+GITHUB_STATS_DEADLINE = float(os.getenv("GITHUB_STATS_DEADLINE", "8"))    # Seconds to wait for the stats of one push
+COMMIT_STATS_LRU_SIZE = int(os.getenv("COMMIT_STATS_LRU_SIZE", "20000"))  # Commit stats kept in memory, backed by the commit_stats_cache collection
+
+
+# Enrichment of the stored events (commit stats, milestone stats).
+#   inline:   the webhook workers call the GitHub / Taiga APIs before storing the event (commits that miss the stats
+#             deadline are still completed in the background)
+#   deferred: the events are stored only with the webhook payload and a background enricher fills the stats in batches,
+#             LD Eval is notified when the enrichment of the delivery is completed
+ENRICHMENT_MODE          = os.getenv("ENRICHMENT_MODE", "inline").lower()
+ENRICHMENT_WORKERS       = int(os.getenv("ENRICHMENT_WORKERS", "1"))          # Enricher threads per process, 0 to disable them
+ENRICHMENT_BATCH_SIZE    = int(os.getenv("ENRICHMENT_BATCH_SIZE", "100"))     # Pending enrichments claimed at once
+ENRICHMENT_LEASE_SECONDS = int(os.getenv("ENRICHMENT_LEASE_SECONDS", "120"))  # Time a claimed batch is reserved for one worker
+ENRICHMENT_POLL_SECONDS  = float(os.getenv("ENRICHMENT_POLL_SECONDS", "2"))   # Wait between polls when there is nothing to do
+ENRICHMENT_MAX_ATTEMPTS  = int(os.getenv("ENRICHMENT_MAX_ATTEMPTS", "10"))    # After this many failed attempts the enrichment is dropped
+
+
+# Outbound HTTP client. One keep-alive session per upstream, idempotent GETs are retried with jittered backoff.
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT    = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_RETRIES         = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF         = float(os.getenv("HTTP_BACKOFF", "0.5"))      # Base of the exponential backoff between retries (seconds)
+HTTP_POOL_GITHUB     = int(os.getenv("HTTP_POOL_GITHUB", str(max(GITHUB_STATS_WORKERS, 8))))
+HTTP_POOL_TAIGA      = int(os.getenv("HTTP_POOL_TAIGA", "8"))
+HTTP_POOL_EVAL       = int(os.getenv("HTTP_POOL_EVAL", "4"))
+
+
+# Coalescing of LD Eval notifications. Events with the same (prj, quality_model, event_type) are merged into a single
+# notification, sent when no new event arrived during the quiet window or when the oldest one waited the max delay.
+EVAL_COALESCE_WINDOW    = float(os.getenv("EVAL_COALESCE_WINDOW", "5"))     # Quiet window in seconds, 0 disables coalescing
+EVAL_COALESCE_MAX_DELAY = float(os.getenv("EVAL_COALESCE_MAX_DELAY", "30")) # Max seconds an event waits before being notified
+
+
+# Transactional outbox of LD Eval notifications. Notifications are stored in Mongo right after the event documents and
+# delivered by a single dispatcher (leased across processes), in order per project, with exponential backoff.
+EVAL_OUTBOX_ENABLED      = os.getenv("EVAL_OUTBOX_ENABLED", "true").lower() in ("1", "true", "yes")
+EVAL_OUTBOX_BATCH        = int(os.getenv("EVAL_OUTBOX_BATCH", "500"))         # Rows read per dispatcher round
+EVAL_OUTBOX_POLL_SECONDS = float(os.getenv("EVAL_OUTBOX_POLL_SECONDS", "1"))
+EVAL_OUTBOX_BACKOFF_BASE = float(os.getenv("EVAL_OUTBOX_BACKOFF_BASE", "2"))  # First retry delay, doubled on each failure
+EVAL_OUTBOX_BACKOFF_MAX  = float(os.getenv("EVAL_OUTBOX_BACKOFF_MAX", "300"))
+EVAL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EVAL_OUTBOX_MAX_ATTEMPTS", "12"))   # Failed deliveries before a notification is dead-lettered, 0 retries forever
+
+
+# In-process cache of Taiga milestone stats (LRU + TTL, concurrent misses share one API call)
+MILESTONE_CACHE_SIZE  = int(os.getenv("MILESTONE_CACHE_SIZE", "1000"))      # Milestones kept per process
+MILESTONE_CACHE_TTL   = float(os.getenv("MILESTONE_CACHE_TTL", "60"))       # Seconds a value is fresh
+MILESTONE_CACHE_STALE = float(os.getenv("MILESTONE_CACHE_STALE", "300"))    # Seconds past the TTL it is still answered while refreshed, 0 disables it
+
+
+# Where the milestone_* stats of tasks and user stories come from: "local" counters kept by the Taiga upserts in
+# taiga_{prj}.milestones, or "api" to call the Taiga stats endpoint on every webhook
+MILESTONE_STATS_SOURCE      = os.getenv("MILESTONE_STATS_SOURCE", "local").lower()
+MILESTONE_RECONCILE_SECONDS = int(os.getenv("MILESTONE_RECONCILE_SECONDS", "3600"))  # Reconciliation against the Taiga API, 0 disables it
+
+
+# SQLite database (WAL) shared by the worker processes of the host for Taiga tokens and milestone stats. Empty disables it.
+# It holds API tokens: by default it lives in a private (0700) directory of the user running the workers
+_CACHE_HOME                 = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+SHARED_CACHE_PATH           = os.getenv("SHARED_CACHE_PATH", os.path.join(_CACHE_HOME, "ldconnect", "shared_cache.db"))
+TAIGA_TOKEN_TTL             = int(os.getenv("TAIGA_TOKEN_TTL", str(23 * 3600)))      # Taiga tokens expire 24h after the login
+TAIGA_TOKEN_REFRESH_SECONDS = int(os.getenv("TAIGA_TOKEN_REFRESH_SECONDS", "3600"))  # Log in again this long before the token expires
+
+
+# Taiga sends no delivery ID: identical bodies for the same prj received within the window are dropped as duplicates.
+# The window is shared by the workers of the host through the shared cache (per process if SHARED_CACHE_PATH is empty)
+TAIGA_DEDUP_WINDOW = float(os.getenv("TAIGA_DEDUP_WINDOW", "30"))     # Seconds, 0 disables it
+TAIGA_DEDUP_MEMORY = int(os.getenv("TAIGA_DEDUP_MEMORY", "10000"))    # Bodies remembered per process without the shared cache
+
+
+# ASGI app (asgi_app.py): deliveries processed concurrently per process, beyond that they are answered with a 503
+ASGI_MAX_INFLIGHT  = int(os.getenv("ASGI_MAX_INFLIGHT", "500"))
+ASGI_DRAIN_SECONDS = float(os.getenv("ASGI_DRAIN_SECONDS", "30"))   # Wait for the deliveries in flight on shutdown
@@ -0,0 +1,119 @@
+'''
+Indexes of the per-team collections, which MongoDB creates implicitly on the first insert with only the _id index.
+
+Commits and Taiga documents get a unique index on the natural key the processors upsert / delete on (sha, task_id…),
+pull requests an index on (repo_name, pr_number), and every team collection one on the fields LD Eval filters by (prj
+and the event date). get_collection() provisions them the first time a
+collection is used in a process. A unique index that can not be built because the collection already holds duplicates
+is created non-unique instead, so the lookups are still indexed, and the duplicates are logged.
+'''
+
+import argparse
+import logging
+import re
+import threading
+from typing import List, NamedTuple, Tuple
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class Index(NamedTuple):
+    keys: Tuple[str, ...]
+    unique: bool = False
+
+
+def _natural_key(field: str) -> Index:
+    return Index((field,), unique=True)
+
+
+# Collection name pattern -> indexes. GitHub pull requests and issues are stored once per event, so their keys repeat
+INDEXES = {
+    r"^github_.+\.commits$":        [_natural_key("sha"), Index(("prj", "date"))],
+    r"^github_.+\.pull_requests$":  [Index(("repo_name", "pr_number")), Index(("prj", "closed_at"))],
+    r"^.+_issues$":                 [Index(("repo_name", "issue.number")), Index(("prj",))],
+    r"^taiga_.+\.tasks$":           [_natural_key("task_id"), Index(("prj", "created_date"))],
+    r"^taiga_.+\.userstories$":     [_natural_key("userstory_id"), Index(("prj", "created_date"))],
+    r"^taiga_.+\.issues$":          [_natural_key("issue_id"), Index(("prj", "created_date"))],
+    r"^taiga_.+\.epics$":           [_natural_key("epic_id"), Index(("prj", "created_date"))],
+}
+
+_PROVISIONED = set()
+_LOCK = threading.Lock()
+
+
+def indexes_of(name: str) -> List[Index]:
+    for pattern, indexes in INDEXES.items():
+        if re.match(pattern, name):
+            return indexes
+    return []
+
+
+def _create(coll, index: Index) -> str:
+    keys = [(field, ASCENDING) for field in index.keys]
+    if not index.unique:
+        return coll.create_index(keys)
+    field = index.keys[0]
+    try:
+        # Partial, so documents stored without the key do not collide on a missing value
+        return coll.create_index(keys, unique=True, partialFilterExpression={field: {"$exists": True}})
+    except OperationFailure as e:
+        if e.code != DUPLICATE_KEY:
+            raise
+        logger.warning(f"{coll.name} has duplicated {field} values, indexing {field} without the unique constraint: "
+                       f"{e.details.get('errmsg') if e.details else e}")
+        return coll.create_index(keys, name=f"{field}_nonunique")
+
+
+def ensure_indexes(coll) -> List[str]:
+    '''
+    Creates the indexes of a team collection if they do not exist (create_index is a no-op then).
+    Returns the names of the indexes of the collection's kind, empty for the other collections.
+    '''
+    return [_create(coll, index) for index in indexes_of(coll.name)]
+
+
+def provisioned(name: str) -> bool:
+    return name in _PROVISIONED
+
+
+def ensure_once(coll) -> None:
+    '''
+    ensure_indexes() on the first use of a collection in this process. The caller's write goes on if it fails: a
+    rejected index (e.g. an existing one with other options) is logged once, a network error is retried on the next use.
+    '''
+    if coll.name in _PROVISIONED:
+        return
+    with _LOCK:
+        if coll.name in _PROVISIONED:
+            return
+        try:
+            ensure_indexes(coll)
+        except OperationFailure as e:
+            logger.warning(f"Indexes of {coll.name} rejected, not retrying in this process: {e}")
+        except PyMongoError as e:
+            logger.warning(f"Could not create the indexes of {coll.name}: {e}")
+            return
+        _PROVISIONED.add(coll.name)
+
+
+if __name__ == "__main__":
+    from config.logger_config import setup_logging
+    from database.mongo_client import db
+
+    setup_logging()
+    ap = argparse.ArgumentParser(description="Creates the natural-key and query indexes of the existing team collections")
+    ap.add_argument("--prj", help="Only the collections of this team, by default every team")
+    ns = ap.parse_args()
+    for name in sorted(db.list_collection_names()):
+        if ns.prj and not (name.startswith((f"github_{ns.prj}.", f"taiga_{ns.prj}.")) or name == f"{ns.prj}_issues"):
+            continue
+        created = ensure_indexes(db[name])
+        if created:
+            logger.info(f"{name}: {', '.join(created)}")
+
+# In order to execute this script: python -m database.indexes --prj TeamA
@@ -1,14 +1,131 @@
-from pymongo import MongoClient
-from config.settings import MONGO_URI, MONGO_DB
+import importlib.util
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import PyMongoError
+from config.settings import (MONGO_URI, MONGO_DB, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_COMPRESSORS,
+                             MONGO_WRITE_CONCERN, MONGO_WTIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+                             MONGO_SERVER_SELECTION_TIMEOUT_MS)
+from database.indexes import ensure_once
 
-# Create the global MongoClient instance.
-client = MongoClient(MONGO_URI)
-db = client[MONGO_DB]
+logger = logging.getLogger(__name__)
+
+# Module each wire compressor needs, zlib is always available
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+# The MongoClient of this process. PyMongo clients are not fork-safe, so each gunicorn worker creates its own on its
+# first use instead of inheriting one created at import time in the master.
+_CLIENT = None
+_PID = None
+_LOCK = threading.Lock()
+
+
+def _compressors() -> List[str]:
+    names = [c.strip() for c in MONGO_COMPRESSORS.split(",") if c.strip()]
+    available = [c for c in names if c in _COMPRESSOR_MODULES and importlib.util.find_spec(_COMPRESSOR_MODULES[c])]
+    if len(available) < len(names):
+        logger.info(f"Mongo wire compressors not installed, skipped: {sorted(set(names) - set(available))}")
+    return available
+
+
+def _write_concern():
+    return int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+
+
+def client_options() -> Dict:
+    """
+    Pool, compression, write concern and timeout options of the clients, shared with the motor client.
+    """
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": min(MONGO_MIN_POOL_SIZE, MONGO_MAX_POOL_SIZE),
+        "w": _write_concern(),
+        "wTimeoutMS": MONGO_WTIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "appname": "ldconnect",
+    }
+    compressors = _compressors()
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+def get_client() -> MongoClient:
+    """
+    Returns the MongoClient of the current process, creating it on the first call after a fork.
+    """
+    global _CLIENT, _PID
+    if _CLIENT is None or _PID != os.getpid():
+        with _LOCK:
+            if _CLIENT is None or _PID != os.getpid():
+                _CLIENT = MongoClient(MONGO_URI, **client_options())
+                _PID = os.getpid()
+    return _CLIENT
+
+
+def get_db():
+    return get_client()[MONGO_DB]
+
+
+class _LazyDatabase:
+    """
+    Stand-in for the Database of the process, resolved on every access so the module-level `db` can be imported
+    before the fork.
+    """
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+
+db = _LazyDatabase()
+
+
+def prewarm(connections: int = MONGO_MIN_POOL_SIZE) -> bool:
+    """
+    Opens connections of the pool of this process in parallel (handshake, authentication) so the first webhooks
+    of a fresh worker do not pay for them. Returns False if MongoDB could not be reached, the worker starts anyway.
+    Disabled with MONGO_MIN_POOL_SIZE=0.
+    """
+    connections = min(connections, MONGO_MAX_POOL_SIZE)
+    if connections <= 0:
+        return True
+    client = get_client()
+    try:
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="mongo-prewarm") as pool:
+            list(pool.map(lambda _: client.admin.command("ping"), range(connections)))
+    except PyMongoError as e:
+        logger.warning(f"Could not pre-warm the MongoDB pool: {e}")
+        return False
+    logger.info(f"MongoDB pool of process {os.getpid()} pre-warmed with {connections} connections.")
+    return True
 
 
 def get_collection(collection_name: str):
     """
     Returns a reference to a collection by name.
     E.g. get_collection("TeamA_commits") -> the 'TeamA_commits' collection
+    The indexes of the team collections are created the first time each one is used in the process.
     """
-    return db[collection_name]
+    coll = get_db()[collection_name]
+    ensure_once(coll)
+    return coll
+
+
+def insert_missing(coll, docs: list[dict], key: str) -> Tuple[int, int]:
+    '''
+    Inserts the documents whose <key> is not stored yet, in a single unordered bulk_write.
+    Documents already present are left untouched ($setOnInsert), so a redelivered event is a no-op write.
+    Returns (inserted, already_present).
+    '''
+    if not docs:
+        return 0, 0
+    operations = [UpdateOne({key: d[key]}, {"$setOnInsert": d}, upsert=True) for d in docs]
+    res = coll.bulk_write(operations, ordered=False)
+    return res.upserted_count, res.matched_count
@@ -0,0 +1,48 @@
+'''
+Async MongoDB client of the ASGI app (asgi_app.py), with the same URI and pool / compression / write concern options
+as the PyMongo client of database/mongo_client.py.
+'''
+
+import os
+import threading
+
+import anyio
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config.settings import MONGO_URI, MONGO_DB
+from database import indexes
+from database.mongo_client import client_options, get_collection
+
+_CLIENT = None
+_PID = None
+_LOCK = threading.Lock()
+
+
+def get_async_client() -> AsyncIOMotorClient:
+    '''
+    Returns the motor client of the current process, created on its first use (inside the event loop of the worker).
+    '''
+    global _CLIENT, _PID
+    if _CLIENT is None or _PID != os.getpid():
+        with _LOCK:
+            if _CLIENT is None or _PID != os.getpid():
+                _CLIENT = AsyncIOMotorClient(MONGO_URI, **client_options())
+                _PID = os.getpid()
+    return _CLIENT
+
+
+async def get_async_collection(collection_name: str):
+    '''
+    Async counterpart of get_collection(). The indexes are provisioned by the sync client, off the event loop, the
+    first time each collection is used in the process.
+    '''
+    if not indexes.provisioned(collection_name):
+        await anyio.to_thread.run_sync(get_collection, collection_name)
+    return get_async_client()[MONGO_DB][collection_name]
+
+
+def close() -> None:
+    global _CLIENT
+    if _CLIENT is not None and _PID == os.getpid():
+        _CLIENT.close()
+        _CLIENT = None
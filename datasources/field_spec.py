@@ -0,0 +1,133 @@
+'''
+Declarative extraction of the documents we store from the Taiga and GitHub payloads.
+
+A spec is a list of Field: the target field of the document (dotted for nested documents), the dotted path of the
+value in each origin ("webhook" payloads, "api" objects of the recovery scripts), the default when the path is missing
+and an optional transform. compile_spec() turns a spec, once at import, into a plain Python function that reads every
+intermediate object of the payload a single time and builds the document in one dict literal, instead of walking
+raw_payload.get("data", {}).get(...) again for every field. The webhook parsers and the recovery converters share
+the same specs, so both produce the same documents.
+'''
+
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+
+class Const(NamedTuple):
+    '''
+    Fixed value of a field for an origin, e.g. action_type "import" in the recovery scripts.
+    '''
+    value: object
+
+
+class Field(NamedTuple):
+    target: str                             # Field of the document, "user.login" builds {"user": {"login": ...}}
+    webhook: object = None                  # Dotted path in the webhook payload, a Const, or None if it is not extracted
+    api: object = None                      # Same, in the objects returned by the REST API
+    default: object = None                  # Value when the path is missing (an intermediate null counts as missing)
+    transform: Optional[Callable] = None    # Applied to the value found (or to the default)
+
+
+def _source(field: Field, origin: str):
+    return getattr(field, origin)
+
+
+def _walk(src: Dict, path: str, default):
+    '''
+    Reference, uncompiled lookup of a path. Same semantics as the compiled extractors.
+    '''
+    node = src
+    *parents, leaf = path.split(".")
+    for part in parents:
+        node = node.get(part) or {}
+    if leaf in node:
+        return node[leaf]
+    return default.copy() if isinstance(default, (dict, list)) else default
+
+
+def interpret_spec(fields: List[Field], origin: str) -> Callable[[Dict], Dict]:
+    '''
+    Extractor that walks the payload from the root for every field. Used to check and benchmark compile_spec().
+    '''
+    def extract(src: Dict) -> Dict:
+        doc = {}
+        for field in fields:
+            source = _source(field, origin)
+            if source is None:
+                continue
+            if isinstance(source, Const):
+                value = source.value.copy() if isinstance(source.value, (dict, list)) else source.value
+            else:
+                value = _walk(src, source, field.default)
+                if field.transform is not None:
+                    value = field.transform(value)
+            *parents, leaf = field.target.split(".")
+            node = doc
+            for part in parents:
+                node = node.setdefault(part, {})
+            node[leaf] = value
+        return doc
+    return extract
+
+
+def compile_spec(fields: List[Field], origin: str, name: str = "extract", defer: tuple = ()) -> Callable[[Dict], Dict]:
+    '''
+    Generates the extractor of a spec for an origin ("webhook" or "api").
+    The transforms listed in defer are not applied, the fields they apply to are listed in extractor.deferred so
+    the caller can apply them to a whole batch of documents at once.
+    '''
+    namespace = {}
+    deferred = []
+    nodes = {}          # dotted path of an intermediate object -> local variable holding it
+    lines = []
+
+    def node_of(parents: List[str]) -> str:
+        if not parents:
+            return "src"
+        path = ".".join(parents)
+        if path not in nodes:
+            parent = node_of(parents[:-1])
+            nodes[path] = f"n{len(nodes)}"
+            lines.append(f"    {nodes[path]} = {parent}.get({parents[-1]!r}) or EMPTY")
+        return nodes[path]
+
+    def constant(prefix: str, idx: int, value) -> str:
+        ref = f"{prefix}{idx}"
+        namespace[ref] = value
+        return f"{ref}.copy()" if isinstance(value, (dict, list)) else ref
+
+    tree = {}           # nested targets -> expression
+    for idx, field in enumerate(fields):
+        source = _source(field, origin)
+        if source is None:
+            continue
+        if isinstance(source, Const):
+            expr = constant("c", idx, source.value)
+        else:
+            *parents, leaf = source.split(".")
+            node = node_of(parents)
+            if isinstance(field.default, (dict, list)):
+                expr = f"({node}[{leaf!r}] if {leaf!r} in {node} else {constant('d', idx, field.default)})"
+            else:
+                expr = f"{node}.get({leaf!r}, {constant('d', idx, field.default)})"
+            if field.transform in defer:
+                deferred.append(field.target)
+            elif field.transform is not None:
+                namespace[f"t{idx}"] = field.transform
+                expr = f"t{idx}({expr})"
+        *parents, leaf = field.target.split(".")
+        branch = tree
+        for part in parents:
+            branch = branch.setdefault(part, {})
+        branch[leaf] = expr
+
+    def literal(branch: Dict) -> str:
+        return "{" + ", ".join(f"{key!r}: {literal(value) if isinstance(value, dict) else value}"
+                               for key, value in branch.items()) + "}"
+
+    code = "\n".join([f"def {name}(src):", *lines, f"    return {literal(tree)}"])
+    namespace["EMPTY"] = {}
+    exec(compile(code, f"<field_spec {name}>", "exec"), namespace)
+    extractor = namespace[name]
+    extractor.source = code     # Kept for debugging
+    extractor.deferred = deferred
+    return extractor
@@ -0,0 +1,107 @@
+'''
+Selective decoding of the GitHub webhook payloads.
+
+A push delivery carries the full repository, organization, pusher and head_commit objects, but the parsers only read
+the paths declared in the field specs of github_handler. With msgspec installed, a Struct type is generated from those
+specs for each event (push, issues, pull_request) that declares only those paths: msgspec skips everything else while
+decoding, without building dicts for it. The result is the same dict the parsers get from the full decoding, pruned to
+the fields they read. Without msgspec, for other events or if a payload does not fit the declared shape (e.g. an
+object where a list is expected), the body is decoded whole by json_codec as before.
+
+In order to measure it: python -m benchmarks.bench_github_decoding --corpus <dir of payloads>
+'''
+
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+from datasources.field_spec import Const
+from datasources.github_handler import PUSH_SPEC, COMMIT_SPEC, ISSUE_SPEC, PULL_REQUEST_SPEC
+from utils import json_codec
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+logger = logging.getLogger(__name__)
+
+
+class ListOf:
+    '''
+    Marks a path whose value is an array of objects, each one decoded with the paths of item.
+    '''
+    def __init__(self, item: Dict):
+        self.item = item
+
+
+def paths_of(spec) -> List[str]:
+    return [f.webhook for f in spec if f.webhook is not None and not isinstance(f.webhook, Const)]
+
+
+def tree_of(paths: List[str]) -> Dict:
+    '''
+    ["a.b", "a.c", "d"] -> {"a": {"b": None, "c": None}, "d": None}, None being a leaf decoded whole.
+    '''
+    tree = {}
+    for path in paths:
+        *parents, leaf = path.split(".")
+        node = tree
+        for part in parents:
+            if part in node and node[part] is None:
+                break       # An ancestor is already decoded whole
+            node = node.setdefault(part, {})
+        else:
+            node[leaf] = None
+    return tree
+
+
+# Paths read by the parsers of each event, as a tree
+EVENT_TREES = {
+    "push":         {**tree_of(paths_of(PUSH_SPEC)), "commits": ListOf(tree_of(paths_of(COMMIT_SPEC)))},
+    "issues":       tree_of(paths_of(ISSUE_SPEC)),
+    "pull_request": tree_of(paths_of(PULL_REQUEST_SPEC)),
+}
+
+
+def _struct(name: str, tree: Dict):
+    '''
+    Struct type with one optional field per key of tree. Missing keys stay UNSET and are dropped by to_builtins(),
+    so the parsers see them as missing, like in the full decoding.
+    '''
+    fields = []
+    for idx, (key, sub) in enumerate(tree.items()):
+        if sub is None:
+            typ = Any
+        elif isinstance(sub, ListOf):
+            typ = Union[List[_struct(f"{name}_{idx}", sub.item)], None, msgspec.UnsetType]
+        else:
+            typ = Union[_struct(f"{name}_{idx}", sub), None, msgspec.UnsetType]
+        fields.append((key, typ, msgspec.UNSET))
+    return msgspec.defstruct(name, fields)
+
+
+_DECODERS = {}
+if msgspec is not None:
+    _DECODERS = {event: msgspec.json.Decoder(_struct(f"GitHub_{event}", tree)) for event, tree in EVENT_TREES.items()}
+
+
+def decode_typed(event: str, data) -> Optional[Dict]:
+    '''
+    Pruned payload of a delivery, None if it can not be decoded selectively (then use the full decoding).
+    '''
+    decoder = _DECODERS.get(event)
+    if decoder is None:
+        return None
+    try:
+        return msgspec.to_builtins(decoder.decode(data))
+    except (msgspec.ValidationError, msgspec.DecodeError) as e:
+        logger.debug(f"Selective decoding of a {event} payload failed, decoding it whole: {e}")
+        return None
+
+
+def decode_github_payload(event: str, data) -> Optional[Dict]:
+    '''
+    Payload of a GitHub delivery: selectively decoded when possible, else decoded whole. None if it is not valid JSON.
+    '''
+    payload = decode_typed(event, data)
+    return payload if payload else json_codec.loads_or_none(data)     # {} only if none of the paths is there
@@ -1,33 +1,31 @@
 from typing import Dict
 import re
 from config.settings import GITHUB_TOKEN
-from datetime import datetime
-from zoneinfo import ZoneInfo
-from datasources.requests.github_api_call import fetch_commit_stats
+from datasources.requests.github_api_call import fetch_push_stats
+from datasources.field_spec import Const, Field, compile_spec
+from datasources.timestamps import to_madrid_local, datetime_fields
 
 from config.credentials_loader import resolve
-def to_madrid_local(ts: str) -> str:
-    """
-    Receive date in ISO-8601 ethen transforms it on to Europe/Madrid date.
-    """
-    if not ts:                           # '', None…
-        return ts
-    # The date stabdart only accepts  '+00:00', but taiga returns in 'Z' format
-    dt_utc = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-    # put date to Europe/Madrid timezone
-    dt_mad_naive = dt_utc.astimezone(ZoneInfo("Europe/Madrid")).replace(tzinfo=None)
-    # format
-    return dt_mad_naive.isoformat(timespec="milliseconds")
-
-def parse_github_event(raw_payload: Dict, prj: str) -> Dict:
+
+# Events LD Connect stores, and the actions stored for each one (None: all of them). The routes reject the rest from
+# the X-GitHub-Event header alone, before decoding the body
+EVENT_ROUTES = {
+    "push":         None,
+    "issues":       None,
+    "pull_request": {"closed"},     # we only want to process closed pull requests
+}
+
+
+def parse_github_event(raw_payload: Dict, prj: str, enrich: bool = True) -> Dict:
     """
     Parse a GitHub event payload into a more detailed structure.
     The webhook has a header "X-GitHub-Event" that tells you the type of event.
     We can handle "push" and "issues" events.
+    If enrich is False, the commit stats are not fetched and the commits are marked as pending.
     """
     event_type = raw_payload.get("X-GitHub-Event")
     if event_type == "push":
-        return parse_github_push_event(raw_payload, prj)
+        return parse_github_push_event(raw_payload, prj, enrich)
     elif event_type == "issues":
         return parse_github_issue_event(raw_payload, prj)
     elif event_type == "pull_request":
@@ -37,94 +35,116 @@ def parse_github_event(raw_payload: Dict, prj: str) -> Dict:
 
 
 
-def parse_github_push_event(raw_payload: Dict, prj: str) -> Dict:
+# Document fields of each GitHub event: (target, path in the webhook payload, -, default, transform), compiled once at import.
+# The 'sender' object is at the top level, sender is the user who performed the action
+_SENDER_FIELDS = [
+    Field("sender_info.id",         "sender.id",         None, ""),
+    Field("sender_info.login",      "sender.login",      None, ""),
+    Field("sender_info.url",        "sender.url",        None, ""),
+    Field("sender_info.type",       "sender.type",       None, ""),
+    Field("sender_info.site_admin", "sender.site_admin", None, False),
+]
+
+_REPO_FIELDS = [
+    Field("repo_name",  "repository.full_name", None, "unknown-repo"),
+    Field("team_name",  "organization.login",   None, "UnknownTeam"),
+]
+
+PUSH_SPEC = [
+    # The event type is "push" but we will call it "commit" in our system
+    Field("event", Const("commit")),
+    *_REPO_FIELDS,
+    *_SENDER_FIELDS,
+]
+
+COMMIT_SPEC = [
+    Field("sha",        "id",               None, None),
+    Field("url",        "url",              None, ""),
+    Field("user.login", "author.username",  None, ""),
+    Field("user.name",  "author.name",      None, ""),
+    Field("user.email", "author.email",     None, ""),
+    #get timestamp of comit in the hour in spain
+    Field("date",       "timestamp",        None, None, to_madrid_local),
+    Field("message",    "message",          None, ""),
+]
+COMMIT_SPEC += datetime_fields(COMMIT_SPEC)
+
+ISSUE_SPEC = [
+    Field("event",      Const("issue")),
+    Field("action",     "action",           None, "unknown-action"),   # e.g. "issue_opened"
+    *_REPO_FIELDS,
+    *_SENDER_FIELDS,
+    # The "issue" object is typically raw_payload["issue"]
+    Field("issue.number",     "issue.number",     None, 0),
+    Field("issue.title",      "issue.title",      None, ""),
+    Field("issue.state",      "issue.state",      None, ""),
+    Field("issue.body",       "issue.body",       None, ""),
+    Field("issue.user.login", "issue.user.login", None, ""),
+    Field("issue.user.id",    "issue.user.id",    None, ""),
+]
+
+PULL_REQUEST_SPEC = [
+    Field("event",      Const("pull_request")),
+    Field("action",     "action",                       None, None),    # always "closed"
+    Field("pr_number",  "pull_request.number",          None, 0),
+    Field("title",      "pull_request.title",           None, ""),
+    Field("created_at", "pull_request.created_at",      None, "", to_madrid_local),
+    Field("closed_at",  "pull_request.closed_at",       None, "", to_madrid_local),
+    Field("merged_at",  "pull_request.merged",          None, False),
+    Field("merged_by",  "pull_request.merged_by.login", None, ""),
+    Field("assignee",   "pull_request.assignee.login",  None, None),
+    Field("reviewers",  "pull_request.requested_reviewers", None, [], lambda reviewers: [r["login"] for r in reviewers]),
+    *_REPO_FIELDS,
+    *_SENDER_FIELDS,
+]
+PULL_REQUEST_SPEC += datetime_fields(PULL_REQUEST_SPEC)
+
+extract_push = compile_spec(PUSH_SPEC, "webhook", "extract_push")
+extract_commit = compile_spec(COMMIT_SPEC, "webhook", "extract_commit")
+extract_issue = compile_spec(ISSUE_SPEC, "webhook", "extract_issue")
+extract_pull_request = compile_spec(PULL_REQUEST_SPEC, "webhook", "extract_pull_request")
+
+# Check if the commit message contains a task reference, it can be in english or catalan, ¿spanish¿ (e.g., "task #123")
+_TASK_PATTERN = re.compile(r'(?i)\b(?:task|tasca)\b(?:\s*#?\s*(\d+))?')
+
+
+def parse_github_push_event(raw_payload: Dict, prj: str, enrich: bool = True) -> Dict:
     '''
     Function to parse a GitHub push event payload.
     '''
-    event_type = "commit" # The event type is "push" but we will call it "commit" in our system
-
-    # Retrieve the team name and repo name from the payload
-    team_name = raw_payload.get("organization", {}).get("login", "UnknownTeam")
-    repo_name = raw_payload["repository"].get("full_name", "unknown-repo")
-
-    # The 'sender' object is at the top level
-    sender = raw_payload.get("sender", {})
-    sender_info = {
-        "id": sender.get("id", ""),
-        "login": sender.get("login", ""),
-        "url": sender.get("url", ""),
-        "type": sender.get("type", ""),
-        "site_admin": sender.get("site_admin", False)
-    }
-    
+    push = extract_push(raw_payload)
+    repo_name = push["repo_name"]
+
     commits_info = []
     # The push event typically has a "commits" array
     for c in raw_payload.get("commits", []):
-        # Basic fields from the commit
-        commit_sha = c.get("id")
-        commit_url = c.get("url", "")
-        message = c.get("message", "")
-        #get timestamp of comit in the hour in spain
-        date= to_madrid_local(c.get("timestamp"))
-
-        # Built author information
-        author_login = c.get("author", {}).get("username", "")
-        author_name  = c.get("author", {}).get("name", "")
-        author_email = c.get("author", {}).get("email", "")
+        commit_doc = extract_commit(c)
+        message = commit_doc["message"]
+        commit_doc["repository"] = repo_name
 
         # Compute message stats
-        message_char_count = len(message)
-        message_word_count = len(message.split())
-
-
-        # Check if the commit message contains a task reference, it can be in english or catalan, ¿spanish¿ (e.g., "task #123")
-        pattern = r'(?i)\b(?:task|tasca)\b(?:\s*#?\s*(\d+))?'
-        match = re.search(pattern, message)
-        if match:
-            task_is_written = True
-            task_reference = match.group(1)
-            if task_reference is not None:
-                task_reference = int(task_reference)
-        else:
-            task_is_written = False
-            task_reference = None
-
-        verified = "false"
-        verified_reason = "unsigned"
-        
-        commit_stats = fetch_commit_stats(repo_name, commit_sha, prj)        
-
-        # Build a final doc for this commit.
-        commit_doc = {
-            "sha": commit_sha,
-            "url": commit_url,
-            "user": {
-                "login": author_login,
-                "name": author_name,
-                "email": author_email,
-            },
-            "repository": repo_name,
-            "date": date,  # Local date in Spain
-            "message": message,
-            "message_char_count": message_char_count,
-            "message_word_count": message_word_count,
-            "task_is_written": task_is_written, 
-            "task_reference": task_reference, 
-            "verified": verified,
-            "verified_reason": verified_reason,
-            "stats": commit_stats
-        }
+        commit_doc["message_char_count"] = len(message)
+        commit_doc["message_word_count"] = len(message.split())
+
+        match = _TASK_PATTERN.search(message)
+        task_reference = match.group(1) if match else None
+        commit_doc["task_is_written"] = match is not None
+        commit_doc["task_reference"] = int(task_reference) if task_reference is not None else None
 
+        commit_doc["verified"] = "false"
+        commit_doc["verified_reason"] = "unsigned"
         commits_info.append(commit_doc)
 
+    # Fetch the stats of all the commits at once, the ones not ready before the deadline are marked as pending
+    commit_stats = fetch_push_stats(repo_name, [c["sha"] for c in commits_info], prj) if enrich else {}
+    for commit_doc in commits_info:
+        stats = commit_stats.get(commit_doc["sha"])
+        commit_doc["stats"] = stats
+        commit_doc["stats_pending"] = stats is None
+
     # Finally, return a dict containing the full structure
-    return {
-        "event": event_type,
-        "repo_name": repo_name,
-        "team_name": team_name,
-        "sender_info": sender_info,
-        "commits": commits_info
-    }
+    push["commits"] = commits_info
+    return push
 
 
 
@@ -133,55 +153,7 @@ def parse_github_issue_event(raw_payload: Dict, prj: str) -> Dict:
     '''
     Function to parse a GitHub issue event payload.
     '''
-    # Retrieve the event information from the payload
-    action = raw_payload.get("action", "unknown-action")# e.g. "issue_opened"
-    event_type = "issue"   
-    
-    # Retrieve the team name and repo name from the payload
-    team_name = raw_payload.get("organization", {}).get("login", "UnknownTeam")
-    repo_name = raw_payload["repository"].get("full_name", "unknown-repo")
-
-    # sender is the user who performed the action, retrieve their info
-    sender = raw_payload.get("sender", {})
-    sender_info = {
-        "id": sender.get("id", ""),
-        "login": sender.get("login", ""),
-        "url": sender.get("url", ""),
-        "type": sender.get("type", ""),
-        "site_admin": sender.get("site_admin", False)
-    }
-
-    # The "issue" object is typically raw_payload["issue"]
-    issue_data = raw_payload.get("issue", {})
-    issue_number = issue_data.get("number", 0)
-    issue_title  = issue_data.get("title", "")
-    issue_state  = issue_data.get("state", "")
-    issue_body   = issue_data.get("body", "")
-    issue_user   = issue_data.get("user", {})
-    issue_user_login = issue_user.get("login", "")
-    issue_user_id = issue_user.get("id", "")
-
-    # We can store relevant info about the issue as a dictionary
-    issue_obj = {
-        "number": issue_number,
-        "title": issue_title,
-        "state": issue_state,
-        "body": issue_body,
-        "user": {
-            "login": issue_user_login,
-            "id": issue_user_id
-        }
-    }
-
-    # Finally, return a dict containing the full structure
-    return {
-        "event": event_type,         
-        "action": action,          
-        "repo_name": repo_name,
-        "team_name": team_name,
-        "sender_info": sender_info,
-        "issue": issue_obj
-    }
+    return extract_issue(raw_payload)
 
 
 
@@ -189,61 +161,7 @@ def parse_github_pullrequest_event(raw_payload: Dict, prj: str) -> Dict:
     '''
     Function to parse a GitHub pull request event payload.
     '''
-    
-    action = raw_payload.get("action")
-    
-    if action != "closed":                     # we only want to process closed pull requests
+    if raw_payload.get("action") not in EVENT_ROUTES["pull_request"]:    # we only want to process closed pull requests
         return {"event": "pull_request", "ignored": True}
-    
-    event_type = "pull_request" # The event type is "pull request" but we will call it "commit" in our system
-
-
-
-    # The 'sender' object is at the top level
-    sender = raw_payload.get("sender", {})
-    sender_info = {
-        "id": sender.get("id", ""),
-        "login": sender.get("login", ""),
-        "url": sender.get("url", ""),
-        "type": sender.get("type", ""),
-        "site_admin": sender.get("site_admin", False)
-    }
-    
-    # Get the information about the pull request
-    pr_info = raw_payload.get("pull_request", {})
-    
-    pr_number = pr_info.get("number", 0)
-    pr_title  = pr_info.get("title", "")
-    pr_created_at = to_madrid_local(pr_info.get("created_at", ""))
-    pr_closed_at  = to_madrid_local(pr_info.get("closed_at", ""))
-    pr_merged_at = pr_info.get("merged", False)
-    merged_by = pr_info.get("merged_by", {}).get("login", "")
-    
-    
-    pr_assignee = (pr_info.get("assignee") or {}).get("login"), 
-    pr_reviewers = [r["login"] for r in pr_info.get("requested_reviewers", [])]
-    
-        
-    team_name = raw_payload.get("organization", {}).get("login", "UnknownTeam")
-    repo_name = raw_payload["repository"].get("full_name", "unknown-repo")
-    
-        # Build a final doc for this commit.
-    pr_doc = {
-        "event": event_type,
-        "action": action,          # always "closed"
-        "pr_number": pr_number,
-        "title": pr_title,
-        "created_at": pr_created_at,
-        "closed_at": pr_closed_at,
-        "merged_at": pr_merged_at,
-        "merged_by": merged_by,
-        "assignee": pr_assignee,
-        "reviewers": pr_reviewers,
-        "repo_name": repo_name,
-        "team_name": team_name,
-        "sender_info": sender_info,
-        }
-
 
-    # Finally, return a dict containing the full structure
-    return pr_doc
\ No newline at end of file
+    return extract_pull_request(raw_payload)
@@ -0,0 +1,86 @@
+'''
+Async counterpart of http_client for the ASGI app: one httpx.AsyncClient per upstream, with the same pool sizes,
+timeouts and retry policy (idempotent GETs on 429 / 5xx, exponential backoff with jitter, Retry-After honoured).
+Waiting on GitHub or LD Eval then holds a coroutine instead of a worker thread.
+'''
+
+import asyncio
+import logging
+import os
+import random
+from typing import Dict
+
+import httpx
+
+from config.settings import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF
+from datasources.requests.http_client import UPSTREAM_POOLS
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_CLIENTS: Dict[str, httpx.AsyncClient] = {}
+_PID = None
+
+
+def client(upstream: str) -> httpx.AsyncClient:
+    '''
+    Returns the client of an upstream ("github", "taiga" or "eval"), recreated after a fork.
+    Only used from the event loop thread, so no lock is needed.
+    '''
+    global _CLIENTS, _PID
+    if _PID != os.getpid():
+        _CLIENTS, _PID = {}, os.getpid()
+    c = _CLIENTS.get(upstream)
+    if c is None:
+        pool = UPSTREAM_POOLS[upstream]
+        c = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=pool, max_keepalive_connections=pool),
+        )
+        _CLIENTS[upstream] = c
+    return c
+
+
+def _retry_delay(attempt: int, response: httpx.Response = None) -> float:
+    retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+    if retry_after.isdigit():
+        return float(retry_after)
+    return HTTP_BACKOFF * (2 ** attempt) + random.uniform(0, HTTP_BACKOFF)
+
+
+async def request(upstream: str, method: str, url: str, **kwargs) -> httpx.Response:
+    '''
+    Sends a request through the pool of <upstream>. GETs are retried like in http_client (connection errors too),
+    the last response is returned and callers use raise_for_status().
+    '''
+    attempts = HTTP_RETRIES + 1 if method == "GET" else 1
+    for attempt in range(attempts):
+        last = attempt == attempts - 1
+        try:
+            response = await client(upstream).request(method, url, **kwargs)
+        except httpx.TransportError:
+            if last:
+                raise
+            await asyncio.sleep(_retry_delay(attempt))
+            continue
+        if response.status_code not in RETRY_STATUSES or last:
+            return response
+        await asyncio.sleep(_retry_delay(attempt, response))
+
+
+async def get(upstream: str, url: str, **kwargs) -> httpx.Response:
+    return await request(upstream, "GET", url, **kwargs)
+
+
+async def post(upstream: str, url: str, **kwargs) -> httpx.Response:
+    return await request(upstream, "POST", url, **kwargs)
+
+
+async def aclose() -> None:
+    '''
+    Closes the clients of this process, on the shutdown of the ASGI app.
+    '''
+    for c in list(_CLIENTS.values()):
+        await c.aclose()
+    _CLIENTS.clear()
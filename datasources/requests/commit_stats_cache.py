@@ -0,0 +1,88 @@
+'''
+Two-tier cache of commit stats keyed by (repository, sha): an in-process LRU in front of a Mongo collection.
+The stats of a commit never change, so there is no expiration. Only successful GitHub responses are stored.
+'''
+from collections import OrderedDict
+from typing import Dict, List
+import logging
+import threading
+
+from pymongo import UpdateOne, ASCENDING
+from pymongo.errors import PyMongoError
+
+from database.mongo_client import get_collection
+from config.settings import COMMIT_STATS_LRU_SIZE
+
+logger = logging.getLogger(__name__)
+
+CACHE_COLLECTION = "commit_stats_cache"
+
+_LRU = OrderedDict()        # key = (repo_full_name, sha) -> stats
+_LOCK = threading.Lock()
+_INDEX_READY = False
+
+
+def _collection():
+    global _INDEX_READY
+    coll = get_collection(CACHE_COLLECTION)
+    if not _INDEX_READY:
+        coll.create_index([("repo", ASCENDING), ("sha", ASCENDING)], unique=True)
+        _INDEX_READY = True
+    return coll
+
+
+def _remember(repo_full_name: str, sha: str, stats: Dict[str, int]) -> None:
+    with _LOCK:
+        _LRU[(repo_full_name, sha)] = stats
+        _LRU.move_to_end((repo_full_name, sha))
+        while len(_LRU) > COMMIT_STATS_LRU_SIZE:
+            _LRU.popitem(last=False)
+
+
+def get_many(repo_full_name: str, shas: List[str]) -> Dict[str, Dict[str, int]]:
+    '''
+    Returns the cached stats of the given commits, first from memory and then from Mongo in a single query.
+    Commits not cached are missing from the result.
+    '''
+    found = {}
+    with _LOCK:
+        for sha in shas:
+            stats = _LRU.get((repo_full_name, sha))
+            if stats is not None:
+                _LRU.move_to_end((repo_full_name, sha))
+                found[sha] = stats
+
+    missing = [sha for sha in shas if sha not in found]
+    if missing:
+        try:
+            for doc in _collection().find({"repo": repo_full_name, "sha": {"$in": missing}}, {"_id": 0, "sha": 1, "stats": 1}):
+                found[doc["sha"]] = doc["stats"]
+                _remember(repo_full_name, doc["sha"], doc["stats"])
+        except PyMongoError as e:
+            logger.warning(f"Commit stats cache lookup failed, fetching from GitHub: {e}")
+    return found
+
+
+def put(repo_full_name: str, sha: str, stats: Dict[str, int]) -> None:
+    '''
+    Stores the stats of a commit in both tiers.
+    '''
+    put_many(repo_full_name, {sha: stats})
+
+
+def put_many(repo_full_name: str, stats_by_sha: Dict[str, Dict[str, int]]) -> None:
+    '''
+    Stores the stats of several commits in both tiers, with a single bulk_write.
+    '''
+    if not stats_by_sha:
+        return
+    for sha, stats in stats_by_sha.items():
+        _remember(repo_full_name, sha, stats)
+    operations = [
+        UpdateOne({"repo": repo_full_name, "sha": sha}, {"$setOnInsert": {"stats": stats}}, upsert=True)
+        for sha, stats in stats_by_sha.items()
+    ]
+    try:
+        _collection().bulk_write(operations, ordered=False)
+    except PyMongoError as e:
+        logger.warning(f"Could not store commit stats in the cache collection: {e}")
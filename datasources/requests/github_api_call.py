@@ -1,32 +1,103 @@
 # helpers/github_stats.py
-from typing import Dict
-import requests
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, wait
+import logging
+import os
+import threading
 from config.credentials_loader import resolve
+from datasources.requests import commit_stats_cache, http_client
+from config.settings import GITHUB_STATS_WORKERS, GITHUB_STATS_DEADLINE
 
+logger = logging.getLogger(__name__)
 
-def fetch_commit_stats(repo_full_name: str, commit_sha: str, prj: str) -> Dict[str, int]:
-    """
-    Gets 'additions', 'deletions' y 'total' of a commit using GitHub's REST API v3.
-    """
-    
-    token = resolve(prj, "github_token")
-    
+_EXECUTOR = None       # Bounded pool that fans out the stats requests of a push
+_PID = None
+_LOCK = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    '''
+    Returns the executor of the current process, creating it after a fork.
+    '''
+    global _EXECUTOR, _PID
+    if _PID != os.getpid():
+        with _LOCK:
+            if _PID != os.getpid():
+                _EXECUTOR = ThreadPoolExecutor(max_workers=GITHUB_STATS_WORKERS, thread_name_prefix="github-stats")
+                _PID = os.getpid()
+    return _EXECUTOR
+
+
+def commit_request(repo_full_name: str, commit_sha: str, token: str) -> Tuple[str, Dict[str, str]]:
+    '''
+    URL and headers of the GitHub REST API v3 request of a commit, shared with the async client.
+    '''
     headers = {
         "Accept": "application/vnd.github.v3+json",
         "Authorization": f"token {token}"
     }
+    return f"https://api.github.com/repos/{repo_full_name}/commits/{commit_sha}", headers
+
 
+def stats_of(commit: Dict) -> Dict[str, int]:
+    stats = commit.get("stats", {})
+    return {
+        "total": stats.get("total", 0),
+        "additions": stats.get("additions", 0),
+        "deletions": stats.get("deletions", 0)
+    }
 
-    url = f"https://api.github.com/repos/{repo_full_name}/commits/{commit_sha}"
 
+def _request_commit_stats(repo_full_name: str, commit_sha: str, token: str) -> Optional[Dict[str, int]]:
+    """
+    Gets 'additions', 'deletions' y 'total' of a commit using GitHub's REST API v3. Returns None if the request fails.
+    Successful responses are stored in the commit stats cache.
+    """
+    url, headers = commit_request(repo_full_name, commit_sha, token)
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_client.get("github", url, headers=headers)
         response.raise_for_status()
-        stats = response.json().get("stats", {})
-        return {
-            "total": stats.get("total", 0),
-            "additions": stats.get("additions", 0),
-            "deletions": stats.get("deletions", 0)
-        }
+        stats = stats_of(response.json())
     except Exception as exc:
-            return {"total": 0, "additions": 0, "deletions": 0}
+        logger.warning(f"Could not fetch stats of commit {commit_sha} of {repo_full_name}: {exc}")
+        return None
+
+    commit_stats_cache.put(repo_full_name, commit_sha, stats)
+    return stats
+
+
+def fetch_commit_stats(repo_full_name: str, commit_sha: str, prj: str) -> Dict[str, int]:
+    """
+    Gets 'additions', 'deletions' y 'total' of a commit, from the cache or from GitHub's REST API v3.
+    """
+    return fetch_push_stats(repo_full_name, [commit_sha], prj)[commit_sha] or {"total": 0, "additions": 0, "deletions": 0}
+
+
+def fetch_push_stats(repo_full_name: str, commit_shas: List[str], prj: str) -> Dict[str, Optional[Dict[str, int]]]:
+    '''
+    Fetches the stats of all the commits of a push. Cached commits never reach GitHub, the rest are requested
+    concurrently through the shared GitHub connection pool.
+    Waits at most GITHUB_STATS_DEADLINE seconds for the whole push, the commits whose stats did not arrive in time
+    are returned as None (the requests keep running in the background and their result goes to the cache).
+    Failed requests return zeroed stats, as before.
+    '''
+    if not commit_shas:
+        return {}
+    results = commit_stats_cache.get_many(repo_full_name, commit_shas)
+    missing = [sha for sha in commit_shas if sha not in results]
+    if not missing:
+        return results
+
+    token = resolve(prj, "github_token")
+    futures = {sha: _executor().submit(_request_commit_stats, repo_full_name, sha, token) for sha in missing}
+    wait(futures.values(), timeout=GITHUB_STATS_DEADLINE)
+
+    for sha, fut in futures.items():
+        if not fut.done():
+            results[sha] = None
+        else:
+            results[sha] = fut.result() or {"total": 0, "additions": 0, "deletions": 0}
+    pending = sum(1 for v in results.values() if v is None)
+    if pending:
+        logger.warning(f"Stats of {pending}/{len(commit_shas)} commits of {repo_full_name} not ready after {GITHUB_STATS_DEADLINE}s, stored as pending.")
+    return results
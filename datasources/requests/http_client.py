@@ -0,0 +1,86 @@
+'''
+Shared outbound HTTP client. Every call to GitHub, Taiga and LD Eval goes through here, so connections are kept alive
+in one pool per upstream instead of paying a TCP/TLS handshake per request.
+'''
+
+import logging
+import os
+import threading
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config.settings import (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF,
+                             HTTP_POOL_GITHUB, HTTP_POOL_TAIGA, HTTP_POOL_EVAL)
+
+logger = logging.getLogger(__name__)
+
+# Size of the connection pool of each upstream
+UPSTREAM_POOLS = {
+    "github": HTTP_POOL_GITHUB,
+    "taiga":  HTTP_POOL_TAIGA,
+    "eval":   HTTP_POOL_EVAL,
+}
+
+_SESSIONS: Dict[str, requests.Session] = {}
+_PID = None
+_LOCK = threading.Lock()
+
+
+def _build_session(pool_size: int) -> requests.Session:
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        backoff_jitter=HTTP_BACKOFF,              # Spread the retries of concurrent workers
+        allowed_methods=frozenset({"GET"}),        # Only idempotent reads are retried
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True,
+        raise_on_status=False,                     # Give back the last response, callers use raise_for_status()
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def session(upstream: str) -> requests.Session:
+    '''
+    Returns the pooled session of an upstream ("github", "taiga" or "eval"). Sessions are recreated after a fork.
+    '''
+    global _SESSIONS, _PID
+    if _PID != os.getpid():
+        with _LOCK:
+            if _PID != os.getpid():
+                _SESSIONS = {}
+                _PID = os.getpid()
+    s = _SESSIONS.get(upstream)
+    if s is None:
+        with _LOCK:
+            s = _SESSIONS.get(upstream)
+            if s is None:
+                s = _build_session(UPSTREAM_POOLS[upstream])
+                _SESSIONS[upstream] = s
+    return s
+
+
+def request(upstream: str, method: str, url: str, **kwargs) -> requests.Response:
+    '''
+    Sends a request through the pool of <upstream>, with the default (connect, read) timeouts unless given.
+    '''
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    return session(upstream).request(method, url, **kwargs)
+
+
+def get(upstream: str, url: str, **kwargs) -> requests.Response:
+    return request(upstream, "GET", url, **kwargs)
+
+
+def post(upstream: str, url: str, **kwargs) -> requests.Response:
+    return request(upstream, "POST", url, **kwargs)
+
+
+def delete(upstream: str, url: str, **kwargs) -> requests.Response:
+    return request(upstream, "DELETE", url, **kwargs)
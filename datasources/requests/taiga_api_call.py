@@ -1,41 +1,37 @@
-import requests
-from datetime import datetime, timedelta
+import logging
 from utils.taiga_token.taiga_auth import get_taiga_token
-from config.credentials_loader import resolve
+from utils.ttl_cache import TTLCache
+from utils.shared_cache import shared_cache
+from config.credentials_loader import lookup
+from config.settings import MILESTONE_CACHE_SIZE, MILESTONE_CACHE_TTL, MILESTONE_CACHE_STALE
+from datasources.requests import http_client
 
-_CACHE = {}                 # key = (project_id, milestone_id) -> (timestamp, stats)
-TTL    = timedelta(minutes=1) # Cache time-to-live, set to 5 minutes. Means that if the same request is made within 5 minutes, it will return the cached result instead of making a new API call.
+logger = logging.getLogger(__name__)
 
-def milestone_stats(project_id: str, milestone_id: str, prj: str):
-    '''
-    Fetches the statistics of a milestone in a Taiga project. 
-    Uses caching to avoid frequent API calls to get the taiga token.
-    It refreshes the cache every 5 minutes.
-    '''
-    if not project_id or not milestone_id:
-        return {}
+# key = (project_id, milestone_id) -> stats. Bounded, and the webhooks of a closing milestone share a single API call
+_CACHE = TTLCache("milestone_stats_cache", MILESTONE_CACHE_SIZE, MILESTONE_CACHE_TTL, MILESTONE_CACHE_STALE)
 
-    key = (project_id, milestone_id)
-    now = datetime.utcnow()
-    if key in _CACHE and now - _CACHE[key][0]< TTL:
-        return _CACHE[key][1]
 
-    user = resolve(prj, "taiga_user")
-    psw  = resolve(prj, "taiga_password")
-    print(user, psw)
+def fetch_milestone_stats(project_id: str, milestone_id: str, prj: str) -> dict:
+    '''
+    Calls the Taiga stats API of a milestone with the credentials of the project, bypassing the cache.
+    '''
+    creds = lookup(prj)
+    user = creds.get("taiga_user")
+    psw  = creds.get("taiga_password")
     if user and psw:
         token = get_taiga_token(user, psw)
         headers = {"Authorization": f"Bearer {token}"}
-        print("Using Taiga credentials for project:", prj)
+        logger.debug(f"Using Taiga credentials for project: {prj}")
     else:
         headers = {}
-        print("Warning: No Taiga credentials found for project:", prj)
+        logger.warning(f"No Taiga credentials found for project: {prj}")
     
     url = f"https://api.taiga.io/api/v1/milestones/{milestone_id}/stats"
-    r   = requests.get(url, params={"project": project_id}, headers=headers, timeout=(1, 5))
+    r   = http_client.get("taiga", url, params={"project": project_id}, headers=headers)
     r.raise_for_status()
     js  = r.json()
-    stats = {
+    return {
         "milestone_total_points"         : sum(js.get("total_points", {}).values()),
         "milestone_closed_points"        : sum(js.get("completed_points", 0)),
         "milestone_total_userstories"    : js.get("total_userstories", 0),
@@ -43,5 +39,23 @@ def milestone_stats(project_id: str, milestone_id: str, prj: str):
         "milestone_total_tasks"          : js.get("total_tasks", 0),
         "milestone_completed_tasks"      : js.get("completed_tasks", 0),
     }
-    _CACHE[key] = (now, stats)
-    return stats
\ No newline at end of file
+
+
+def milestone_stats(project_id: str, milestone_id: str, prj: str):
+    '''
+    Fetches the statistics of a milestone in a Taiga project. 
+    Cached per milestone (MILESTONE_CACHE_TTL), concurrent misses wait on a single API call and
+    values slightly out of date are answered while they are refreshed in the background.
+    Behind the in-process cache, the worker processes of the host share their results through utils/shared_cache.py.
+    '''
+    if not project_id or not milestone_id:
+        return {}
+
+    def load():
+        cache = shared_cache()
+        if cache is None:
+            return fetch_milestone_stats(project_id, milestone_id, prj)
+        return cache.get_or_load("milestone_stats", f"{project_id}:{milestone_id}",
+                                 lambda: fetch_milestone_stats(project_id, milestone_id, prj), ttl=MILESTONE_CACHE_TTL)
+
+    return _CACHE.get_or_load((project_id, milestone_id), load)
@@ -1,39 +1,180 @@
-from typing import Dict
-from datetime import datetime
-from zoneinfo import ZoneInfo
+from typing import Dict, List
 import re
 
+from datasources.field_spec import Const, Field, compile_spec
+from datasources.timestamps import to_madrid_local, datetime_fields, localize_documents
 from datasources.requests.taiga_api_call import  milestone_stats
 
-def to_madrid_local(ts: str) -> str:
-    """
-    Receive date in ISO-8601 ethen transforms it on to Europe/Madrid date.
-    """
-    if not ts:                           # '', None…
-        return ts
-    # The date stabdart only accepts  '+00:00', but taiga returns in 'Z' format
-    dt_utc = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-    # put date to Europe/Madrid timezone
-    dt_mad_naive = dt_utc.astimezone(ZoneInfo("Europe/Madrid")).replace(tzinfo=None)
-    # format
-    return dt_mad_naive.isoformat(timespec="milliseconds")
+
+def _username_or_none(user) -> str:
+    #There are cases where the assigned_to field is empty, and if we request it aniways it will throw an error, so we need to check if it exists
+    return user.get("username", "") if user is not None else None
+
+
+def _or_empty(attributes) -> Dict:
+    return attributes if attributes is not None else {}
+
+
+def _sum_points(points) -> float:
+    # The points can be a list of {role, value} or "" / None when the user story has none
+    return sum(p.get("value") or 0 for p in points) if isinstance(points, list) else 0
+
+
+_STORY_PATTERN = re.compile(r"as\s+(.*?)\s+i want\s+(.*?)\s+so that\s+(.*)", re.IGNORECASE)
+
+def _story_pattern(description) -> bool:
+    #If the pattern "AS - A - I WANT - SO THAT" is used in the description, the value of pattern will be True, if not, it will be False
+    return bool(_STORY_PATTERN.search(description or ""))
+
+
+# Document fields of each Taiga entity: (target, path in the webhook payload, path in the REST API object, default, transform).
+# The webhook parsers and the recovery converters (utils/recovery/taiga_recovery.py) are compiled from the same specs.
+_MILESTONE_FIELDS = [
+    Field("milestone_id",            "data.milestone.id",               "milestone",                            ""),
+    Field("milestone_name",          "data.milestone.name",             "milestone_extra_info.name",            ""),
+    Field("milestone_closed",        "data.milestone.closed",           "milestone_extra_info.closed",          ""),
+    Field("milestone_created_date",  "data.milestone.created_date",     "milestone_extra_info.created_date",    "", to_madrid_local),
+    Field("milestone_modified_date", "data.milestone.modified_date",    "milestone_extra_info.modified_date",   "", to_madrid_local),
+    Field("estimated_start",         "data.milestone.estimated_start",  "milestone_extra_info.estimated_start", "", to_madrid_local),
+    Field("estimated_finish",        "data.milestone.estimated_finish", "milestone_extra_info.estimated_finish", "", to_madrid_local),
+]
+
+ISSUE_SPEC = [
+    Field("project_id",    "data.project.id",     "project",                  ""),
+    Field("team_name",     "data.project.name",   "project_extra_info.name",  ""),
+    Field("event_type",    "type",                Const("issue"),             ""),
+    Field("action_type",   "action",              Const("import"),            ""),
+    Field("issue_id",      "data.id",             "id",                       ""),
+    Field("subject",       "data.subject",        "subject",                  ""),
+    Field("description",   "data.description",    "description",              ""),
+    Field("due_date",      "data.due_date",       "due_date",                 "", to_madrid_local),
+    Field("severity",      "data.severity.name",  "severity_extra_info.name", ""),
+    Field("status",        "data.status.name",    "status_extra_info.name",   ""),
+    Field("priority",      "data.priority.name",  "priority_extra_info.name", ""),
+    Field("type",          "data.type.name",      "type_extra_info.name",     ""),
+    Field("is_closed",     "data.is_closed",      "status_extra_info.is_closed", False),
+    Field("modified_date", "data.modified_date",  "modified_date",            "", to_madrid_local),
+    Field("created_date",  "data.created_date",   "created_date",             "", to_madrid_local),
+    Field("finished_date", "data.finished_date",  "finished_date",            "", to_madrid_local),
+    Field("assigned_by",   "by.username",         Const("backfill"),          ""),
+    Field("assigned_to",   "data.assigned_to",    "assigned_to_extra_info",   {}, _username_or_none),
+]
+ISSUE_SPEC += datetime_fields(ISSUE_SPEC)
+
+EPIC_SPEC = [
+    Field("epic_id",       "data.id",             "id",                       ""),
+    Field("team_name",     "data.project.name",   "project_extra_info.name",  ""),
+    Field("assigned_by",   "by.username",         Const("backfill"),          ""),
+    Field("event_type",    "type",                Const("epic"),              ""),
+    Field("action_type",   "action",              Const("import"),            ""),
+    Field("subject",       "data.subject",        "subject",                  ""),
+    Field("is_closed",     "data.is_closed",      "status_extra_info.is_closed", False),
+    Field("status",        "data.status.name",    "status_extra_info.name",   ""),
+    Field("modified_date", "data.modified_date",  "modified_date",            "", to_madrid_local),
+    Field("created_date",  "data.created_date",   "created_date",             "", to_madrid_local),
+    #We are going to use this project_id to delete the webhooks with the TAIGA API
+    Field("project_id",    "data.project.id",     "project_extra_info.id",    ""),
+]
+EPIC_SPEC += datetime_fields(EPIC_SPEC)
+
+TASK_SPEC = [
+    Field("project_id",    "data.project.id",     "project",                  ""),
+    Field("team_name",     "data.project.name",   "project_extra_info.name",  ""),
+    Field("event_type",    "type",                Const("task"),              ""),
+    Field("action_type",   "action",              Const("import"),            ""),
+    Field("subject",       "data.subject",        "subject",                  ""),
+    Field("task_id",       "data.id",             "id",                       ""),
+    Field("userstory_id",  "data.user_story.id",  "user_story",               ""),
+    Field("userstory_is_closed", "data.user_story.is_closed", "user_story_extra_info.is_closed", ""),
+    Field("is_closed",     "data.status.is_closed", "status_extra_info.is_closed", ""),
+    Field("status",        "data.status.name",    "status_extra_info.name",   ""),
+    Field("assigned_to",   "data.assigned_to",    "assigned_to_extra_info",   {}, _username_or_none),
+    Field("assigned_by",   "by.username",         Const("backfill"),          ""),
+    Field("created_date",  "data.created_date",   "created_date",             "", to_madrid_local),
+    Field("modified_date", "data.modified_date",  "modified_date",            "", to_madrid_local),
+    Field("finished_date", "data.finished_date",  "finished_date",            "", to_madrid_local),
+    Field("reference",     "data.ref",            "ref",                      ""),
+    *_MILESTONE_FIELDS,
+    #If someone defines a new metric, if it isnt listed in the handler, we wont get it. To solve we get all the custom attributes as an object and store it in mongo
+    #They will have the name defined in taiga.
+    Field("custom_attributes", "data.custom_attributes_values", "custom_attributes_values", {}, _or_empty),
+]
+TASK_SPEC += datetime_fields(TASK_SPEC)
+
+#Most fields dont appear when creating the user story from zero, they appear once we link it to an epic
+USERSTORY_SPEC = [
+    Field("project_id",    "data.project.id",     "project",                  ""),
+    Field("team_name",     "data.project.name",   "project_extra_info.name",  ""),
+    Field("event_type",    "type",                Const("userstory"),         ""),
+    Field("action_type",   "action",              Const("import"),            ""),
+    Field("subject",       "data.subject",        "subject",                  ""),
+    Field("userstory_id",  "data.id",             "id",                       ""),
+    # Taiga sends is_closed inside data, it is the field the milestone aggregates count the completed user stories with
+    Field("is_closed",     "data.is_closed",      "status_extra_info.is_closed", False),
+    Field("status",        "data.status.name",    "status_extra_info.name",   ""),
+    Field("created_date",  "data.created_date",   "created_date",             "", to_madrid_local),
+    Field("modified_date", "data.modified_date",  "modified_date",            "", to_madrid_local),
+    Field("total_points",  "data.points",         "points",                   [], _sum_points),
+    Field("assigned_by",   "by.username",         Const("backfill"),          ""),
+    *_MILESTONE_FIELDS,
+    Field("custom_attributes", "data.custom_attributes_values", "custom_attributes_values", {}, _or_empty),
+    Field("pattern",       "data.description",    "description",              "", _story_pattern),
+    Field("priority",      "data.custom_attributes_values.Priority", "custom_attributes_values.Priority", ""),
+]
+USERSTORY_SPEC += datetime_fields(USERSTORY_SPEC)
+
+# This related userstory event is triggered when a user story is linked to an epic, it only comes from the webhooks.
+# It is upserted on userstory_id, so the epic link is stored in the document of the user story
+RELATED_USERSTORY_SPEC = [
+    Field("userstory_id",  "data.user_story.id",  None, ""),
+    Field("team_name",     "data.epic.project.name", None, ""),
+    Field("event_type",    "type",                None, ""),
+    Field("epic_id",       "data.epic.id",        None, ""),
+    Field("epic_name",     "data.epic.subject",   None, ""),
+    Field("reference",     "data.epic.ref",       None, ""),
+    Field("finished_date", "data.finished_date",  None, "", to_madrid_local),
+    Field("assigned_to",   "data.assigned_to.username", None, ""),
+    Field("assigned_by",   "by.username",         None, ""),
+]
+RELATED_USERSTORY_SPEC += datetime_fields(RELATED_USERSTORY_SPEC)
+
+extract_issue = compile_spec(ISSUE_SPEC, "webhook", "extract_issue")
+extract_epic = compile_spec(EPIC_SPEC, "webhook", "extract_epic")
+extract_task = compile_spec(TASK_SPEC, "webhook", "extract_task")
+extract_userstory = compile_spec(USERSTORY_SPEC, "webhook", "extract_userstory")
+extract_related_userstory = compile_spec(RELATED_USERSTORY_SPEC, "webhook", "extract_related_userstory")
+
+# Converters of the objects of the Taiga REST API, used by the recovery scripts through from_api(),
+# which converts the dates of a whole page of objects in one batch
+issue_from_api = compile_spec(ISSUE_SPEC, "api", "issue_from_api", defer=(to_madrid_local,))
+epic_from_api = compile_spec(EPIC_SPEC, "api", "epic_from_api", defer=(to_madrid_local,))
+task_from_api = compile_spec(TASK_SPEC, "api", "task_from_api", defer=(to_madrid_local,))
+userstory_from_api = compile_spec(USERSTORY_SPEC, "api", "userstory_from_api", defer=(to_madrid_local,))
+
+
+def from_api(converter, objects: List[Dict]) -> List[Dict]:
+    '''
+    Converts the objects returned by the Taiga REST API with one of the *_from_api converters.
+    '''
+    return localize_documents([converter(o) for o in objects], converter.deferred)
 
 
-def parse_taiga_event(raw_payload: Dict, prj: str) -> Dict:
+def parse_taiga_event(raw_payload: Dict, prj: str, enrich: bool = True) -> Dict:
     """
     Parse a taiga event payload into a more detailed structure.
     The webhook has tells you the type of event.
     We can handle "issues", "epics", "tasks" and "userstories" events.
+    If enrich is False, the milestone stats are not fetched and the document is marked with milestone_stats_pending.
     """
     event_type = raw_payload.get("type")
-    if event_type == "issue":       
+    if event_type == "issue":
         return parse_taiga_issue_event(raw_payload, prj)
     elif event_type == "epic":
         return parse_taiga_epic_event(raw_payload, prj)
     elif event_type == "task":
-        return parse_taiga_task_event(raw_payload, prj)
+        return parse_taiga_task_event(raw_payload, prj, enrich)
     elif event_type == "userstory":
-        return parse_taiga_userstory_event(raw_payload, prj)
+        return parse_taiga_userstory_event(raw_payload, prj, enrich)
     elif event_type == "relateduserstory":
         return parse_taiga_related_userstory_event(raw_payload, prj)
     else:
@@ -45,306 +186,56 @@ def parse_taiga_event(raw_payload: Dict, prj: str) -> Dict:
 
 
 
-def parse_taiga_issue_event(raw_payload: Dict, prj: str) -> Dict:   
+def parse_taiga_issue_event(raw_payload: Dict, prj: str) -> Dict:
     '''
     Function to parse a taiga issue event payload.
     '''
-    # Extract the relevant fields from the raw payload
-    project_id= raw_payload.get("data",{}).get("project",{}).get("id", "")
-    issue_id=raw_payload.get("data",{}).get("id", "")
-    team_name = raw_payload.get("data",{}).get("project", {}).get("name", "")
-    event_type= raw_payload.get("type","")
-    action_type= raw_payload.get("action","")
-    subject = raw_payload.get("data",{}).get("subject", "")
-    due_date = to_madrid_local(raw_payload.get("data",{}).get("due_date", ""))
-    description = raw_payload.get("data", {}).get("description", "") 
-    severity = raw_payload.get("data", {}).get("severity", {}).get("name", "")
-    status = raw_payload.get("data", {}).get("status", {}).get("name", "")
-    priority = raw_payload.get("data", {}).get("priority", {}).get("name", "")
-    type = raw_payload.get("data", {}).get("type", {}).get("name", "") 
-    is_closed = raw_payload.get("is_closed", False)
-    modified_date = to_madrid_local(raw_payload.get("data", {}).get("modified_date", ""))
-    created_date = to_madrid_local(raw_payload.get("data", {}).get("created_date", ""))
-    finished_date = to_madrid_local(raw_payload.get("data", {}).get("finished_date", ""))
-    assigned_by = raw_payload.get("by", {}).get("username", "")
-    #There are cases where the assigned_to field is empty, and if we request it aniways it will throw an error, so we need to check if it exists
-    if raw_payload.get("data", {}).get("assigned_to", {}) != None:
-        assigned_to = raw_payload.get("data", {}).get("assigned_to", {}).get("username", "")
-    else:
-        assigned_to = None
-    
-    # Create a dictionary with all the attributes of the issue
-    doc = {
-        "project_id": project_id,
-        "team_name": team_name,
-        "event_type": event_type,
-        "action_type": action_type,
-        "issue_id": issue_id,
-        "subject": subject,
-        "description": description,
-        "due_date": due_date,
-        "severity": severity,
-        "status": status,
-        "priority": priority,
-        "type": type,
-        "is_closed": is_closed,
-        "modified_date": modified_date,
-        "created_date": created_date,
-        "finished_date": finished_date,
-        "assigned_by": assigned_by,
-        "assigned_to": assigned_to
-    }
-    # Return the parsed issue data as a dictionary
-    return doc
+    return extract_issue(raw_payload)
 
 
 
 
-def parse_taiga_epic_event(raw_payload: Dict, prj: str) -> Dict:   
+def parse_taiga_epic_event(raw_payload: Dict, prj: str) -> Dict:
     '''
     Function to parse a taiga epic event payload.
     '''
-    # Extract the relevant fields from the raw payload
-    epic_id= raw_payload.get("data",{}).get("id", "")
-    team_name = raw_payload.get("data",{}).get("project", {}).get("name", "")
-    event_type= raw_payload.get("type","")
-    action_type= raw_payload.get("action","")
-    subject = raw_payload.get("data",{}).get("subject", "")
-    status = raw_payload.get("data", {}).get("status", {}).get("name", "")
-    is_closed = raw_payload.get("is_closed", False)
-    modified_date = to_madrid_local(raw_payload.get("data", {}).get("modified_date", ""))
-    created_date = to_madrid_local(raw_payload.get("data", {}).get("created_date", ""))
-    assigned_by = raw_payload.get("by", {}).get("username", "")
-    #We are going to use this project_id to delete the webhooks with the TAIGA API
-    project_id= raw_payload.get("data",{}).get("project",{}).get("id", "")
-    
-    # Create a dictionary with all the attributes of the epic
-    doc = {
-        "epic_id": epic_id,
-        "team_name": team_name,
-        "assigned_by": assigned_by,
-        "event_type": event_type,
-        "action_type": action_type,
-        "subject": subject,
-        "is_closed": is_closed,
-        "status": status,
-        "modified_date": modified_date,
-        "created_date": created_date,
-        "project_id": project_id
-
-    }
-    # Return the parsed epic data as a dictionary
-    return doc
+    return extract_epic(raw_payload)
 
 
 
 
-def parse_taiga_task_event(raw_payload: Dict, prj: str) -> Dict:  
+def _add_milestone_stats(doc: Dict, prj: str, enrich: bool) -> Dict:
     '''
-    Function to parse a taiga task event payload.
+    The milestone stats come from the Taiga API, in deferred mode the enricher fills them later.
     '''
-    # Extract the relevant fields from the raw payload
-    project_id= raw_payload.get("data",{}).get("project",{}).get("id", "")
-    team_name = raw_payload.get("data",{}).get("project", {}).get("name", "")
-    event_type= raw_payload.get("type","")
-    action_type= raw_payload.get("action","")
-    task_id= raw_payload.get("data",{}).get("id", "")
-    subject = raw_payload.get("data",{}).get("subject", "")
-    userstory_id= raw_payload.get("data",{}).get("user_story",{}).get("id", "")
-    userstory_is_closed= raw_payload.get("data",{}).get("user_story",{}).get("is_closed", "")
-    is_closed = raw_payload.get("data", {}).get("status", {}).get("is_closed", "")
-    status = raw_payload.get("data", {}).get("status", {}).get("name", "")
-    created_date = to_madrid_local(raw_payload.get("data", {}).get("created_date", ""))
-    modified_date = to_madrid_local(raw_payload.get("data", {}).get("modified_date", ""))
-    finished_date = to_madrid_local(raw_payload.get("data", {}).get("finished_date", ""))
-    reference=raw_payload.get("data",{}).get("ref", "")
-    milestone_id=raw_payload.get("data",{}).get("milestone",{}).get("id", "")
-    milestone_name=raw_payload.get("data",{}).get("milestone",{}).get("name", "")
-    milestone_closed=raw_payload.get("data",{}).get("milestone",{}).get("closed", "")
-    milestone_created_date=raw_payload.get("data",{}).get("milestone",{}).get("created_date", "")
-    milestone_created_date = to_madrid_local(milestone_created_date) if milestone_created_date else ""
-    milestone_modified_date=raw_payload.get("data",{}).get("milestone",{}).get("modified_date", "")
-    milestone_modified_date = to_madrid_local(milestone_modified_date) if milestone_modified_date else ""
-    estimated_start=to_madrid_local(raw_payload.get("data",{}).get("milestone",{}).get("estimated_start", ""))
-    estimated_finish=to_madrid_local(raw_payload.get("data",{}).get("milestone",{}).get("estimated_finish", ""))
-    assigned_by = raw_payload.get("by", {}).get("username", "")
-    
-    
-    milestone_data = milestone_stats(project_id, milestone_id, prj)
-    #If someone defines a new metric, if it isnt listed in the handler, we wont get it. To solve we can get all the custom attributes as an object and store it in mongo
-    custom_attributes = raw_payload.get("data", {}).get("custom_attributes_values", {})
-    if custom_attributes is None:
-        custom_attributes = {}
-   
-    #There are cases where the assigned_to field is empty, and if we request it aniways it will throw an error, so we need to check if it exists
-    if raw_payload.get("data", {}).get("assigned_to", {}) != None:
-        assigned_to = raw_payload.get("data", {}).get("assigned_to", {}).get("username", "")
-    else:
-        assigned_to = None
-    
-    # Create a dictionary with all the attributes of the task
-    doc = {
-        "project_id": project_id,
-        "team_name": team_name,
-        "event_type": event_type,
-        "action_type": action_type,
-        "subject": subject,
-        "task_id": task_id,
-        "userstory_id": userstory_id,
-        "userstory_is_closed": userstory_is_closed,
-        "is_closed": is_closed,
-        "status": status,
-        "assigned_to": assigned_to,
-        "assigned_by": assigned_by,
-        "created_date": created_date,
-        "modified_date": modified_date,
-        "finished_date": finished_date,
-        "reference": reference,
-        "milestone_id": milestone_id,
-        "milestone_name": milestone_name,
-        "milestone_closed": milestone_closed,
-        "milestone_created_date": milestone_created_date,
-        "milestone_modified_date": milestone_modified_date,
-        "estimated_start": estimated_start,
-        "estimated_finish": estimated_finish,
-        
-        #We can get all the custom attributes like an object, but in mongo they will have the name defined in taiga.
-        "custom_attributes": custom_attributes, 
-    }
-    doc.update(milestone_data)
-    # Return the parsed task data as a dictionary
+    has_milestone = bool(doc["project_id"] and doc["milestone_id"])
+    doc["milestone_stats_pending"] = not enrich and has_milestone
+    if enrich and has_milestone:
+        doc.update(milestone_stats(doc["project_id"], doc["milestone_id"], prj))
     return doc
 
 
+def parse_taiga_task_event(raw_payload: Dict, prj: str, enrich: bool = True) -> Dict:
+    '''
+    Function to parse a taiga task event payload.
+    '''
+    return _add_milestone_stats(extract_task(raw_payload), prj, enrich)
 
 
 
 
-
-#Most fields dont appear when creating the user story from zero, they appear once we link it to an epic
-def parse_taiga_userstory_event(raw_payload: Dict, prj: str) -> Dict:   
+def parse_taiga_userstory_event(raw_payload: Dict, prj: str, enrich: bool = True) -> Dict:
     '''
     Function to parse a taiga userstory event payload.
     '''
-    # Extract the relevant fields from the raw payload
-    project_id= raw_payload.get("data",{}).get("project",{}).get("id", "")
-    userstory_id= raw_payload.get("data",{}).get("id", "")
-    team_name = raw_payload.get("data",{}).get("project", {}).get("name", "")
-    event_type= raw_payload.get("type","")
-    action_type= raw_payload.get("action","")
-    subject = raw_payload.get("data",{}).get("subject", "")
-    status = raw_payload.get("data", {}).get("status", {}).get("name", "")
-    is_closed = raw_payload.get("is_closed", False)
-    modified_date = to_madrid_local(raw_payload.get("data", {}).get("modified_date", ""))
-    created_date = to_madrid_local(raw_payload.get("data", {}).get("created_date", ""))
-    assigned_by = raw_payload.get("by", {}).get("username", "")
-    # Extract all the custom attributes from the payload, if they exist
-    custom_attributes = raw_payload.get("data", {}).get("custom_attributes_values", {}) 
-    if custom_attributes is None:
-        custom_attributes = {}
-    
-    description= raw_payload.get("data", {}).get("description", "")
-    #If the pattern "AS - A - I WANT - SO THAT" is used in the description, the vañue of pattern will be True, if not, it will be False
-    pattern = r"as\s+(.*?)\s+i want\s+(.*?)\s+so that\s+(.*)"
-    match = re.search(pattern, description, re.IGNORECASE)
-    if match:
-        pattern_in_description = True
-    else:
-        pattern_in_description = False
-    
-    # If the userstory has a milestone associated while created, we will get the values, if not, we will set them to None
-    if raw_payload.get("data",{}).get("milestone",{}) != None:
-        
-        milestone_id= raw_payload.get("data",{}).get("milestone",{}).get("id", "")
-        milestone_name= raw_payload.get("data",{}).get("milestone",{}).get("name", "")
-        milestone_closed= raw_payload.get("data",{}).get("milestone",{}).get("closed", "")
-        milestone_created_date= to_madrid_local(raw_payload.get("data",{}).get("milestone",{}).get("created_date", ""))
-        milestone_modified_date= to_madrid_local(raw_payload.get("data",{}).get("milestone",{}).get("modified_date", ""))
-        milestone_modified_date = to_madrid_local(milestone_modified_date) if milestone_modified_date else ""
-        estimated_start= to_madrid_local(raw_payload.get("data",{}).get("milestone",{}).get("estimated_start", ""))
-        estimated_finish= to_madrid_local(raw_payload.get("data",{}).get("milestone",{}).get("estimated_finish", ""))
-        
-        milestone_data= milestone_stats(project_id, milestone_id, prj)
-        
-        
-        
-    else:
-        milestone_id= ""
-        milestone_name= ""
-        milestone_closed= ""
-        milestone_created_date= ""
-        milestone_modified_date= ""
-        estimated_start= ""
-        estimated_finish= ""
-    
-
-    priority = raw_payload.get("data", {}).get("custom_attributes_values", {}).get("Priority", "")
-    points_list = raw_payload.get("data",{}).get("points", [])
-    sum_points = sum(p.get("value") or 0 for p in points_list)
-
-    # Create a dictionary with all the attributes of the user story    
-    doc = {
-        "project_id": project_id,
-        "team_name": team_name,
-        "event_type": event_type,
-        "action_type": action_type,
-        "subject": subject,
-        "userstory_id": userstory_id,
-        "is_closed": is_closed,
-        "status": status,
-        "created_date": created_date,
-        "modified_date": modified_date,        
-        "total_points": sum_points,
-        "assigned_by": assigned_by,
-        "milestone_id": milestone_id,
-        "milestone_name": milestone_name,
-        "milestone_closed": milestone_closed,
-        "milestone_created_date": milestone_created_date,
-        "milestone_modified_date": milestone_modified_date,
-        "estimated_start": estimated_start,
-        "estimated_finish": estimated_finish,
-                #We can get all the custom attributes like an object, but in mongo they will have the name defined in taiga.
-        "custom_attributes": custom_attributes, 
-        #"acceptance_criteria": acceptance_criteria, #TRUE IF THE USER STORY HAS ACCEPTANCE CRITERIA
-        "pattern": pattern_in_description,    
-        "priority": priority
-    }
-    
-    doc.update(milestone_data)
-    # Return the parsed user story data as a dictionary
-    return doc
+    return _add_milestone_stats(extract_userstory(raw_payload), prj, enrich)
 
 
 
 
-def parse_taiga_related_userstory_event(raw_payload: Dict, prj: str) -> Dict:   
+def parse_taiga_related_userstory_event(raw_payload: Dict, prj: str) -> Dict:
     '''
     Function to parse a taiga related userstory event payload.
     This related userstory event is triggered when a user story is linked to an epic.
     '''
-    # Extract the relevant fields from the raw payload
-    userstory_id= raw_payload.get("data",{}).get("user_story",{}).get("id", "")
-    team_name = raw_payload.get("data",{}).get("epic",{}).get("project", {}).get("name", "")
-    event_type= raw_payload.get("type","")
-    finished_date = to_madrid_local(raw_payload.get("data",{}).get("finished_date", ""))
-    assigned_to = raw_payload.get("data",{}).get("assigned_to",{}).get("username", "")
-    epic_id= raw_payload.get("data",{}).get("epic",{}).get("id", "")
-    epic_name= raw_payload.get("data",{}).get("epic",{}).get("subject","")
-    reference= raw_payload.get("data",{}).get("epic",{}).get("ref", "")
-    assigned_by = raw_payload.get("by", {}).get("username", "")
-
-    # Create a dictionary with all the attributes of the user story
-    doc = {
-        "id": userstory_id,  
-        "team_name": team_name,
-        "event_type": event_type,
-        "epic_id": epic_id,
-        "epic_name": epic_name, 
-        "reference": reference,
-        "finished_date": finished_date,
-        "assigned_to": assigned_to,
-        "assigned_by": assigned_by,
-    }
-    # Return the parsed user story data as a dictionary
-    return doc
-
+    return extract_related_userstory(raw_payload)
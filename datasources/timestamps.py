@@ -0,0 +1,85 @@
+'''
+Conversion of the ISO-8601 timestamps of GitHub and Taiga to the naive Europe/Madrid local time we store.
+
+The time zone is built once, and conversions are memoized: the milestone dates are the same for every task of a
+sprint and the timestamps of a webhook are often repeated. to_madrid_local_many() converts a batch converting every
+distinct value once, for the recovery scripts.
+
+Every converted field also gets a native datetime companion in UTC (<field>_dt, see datetime_fields()), stored as a
+BSON date so time-window queries use range indexes instead of comparing strings.
+'''
+
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+from datasources.field_spec import Field
+
+MADRID = ZoneInfo("Europe/Madrid")
+
+
+def _convert(ts: str) -> str:
+    # The date standard of Python < 3.11 only accepts '+00:00', but GitHub and Taiga return the 'Z' format
+    dt_utc = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    # put date to Europe/Madrid timezone, and format
+    return dt_utc.astimezone(MADRID).replace(tzinfo=None).isoformat(timespec="milliseconds")
+
+
+@lru_cache(maxsize=4096)
+def to_madrid_local(ts: str) -> str:
+    """
+    Receive date in ISO-8601 then transforms it on to Europe/Madrid date.
+    """
+    if not ts:                           # '', None…
+        return ts
+    return _convert(ts)
+
+
+def to_madrid_local_many(values: Iterable[str]) -> List[str]:
+    '''
+    Converts a batch of timestamps, each distinct value once, without filling the memo of the webhook path.
+    '''
+    values = list(values)
+    converted = {ts: (_convert(ts) if ts else ts) for ts in set(values)}
+    return [converted[ts] for ts in values]
+
+
+def localize_documents(docs: List[Dict], fields: Iterable[str]) -> List[Dict]:
+    '''
+    Converts in place the given timestamp fields of a list of documents, in a single batch.
+    '''
+    fields = [f for f in fields]
+    present = [(doc, f) for doc in docs for f in fields if f in doc]
+    for (doc, f), value in zip(present, to_madrid_local_many(doc[f] for doc, f in present)):
+        doc[f] = value
+    return docs
+
+
+DATETIME_SUFFIX = "_dt"     # created_date -> created_date_dt
+
+
+@lru_cache(maxsize=4096)
+def to_utc_datetime(ts: str) -> Optional[datetime]:
+    '''
+    Native (naive UTC, as BSON dates are) datetime of an ISO-8601 timestamp, None if it is empty or not a date.
+    Timestamps without offset are Madrid local times: the strings stored by to_madrid_local and the plain dates.
+    '''
+    if not ts or not isinstance(ts, str):
+        return None
+    try:
+        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=MADRID)
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def datetime_fields(spec: List[Field]) -> List[Field]:
+    '''
+    Native datetime companions (<target>_dt) of the fields of a spec converted with to_madrid_local, so LD Eval can
+    run range queries and date aggregations on them.
+    '''
+    return [Field(f"{f.target}{DATETIME_SUFFIX}", f.webhook, f.api, None, to_utc_datetime)
+            for f in spec if f.transform is to_madrid_local]
@@ -0,0 +1,87 @@
+'''
+Gunicorn runtime profile of LD Connect: gunicorn -c gunicorn.conf.py
+
+The webhooks are I/O bound (MongoDB, GitHub / Taiga / LD Eval APIs), so each worker serves several requests at once.
+GUNICORN_PROFILE picks the concurrency model:
+    gthread  (default) sync Flask app, GUNICORN_THREADS request threads per worker
+    gevent   Flask app on greenlets, GUNICORN_WORKER_CONNECTIONS per worker
+    uvicorn  async FastAPI app of asgi_app.py on uvicorn workers
+    sync     one request at a time per worker, the gunicorn default (for comparison only)
+Every value can be overridden with its GUNICORN_* variable. benchmarks/bench_gunicorn_profiles.py compares them.
+'''
+
+import importlib.util
+import os
+
+
+def _cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))     # CPUs of the container, not of the host
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+PROFILE = os.getenv("GUNICORN_PROFILE", "gthread").lower()
+CPUS = _cpus()
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# I/O-bound workload: more workers than CPUs, capped so the per-worker pools (MongoDB, HTTP) stay reasonable
+workers = _int("GUNICORN_WORKERS", min(2 * CPUS + 1, 9))
+
+if PROFILE == "uvicorn":
+    wsgi_app = "asgi_app:create_asgi_app()"
+    worker_class = "uvicorn.workers.UvicornWorker"
+    workers = _int("GUNICORN_WORKERS", min(CPUS + 1, 5))   # Each one keeps hundreds of deliveries in flight
+elif PROFILE == "gevent":
+    if importlib.util.find_spec("gevent") is None:
+        raise SystemExit("GUNICORN_PROFILE=gevent needs gevent, install requirements.txt or pip install gevent")
+    wsgi_app = "app:create_app()"
+    worker_class = "gevent"
+    worker_connections = _int("GUNICORN_WORKER_CONNECTIONS", 500)
+elif PROFILE == "sync":
+    wsgi_app = "app:create_app()"
+    worker_class = "sync"
+else:
+    wsgi_app = "app:create_app()"
+    worker_class = "gthread"
+    threads = _int("GUNICORN_THREADS", 8)
+
+# Recycle the workers now and then to bound the growth of the module-level caches, with jitter so they do not
+# all restart at once
+max_requests = _int("GUNICORN_MAX_REQUESTS", 5000)
+max_requests_jitter = _int("GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10)
+
+timeout = _int("GUNICORN_TIMEOUT", 60)
+graceful_timeout = _int("GUNICORN_GRACEFUL_TIMEOUT", 30)   # Time given to a stopping worker to drain its queue
+keepalive = _int("GUNICORN_KEEPALIVE", 5)
+
+accesslog = os.getenv("GUNICORN_ACCESSLOG") or None
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+
+def post_fork(server, worker):
+    '''
+    Creates the clients of the new worker (MongoDB pool, background threads) before it serves its first request,
+    none of them is inherited from the master.
+    '''
+    if PROFILE == "gevent":
+        return      # Not patched by gevent yet, create_app() starts them once it is
+    from processing.ingest import start as start_ingestion
+    start_ingestion()
+    server.log.info(f"Worker {worker.pid} initialised ({PROFILE} profile).")
+
+
+def worker_exit(server, worker):
+    '''
+    The worker stopped accepting requests (restart, max_requests, SIGTERM): finish the deliveries already queued
+    within the graceful timeout, what is left stays in the spool for the next worker.
+    '''
+    if PROFILE == "uvicorn":
+        return      # The ASGI lifespan drains the deliveries in flight
+    from processing.ingest import shutdown
+    shutdown(max(graceful_timeout - 5, 1))
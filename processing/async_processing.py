@@ -0,0 +1,227 @@
+'''
+Async ingestion path of the ASGI app (asgi_app.py).
+
+Deliveries are spooled and acknowledged with a 202 like in processing/ingest.py, but they are processed by tasks of the
+event loop instead of a pool of worker threads: a push waiting on the GitHub stats API holds a coroutine, so one
+process keeps hundreds of deliveries in flight. GitHub events are parsed with the shared parsers and stored through
+motor, the commit stats and the LD Eval notifications go through the async HTTP client. Taiga and Excel events make
+no upstream call with the local milestone stats, they run the shared sync processors on the thread pool.
+'''
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+import httpx
+from pymongo import UpdateOne
+
+from config.credentials_loader import resolve
+from config.settings import (ASGI_MAX_INFLIGHT, ENRICHMENT_MODE, EVAL_OUTBOX_ENABLED, EVAL_COALESCE_WINDOW,
+                             GITHUB_STATS_DEADLINE)
+from database.motor_client import get_async_collection
+from datasources.github_handler import parse_github_event
+from datasources.requests import async_http_client, commit_stats_cache
+from datasources.requests.github_api_call import commit_request, stats_of
+from processing import ingest as sync_ingest, delivery_dedup, taiga_dedup
+from processing.enrichment import new_batch, enqueue_commit_stats
+from processing.excel_processor import process_excel_event
+from processing.github_processor import collection_name_of, prepare_commits
+from processing.spool import Position
+from processing.taiga_processor import process_taiga_event
+from routes.API_publisher import eval_outbox, notification_coalescer
+from routes.API_publisher.API_event_publisher import eval_envelope, eval_url
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+ZERO_STATS = {"total": 0, "additions": 0, "deletions": 0}
+
+_INFLIGHT = set()       # Tasks of the deliveries being processed by this process
+_BACKGROUND = set()     # Other tasks left running (late commit stats), kept referenced but not counted as in flight
+
+
+async def _request_commit_stats(repo_full_name: str, commit_sha: str, token: str) -> Optional[Dict[str, int]]:
+    url, headers = commit_request(repo_full_name, commit_sha, token)
+    try:
+        response = await async_http_client.get("github", url, headers=headers)
+        response.raise_for_status()
+        stats = stats_of(response.json())
+    except Exception as exc:
+        logger.warning(f"Could not fetch stats of commit {commit_sha} of {repo_full_name}: {exc}")
+        return None
+    await anyio.to_thread.run_sync(commit_stats_cache.put, repo_full_name, commit_sha, stats)
+    return stats
+
+
+async def fetch_push_stats(repo_full_name: str, commit_shas: List[str], prj: str) -> Dict[str, Optional[Dict[str, int]]]:
+    '''
+    Async counterpart of github_api_call.fetch_push_stats, same deadline and results.
+    '''
+    if not commit_shas:
+        return {}
+    results = await anyio.to_thread.run_sync(commit_stats_cache.get_many, repo_full_name, commit_shas)
+    missing = [sha for sha in commit_shas if sha not in results]
+    if not missing:
+        return results
+
+    token = resolve(prj, "github_token")
+    tasks = {sha: asyncio.ensure_future(_request_commit_stats(repo_full_name, sha, token)) for sha in missing}
+    done, _ = await asyncio.wait(tasks.values(), timeout=GITHUB_STATS_DEADLINE)
+
+    for sha, task in tasks.items():
+        if task in done:
+            results[sha] = task.result() or dict(ZERO_STATS)
+        else:
+            results[sha] = None     # Keeps running, its result goes to the cache
+            _background(task)
+    pending = sum(1 for v in results.values() if v is None)
+    if pending:
+        logger.warning(f"Stats of {pending}/{len(commit_shas)} commits of {repo_full_name} not ready after {GITHUB_STATS_DEADLINE}s, stored as pending.")
+    return results
+
+
+async def insert_missing(coll, docs: List[Dict], key: str) -> Tuple[int, int]:
+    '''
+    Async counterpart of mongo_client.insert_missing.
+    '''
+    if not docs:
+        return 0, 0
+    res = await coll.bulk_write([UpdateOne({key: d[key]}, {"$setOnInsert": d}, upsert=True) for d in docs], ordered=False)
+    return res.upserted_count, res.matched_count
+
+
+async def publish_event(event_type: str, prj: str, author_login: str, quality_model: str) -> None:
+    '''
+    Async counterpart of notification_coalescer.publish_event.
+    '''
+    if EVAL_OUTBOX_ENABLED:
+        coll = await get_async_collection(eval_outbox.OUTBOX_COLLECTION)
+        await coll.insert_one(eval_outbox.new_row(event_type, prj, author_login, quality_model))
+        return
+    if EVAL_COALESCE_WINDOW > 0:
+        notification_coalescer.publish_event(event_type, prj, author_login, quality_model)     # In memory, no I/O
+        return
+    try:
+        resp = await async_http_client.post("eval", eval_url(), json=eval_envelope(event_type, prj, author_login, quality_model))
+        resp.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.error(f"Error al notificar a LD_Eval en {eval_url()}: {e}")
+
+
+async def process_github_event(raw_payload: Dict, prj: str, quality_model: str, event_name: str) -> Tuple[Dict, int]:
+    '''
+    Async counterpart of github_processor.process_github_event, same documents and notifications.
+    '''
+    raw_payload["X-GitHub-Event"] = event_name
+    deferred = ENRICHMENT_MODE == "deferred"
+    parsed_data = parse_github_event(raw_payload, prj, enrich=False)
+
+    if parsed_data.get("ignored"):
+        return {"status": "ignored", "event": parsed_data["event"]}, 200
+    if "error" in parsed_data:
+        return parsed_data, 400
+
+    if "commits" in parsed_data and not deferred:
+        commit_stats = await fetch_push_stats(parsed_data["repo_name"], [c["sha"] for c in parsed_data["commits"]], prj)
+        for commit_doc in parsed_data["commits"]:
+            stats = commit_stats.get(commit_doc["sha"])
+            commit_doc["stats"] = stats
+            commit_doc["stats_pending"] = stats is None
+
+    author_login = parsed_data["sender_info"]["login"]
+    collection_name = collection_name_of(parsed_data["event"], prj)
+    coll = await get_async_collection(collection_name)
+    pending_shas = [c["sha"] for c in parsed_data.get("commits", []) if c.get("stats_pending")]
+
+    if "commits" in parsed_data:
+        prepare_commits(parsed_data, prj)
+        inserted, existing = await insert_missing(coll, parsed_data["commits"], "sha")
+        logger.info(f"Inserting in MongoDB Github commits for team {prj}: {inserted} new, {existing} already stored")
+        if pending_shas:
+            batch = new_batch(event_name, prj, author_login, quality_model)
+            await anyio.to_thread.run_sync(enqueue_commit_stats, batch, prj, collection_name, parsed_data["repo_name"], pending_shas)
+            logger.info(f"{len(pending_shas)} commits of team {prj} queued for stats enrichment")
+        response = {"status": "ok", "message": "Commits inserted", "inserted": inserted, "already_present": existing}
+    elif "issue" in parsed_data:
+        parsed_data["prj"] = prj
+        await coll.insert_one(parsed_data)
+        response = {"status": "ok", "message": "Issue inserted"}
+    elif "pull_request" in parsed_data:
+        parsed_data["prj"] = prj
+        await coll.insert_one(parsed_data)
+        response = {"status": "ok", "message": "Pull request inserted"}
+    else:
+        await coll.insert_one(parsed_data)
+        response = {"status": "ok", "message": "Stored event doc"}
+
+    if not (deferred and pending_shas):
+        await publish_event(event_name, prj, author_login, quality_model)
+    return response, 200
+
+
+# Entry point of each source, all of them receive (raw_payload, prj, quality_model, headers)
+PROCESSORS = {
+    "github": lambda raw, prj, qm, headers: process_github_event(raw, prj, qm, headers.get("X-GitHub-Event")),
+    "taiga":  lambda raw, prj, qm, headers: anyio.to_thread.run_sync(process_taiga_event, raw, prj, qm),
+    "excel":  lambda raw, prj, qm, headers: anyio.to_thread.run_sync(process_excel_event, raw, prj, qm),
+}
+
+
+def _track(task: asyncio.Future) -> None:
+    _INFLIGHT.add(task)
+    task.add_done_callback(_INFLIGHT.discard)
+
+
+def _background(task: asyncio.Future) -> None:
+    _BACKGROUND.add(task)
+    task.add_done_callback(_BACKGROUND.discard)
+
+
+async def _run(source: str, raw_payload: Dict, prj: str, quality_model: str, headers: Dict, pos: Optional[Position]):
+    '''
+    Processes one delivery, acknowledges it in the spool and marks its GitHub delivery ID as processed. If it raises,
+    the delivery is moved to the dead letters of the spool and its ID is released.
+    '''
+    delivery_id = headers.get(delivery_dedup.DELIVERY_HEADER)
+    try:
+        result = await PROCESSORS[source](raw_payload, prj, quality_model, headers)
+    except Exception as e:
+        logger.exception(f"Processing of {source} delivery for team {prj} failed.")
+        metrics.inc("asgi.failed")
+        await anyio.to_thread.run_sync(sync_ingest.dead_letter, pos, f"{type(e).__name__}: {e}")
+        await anyio.to_thread.run_sync(delivery_dedup.release, delivery_id)
+        await anyio.to_thread.run_sync(taiga_dedup.release, headers.get(taiga_dedup.CONTENT_KEY_HEADER))
+        return
+    sync_ingest.ack(pos)
+    await anyio.to_thread.run_sync(delivery_dedup.finish, delivery_id, result)
+    await anyio.to_thread.run_sync(taiga_dedup.finish, headers.get(taiga_dedup.CONTENT_KEY_HEADER), result)
+    return result
+
+
+def inflight() -> int:
+    return len(_INFLIGHT)
+
+
+def ingest(source: str, raw_payload: Dict, body: bytes, prj: str, quality_model: str, headers: Dict):
+    '''
+    Spools a verified delivery and starts its processing in the event loop.
+    Returns the (body, status[, headers]) the webhook route must answer, 503 when ASGI_MAX_INFLIGHT are in flight.
+    '''
+    if len(_INFLIGHT) >= ASGI_MAX_INFLIGHT:
+        metrics.inc("asgi.rejected")
+        _background(asyncio.ensure_future(anyio.to_thread.run_sync(delivery_dedup.release, headers.get(delivery_dedup.DELIVERY_HEADER))))
+        return {"status": "error", "message": "Ingestion queue full"}, 503, {"Retry-After": "5"}
+    pos = sync_ingest.spool(source, body, prj, quality_model, headers)
+    _track(asyncio.ensure_future(_run(source, raw_payload, prj, quality_model, headers, pos)))
+    return {"status": "accepted"}, 202
+
+
+async def drain(timeout: float) -> bool:
+    '''
+    Waits for the deliveries in flight, at most timeout seconds. True if all of them finished.
+    '''
+    if not _INFLIGHT:
+        return True
+    _, pending = await asyncio.wait(list(_INFLIGHT), timeout=timeout)
+    return not pending
@@ -0,0 +1,166 @@
+'''
+Suppression of GitHub redeliveries, keyed on the X-GitHub-Delivery header.
+
+GitHub redelivers a webhook it thinks timed out, which happens when we are the busiest, and every redelivery would
+fetch the stats of its commits again and notify LD Eval once more. Each delivery is claimed before its body is decoded:
+  - already processed:          answered 200, nothing else is done
+  - in progress in some worker: answered 202, like the first one
+  - unknown or lease run out:   claimed by this worker and processed as usual
+The IDs are kept in memory (per process, bounded) in front of the github_deliveries collection shared by every worker,
+whose TTL index forgets them after DELIVERY_DEDUP_TTL. If MongoDB can not be reached the delivery is processed anyway:
+the commits are upserted on their sha, so a duplicate costs work, not data.
+'''
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from config.settings import DELIVERY_DEDUP_TTL, DELIVERY_DEDUP_LEASE, DELIVERY_DEDUP_MEMORY
+from database.mongo_client import get_collection
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+DELIVERIES_COLLECTION = "github_deliveries"
+DELIVERY_HEADER = "X-GitHub-Delivery"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+
+_RECENT = OrderedDict()     # delivery id -> (state, monotonic expiry), least recently seen first
+_LOCK = threading.Lock()
+_INDEX_READY = False
+
+
+def _collection():
+    global _INDEX_READY
+    coll = get_collection(DELIVERIES_COLLECTION)
+    if not _INDEX_READY:
+        coll.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        _INDEX_READY = True
+    return coll
+
+
+def _remember(delivery_id: str, state: str) -> None:
+    ttl = DELIVERY_DEDUP_TTL if state == DONE else DELIVERY_DEDUP_LEASE
+    with _LOCK:
+        _RECENT[delivery_id] = (state, time.monotonic() + ttl)
+        _RECENT.move_to_end(delivery_id)
+        while len(_RECENT) > DELIVERY_DEDUP_MEMORY:
+            _RECENT.popitem(last=False)
+
+
+def _recent(delivery_id: str) -> Optional[str]:
+    with _LOCK:
+        entry = _RECENT.get(delivery_id)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del _RECENT[delivery_id]
+            return None
+        _RECENT.move_to_end(delivery_id)
+        return entry[0]
+
+
+def _claim_stored(delivery_id: str) -> Optional[str]:
+    '''
+    Claims a delivery in the shared collection. None if this worker got it, else the state of the stored one.
+    '''
+    coll = _collection()
+    now = datetime.utcnow()
+    lease = {"lease_until": now + timedelta(seconds=DELIVERY_DEDUP_LEASE),
+             "expires_at": now + timedelta(seconds=DELIVERY_DEDUP_TTL)}
+    try:
+        coll.insert_one({"_id": delivery_id, "state": IN_PROGRESS, **lease})
+        return None
+    except DuplicateKeyError:
+        pass
+    # A worker that died or hung past its lease gives the delivery up to this one
+    taken = coll.update_one({"_id": delivery_id, "state": IN_PROGRESS, "lease_until": {"$lte": now}}, {"$set": lease})
+    if taken.modified_count:
+        return None
+    stored = coll.find_one({"_id": delivery_id}, {"state": 1})
+    return stored["state"] if stored else None      # Expired in between, nobody holds it
+
+
+def claim(delivery_id: Optional[str]) -> Optional[Tuple[Dict, int]]:
+    '''
+    Claims a GitHub delivery for this worker. Returns None if it must be processed, else the response to answer the
+    duplicate with. Deliveries without ID (or with the suppression disabled) are always processed.
+    '''
+    if not delivery_id or DELIVERY_DEDUP_TTL <= 0:
+        return None
+    state = _recent(delivery_id)
+    if state is None:
+        try:
+            state = _claim_stored(delivery_id)
+        except PyMongoError as e:
+            logger.warning(f"Could not check GitHub delivery {delivery_id}, processing it: {e}")
+        if state is None:
+            _remember(delivery_id, IN_PROGRESS)
+            metrics.inc("github.deliveries.unique")
+            return None
+        if state == DONE:
+            _remember(delivery_id, DONE)
+
+    if state == DONE:
+        metrics.inc("github.deliveries.duplicate_done")
+        logger.info(f"GitHub delivery {delivery_id} already processed, skipped.")
+        return {"status": "duplicate", "delivery": delivery_id}, 200
+    metrics.inc("github.deliveries.duplicate_in_progress")
+    logger.info(f"GitHub delivery {delivery_id} still in progress, skipped.")
+    return {"status": "accepted", "duplicate": True}, 202
+
+
+def complete(delivery_id: Optional[str]) -> None:
+    '''
+    Marks a delivery as processed, its redeliveries are answered 200 until DELIVERY_DEDUP_TTL.
+    '''
+    if not delivery_id or DELIVERY_DEDUP_TTL <= 0:
+        return
+    _remember(delivery_id, DONE)
+    expires_at = datetime.utcnow() + timedelta(seconds=DELIVERY_DEDUP_TTL)
+    try:
+        _collection().update_one({"_id": delivery_id}, {"$set": {"state": DONE, "expires_at": expires_at},
+                                                        "$unset": {"lease_until": ""}}, upsert=True)
+    except PyMongoError as e:
+        logger.warning(f"Could not mark GitHub delivery {delivery_id} as processed: {e}")
+
+
+def finish(delivery_id: Optional[str], result) -> None:
+    '''
+    Marks a delivery as processed if its processor answered a 2xx, else releases it so a redelivery is processed.
+    '''
+    if 200 <= result[1] < 300:
+        complete(delivery_id)
+    else:
+        release(delivery_id)
+
+
+def release(delivery_id: Optional[str]) -> None:
+    '''
+    Gives up the claim of a delivery that was not processed (failed or rejected), so its redelivery is processed.
+    '''
+    if not delivery_id or DELIVERY_DEDUP_TTL <= 0:
+        return
+    with _LOCK:
+        _RECENT.pop(delivery_id, None)
+    try:
+        _collection().delete_one({"_id": delivery_id, "state": IN_PROGRESS})
+    except PyMongoError as e:
+        logger.warning(f"Could not release GitHub delivery {delivery_id}, it is retried after its lease: {e}")
+
+
+def dedup_rate() -> Dict[str, float]:
+    '''
+    Gauge of the GitHub deliveries received by this process and the share of them that were redeliveries.
+    '''
+    counts = metrics.counters("github.deliveries.")
+    duplicates = counts.get("github.deliveries.duplicate_done", 0) + counts.get("github.deliveries.duplicate_in_progress", 0)
+    total = duplicates + counts.get("github.deliveries.unique", 0)
+    return {"total": total, "duplicates": duplicates, "rate": duplicates / total if total else 0.0}
@@ -0,0 +1,232 @@
+'''
+Background enrichment of stored events.
+
+Events that were stored without their API data (commit stats, Taiga milestone stats) get a row in the
+"enrichment_jobs" work table. Enricher threads claim batches of rows with a lease, so several workers (or several
+processes) can drain the table without processing the same row twice, fill the missing fields in the event documents
+and notify LD Eval once every row of a delivery is completed.
+'''
+
+import argparse
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from config.settings import (ENRICHMENT_WORKERS, ENRICHMENT_BATCH_SIZE, ENRICHMENT_LEASE_SECONDS,
+                             ENRICHMENT_POLL_SECONDS, ENRICHMENT_MAX_ATTEMPTS)
+from config.logger_config import setup_logging
+from database.mongo_client import get_collection
+from datasources.requests.github_api_call import fetch_push_stats
+from datasources.requests.taiga_api_call import milestone_stats
+from routes.API_publisher.notification_coalescer import publish_event
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = "enrichment_jobs"
+
+_PID = None
+_LOCK = threading.Lock()
+_INDEX_READY = False
+
+
+def _jobs():
+    global _INDEX_READY
+    coll = get_collection(JOBS_COLLECTION)
+    if not _INDEX_READY:
+        coll.create_index([("lease_until", ASCENDING), ("created_at", ASCENDING)])
+        coll.create_index([("batch_id", ASCENDING)])
+        coll.create_index([("owner", ASCENDING)])
+        _INDEX_READY = True
+    return coll
+
+
+def new_batch(event_type: str, prj: str, author_login: str, quality_model: str) -> Dict:
+    '''
+    Creates the description of a delivery whose enrichment is deferred. LD Eval is notified with these values
+    when the last enrichment of the batch is completed.
+    '''
+    return {
+        "batch_id": uuid.uuid4().hex,
+        "notify": {"event_type": event_type, "prj": prj, "author_login": author_login, "quality_model": quality_model},
+    }
+
+
+def _enqueue(batch: Dict, rows: List[Dict]) -> None:
+    if not rows:
+        return
+    now = datetime.utcnow()
+    for row in rows:
+        row.update({"batch_id": batch["batch_id"], "notify": batch["notify"],
+                    "created_at": now, "lease_until": now, "owner": None, "attempts": 0})
+    _jobs().insert_many(rows, ordered=False)
+
+
+def enqueue_commit_stats(batch: Dict, prj: str, collection_name: str, repo_full_name: str, shas: List[str]) -> None:
+    '''
+    Registers the commits of a push whose stats must be filled in the background.
+    '''
+    _enqueue(batch, [{"kind": "commit_stats", "prj": prj, "collection": collection_name,
+                      "repo": repo_full_name, "key": "sha", "key_value": sha} for sha in shas])
+
+
+def enqueue_milestone_stats(batch: Dict, prj: str, collection_name: str, key: str, key_value, project_id, milestone_id) -> None:
+    '''
+    Registers a Taiga task / user story whose milestone_* fields must be filled in the background.
+    '''
+    _enqueue(batch, [{"kind": "milestone_stats", "prj": prj, "collection": collection_name, "key": key,
+                      "key_value": key_value, "project_id": project_id, "milestone_id": milestone_id}])
+
+
+def _claim(owner: str) -> List[Dict]:
+    '''
+    Leases up to ENRICHMENT_BATCH_SIZE rows whose lease is free or expired. Three round-trips whatever the batch size:
+    pick candidates, lease the ones still free with our owner token, read back what we got.
+    '''
+    coll = _jobs()
+    now = datetime.utcnow()
+    candidates = [d["_id"] for d in coll.find({"lease_until": {"$lte": now}}, {"_id": 1})
+                  .sort("created_at", ASCENDING).limit(ENRICHMENT_BATCH_SIZE)]
+    if not candidates:
+        return []
+    coll.update_many(
+        {"_id": {"$in": candidates}, "lease_until": {"$lte": now}},
+        {"$set": {"owner": owner, "lease_until": now + timedelta(seconds=ENRICHMENT_LEASE_SECONDS)}, "$inc": {"attempts": 1}},
+    )
+    return list(coll.find({"owner": owner, "_id": {"$in": candidates}}))
+
+
+def _enrich_commits(rows: List[Dict]) -> List[Dict]:
+    '''
+    Fills the stats of the claimed commits, one fan-out per repository. Returns the rows completed.
+    '''
+    done = []
+    by_repo = defaultdict(list)
+    for row in rows:
+        by_repo[(row["prj"], row["repo"], row["collection"])].append(row)
+
+    for (prj, repo, collection_name), repo_rows in by_repo.items():
+        stats = fetch_push_stats(repo, [r["key_value"] for r in repo_rows], prj)
+        operations = []
+        for r in repo_rows:
+            if stats.get(r["key_value"]) is None:
+                continue        # Not ready yet, the lease expires and it is retried
+            operations.append(UpdateOne({"sha": r["key_value"]}, {"$set": {"stats": stats[r["key_value"]], "stats_pending": False}}))
+            done.append(r)
+        if operations:
+            get_collection(collection_name).bulk_write(operations, ordered=False)
+    return done
+
+
+def _enrich_milestones(rows: List[Dict]) -> List[Dict]:
+    '''
+    Fills the milestone_* fields of the claimed tasks / user stories, one Taiga call per milestone. Returns the rows completed.
+    '''
+    done = []
+    by_milestone = defaultdict(list)
+    for row in rows:
+        by_milestone[(row["prj"], row["project_id"], row["milestone_id"])].append(row)
+
+    for (prj, project_id, milestone_id), ms_rows in by_milestone.items():
+        try:
+            stats = milestone_stats(project_id, milestone_id, prj)
+        except Exception as e:
+            logger.warning(f"Could not fetch stats of milestone {milestone_id}: {e}")
+            continue
+        operations = defaultdict(list)
+        for r in ms_rows:
+            operations[r["collection"]].append(
+                UpdateOne({r["key"]: r["key_value"]}, {"$set": {**stats, "milestone_stats_pending": False}}))
+            done.append(r)
+        for collection_name, ops in operations.items():
+            get_collection(collection_name).bulk_write(ops, ordered=False)
+    return done
+
+
+def _complete(done: List[Dict], claimed: List[Dict]) -> None:
+    '''
+    Removes the completed rows (and the ones out of attempts) and notifies LD Eval for every delivery fully enriched.
+    '''
+    coll = _jobs()
+    done_ids = {r["_id"] for r in done}
+    dropped = [r for r in claimed if r["_id"] not in done_ids and r["attempts"] >= ENRICHMENT_MAX_ATTEMPTS]
+    for r in dropped:
+        logger.error(f"Giving up enrichment {r['kind']} of {r['collection']} {r['key']}={r['key_value']} after {r['attempts']} attempts.")
+    finished = [r for r in claimed if r["_id"] in done_ids] + dropped
+    if not finished:
+        return
+    coll.delete_many({"_id": {"$in": [r["_id"] for r in finished]}})
+
+    batches = {r["batch_id"]: r["notify"] for r in finished}
+    for batch_id, notify in batches.items():
+        if coll.count_documents({"batch_id": batch_id}, limit=1):
+            continue        # Other rows of the delivery are still pending
+        logger.info(f"Enrichment of {notify['event_type']} for team {notify['prj']} completed, notifying LD_EVAL.")
+        try:
+            publish_event(notify["event_type"], notify["prj"], notify["author_login"], notify["quality_model"])
+        except Exception as e:
+            logger.error(f"Error notifying LD_EVAL: {e}")
+
+
+def run_once(owner: Optional[str] = None) -> int:
+    '''
+    Claims and processes one batch of pending enrichments. Returns the number of rows claimed.
+    '''
+    owner = owner or uuid.uuid4().hex
+    claimed = _claim(owner)
+    if not claimed:
+        return 0
+    done = _enrich_commits([r for r in claimed if r["kind"] == "commit_stats"])
+    done += _enrich_milestones([r for r in claimed if r["kind"] == "milestone_stats"])
+    _complete(done, claimed)
+    logger.info(f"Enrichment batch: {len(claimed)} claimed, {len(done)} completed.")
+    return len(claimed)
+
+
+def _loop() -> None:
+    owner = f"{os.getpid()}-{threading.get_ident()}-{uuid.uuid4().hex[:8]}"
+    while True:
+        try:
+            if run_once(owner):
+                continue
+        except PyMongoError as e:
+            logger.warning(f"Enrichment worker could not reach MongoDB: {e}")
+        except Exception:
+            logger.exception("Enrichment batch failed.")
+        time.sleep(ENRICHMENT_POLL_SECONDS)
+
+
+def start() -> None:
+    '''
+    Starts the enricher threads of the current process, once per process (after the fork).
+    '''
+    global _PID
+    if _PID == os.getpid():
+        return
+    with _LOCK:
+        if _PID == os.getpid():
+            return
+        _PID = os.getpid()
+        for idx in range(ENRICHMENT_WORKERS):
+            threading.Thread(target=_loop, name=f"enricher-{idx}", daemon=True).start()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Drains the pending enrichments (commit stats, milestone stats) of the stored events")
+    ap.add_argument("--once", action="store_true", help="Process the current backlog and exit instead of polling forever")
+    ns = ap.parse_args()
+    if ns.once:
+        while run_once():
+            pass
+    else:
+        _loop()
+
+# In order to execute this script: python -m processing.enrichment --once
@@ -0,0 +1,30 @@
+from typing import Dict, Tuple
+import logging
+
+from datasources.excel_handler import parse_excel_event
+from database.mongo_client import get_collection
+
+logger = logging.getLogger(__name__)
+
+
+def process_excel_event(raw_json: Dict, prj: str, quality_model: str) -> Tuple[Dict, int]:
+    '''
+    Parses an Excel (Google Sheets) delivery and stores it in MongoDB.
+    Runs in the ingestion workers, returns the (body, status) that the route would answer if it was processed inline.
+    '''
+    # Parse the raw JSON payload using the parse_excel_event function
+    parsed_data = parse_excel_event(raw_json, prj, quality_model)
+    if "error" in parsed_data:
+        return parsed_data, 400
+    logger.info("Excel webhook request processed successfully.")
+
+    # Create the collection name based on the project ID
+    collection_name = f"{prj}_sheets"
+
+    coll = get_collection(collection_name)
+
+    logger.info(f"Inserting Excel activity document for team {prj}")
+    # Insert the parsed data into the MongoDB collection
+    coll.insert_one(parsed_data)
+
+    return {"status": "OK"}, 200
@@ -0,0 +1,107 @@
+from typing import Dict, Tuple
+import logging
+
+from datasources.github_handler import parse_github_event
+from database.mongo_client import get_collection, insert_missing
+from routes.API_publisher.notification_coalescer import publish_event
+from processing.enrichment import new_batch, enqueue_commit_stats
+from config.settings import ENRICHMENT_MODE
+
+logger = logging.getLogger(__name__)
+
+# Mongo collection of each parsed GitHub event
+GITHUB_COLLECTIONS = {
+    "commit":       "github_{prj}.commits",
+    "issue":        "{prj}_issues",
+    "pull_request": "github_{prj}.pull_requests",
+}
+
+
+def collection_name_of(event_label: str, prj: str) -> str:
+    return GITHUB_COLLECTIONS[event_label].format(prj=prj)
+
+
+def prepare_commits(parsed_data: Dict, prj: str) -> None:
+    '''
+    Copies the push-level fields to each commit document of a parsed push.
+    '''
+    for commit_doc in parsed_data["commits"]:
+        # add top-level fields to each commit if you want
+        commit_doc["team_name"] = parsed_data["team_name"]
+        commit_doc["prj"] = prj
+        commit_doc["sender_info"] = parsed_data["sender_info"]
+        commit_doc["event"] = parsed_data["event"]
+        commit_doc["repo_name"] = parsed_data["repo_name"]
+
+
+def process_github_event(raw_payload: Dict, prj: str, quality_model: str, event_name: str) -> Tuple[Dict, int]:
+    '''
+    Parses a verified GitHub delivery, stores it in MongoDB and notifies LD_EVAL.
+    Runs in the ingestion workers, returns the (body, status) that the route would answer if it was processed inline.
+    '''
+    raw_payload["X-GitHub-Event"] = event_name  # Put it in the JSON so parse function sees it
+
+    # Parse the raw JSON payload using the parse_github_event function. In deferred mode the commit stats are filled later
+    deferred = ENRICHMENT_MODE == "deferred"
+    parsed_data = parse_github_event(raw_payload, prj, enrich=not deferred)
+    logger.info(f"Github webhook request processed successfully for team {prj}.")
+
+    if parsed_data.get("ignored"):
+        return {"status": "ignored", "event": parsed_data["event"]}, 200
+    if "error" in parsed_data:
+        return parsed_data, 400
+
+    team_name = parsed_data["team_name"] #We wont use this, we will use the external_id instead as its a CENTRALIZED ID
+    event_label = parsed_data["event"] #This is either "commit" or "issue"
+    author_login = parsed_data["sender_info"]["login"] #username of the author of the commit or issue
+
+    # Decide the name of the MongoDB collection to write to, depending on the event type
+    collection_name = collection_name_of(event_label, prj)
+    coll = get_collection(collection_name)
+
+    # Commits without stats (deferred mode, or not ready before the deadline) are completed by the enricher
+    pending_shas = [c["sha"] for c in parsed_data.get("commits", []) if c.get("stats_pending")]
+
+    # If it's a commit push, we may have multiple commits. All of them are written in one round-trip, keyed on the sha
+    if "commits" in parsed_data:
+        prepare_commits(parsed_data, prj)
+        inserted, existing = insert_missing(coll, parsed_data["commits"], "sha")
+        logger.info(f"Inserting in MongoDB Github commits for team {prj}: {inserted} new, {existing} already stored")
+
+        if pending_shas:
+            batch = new_batch(event_name, prj, author_login, quality_model)
+            enqueue_commit_stats(batch, prj, collection_name, parsed_data["repo_name"], pending_shas)
+            logger.info(f"{len(pending_shas)} commits of team {prj} queued for stats enrichment")
+
+        response = {"status": "ok", "message": "Commits inserted", "inserted": inserted, "already_present": existing}
+
+    # If it's an issue event, we insert the issue document
+    elif "issue" in parsed_data:
+        parsed_data["prj"] = prj
+        coll.insert_one(parsed_data)
+        logger.info(f"Inserting in MongoDB Github issue for team {prj}")
+        response = {"status": "ok", "message": "Issue inserted"}
+
+    elif "pull_request" in parsed_data:
+        parsed_data["prj"] = prj
+        coll.insert_one(parsed_data)
+        logger.info(f"Inserting in MongoDB Github closed pull request for team {prj}")
+        response = {"status": "ok", "message": "Pull request inserted"}
+
+    #If its neither a commit or a issue
+    else:
+        coll.insert_one(parsed_data)
+        response = {"status": "ok", "message": "Stored event doc"}
+
+    # # COMMUNICATION WITH LD_EVAL USING API
+    # Only once the documents are stored, so LD_EVAL never recalculates without them.
+    # In deferred mode the enricher notifies LD_EVAL once the stats of the push are filled
+    if not (deferred and pending_shas):
+        logger.info(f"Notifying LD_EVAL about event: {event_name} for team with external_id: {prj} with quality_model: {quality_model}")
+        try:
+            publish_event(event_name, prj, author_login, quality_model)
+        except Exception as e:
+            logger.error(f"Error notifying LD_EVAL: {e}")
+            return {"status": "error", "message": str(e)}, 500
+
+    return response, 200
@@ -0,0 +1,212 @@
+import argparse
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from config.settings import EVAL_OUTBOX_ENABLED, MILESTONE_STATS_SOURCE, SPOOL_DIR, SPOOL_SEGMENT_MB, SPOOL_FSYNC_INTERVAL_MS, SPOOL_FSYNC_BATCH
+from config.logger_config import setup_logging
+from database import mongo_client
+from processing import work_queue, enrichment, milestone_aggregates, delivery_dedup, taiga_dedup
+from processing.spool import Spool, Position, append_dead_letter, take_dead_letters
+from datasources.github_decoders import decode_github_payload
+from processing.github_processor import process_github_event
+from processing.taiga_processor import process_taiga_event
+from processing.excel_processor import process_excel_event
+from routes.API_publisher import eval_outbox
+from utils import json_codec, metrics
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+_SPOOL = None          # Spool of this process, None if SPOOL_DIR is not set
+_PID = None
+_LOCK = threading.Lock()
+
+
+# Entry point of each source, all of them receive (raw_payload, prj, quality_model, headers)
+PROCESSORS = {
+    "github": lambda raw, prj, qm, headers: process_github_event(raw, prj, qm, headers.get("X-GitHub-Event")),
+    "taiga":  lambda raw, prj, qm, headers: process_taiga_event(raw, prj, qm),
+    "excel":  lambda raw, prj, qm, headers: process_excel_event(raw, prj, qm),
+}
+
+
+def _run(source: str, raw_payload: Dict, prj: str, quality_model: str, headers: Dict, pos: Optional[Position]):
+    '''
+    Processes one delivery, acknowledges it in the spool and marks its GitHub delivery ID as processed (released
+    instead if the processor answered an error, so a redelivery is processed, like the Taiga deduplication key).
+    If the processing raises, the delivery is moved to the dead letters of the spool (a restart would fail on it again
+    and replay everything after it) and its ID is released so a redelivery is processed.
+    '''
+    delivery_id = headers.get(delivery_dedup.DELIVERY_HEADER)
+    content_key = headers.get(taiga_dedup.CONTENT_KEY_HEADER)
+    try:
+        result = PROCESSORS[source](raw_payload, prj, quality_model, headers)
+    except Exception as e:
+        dead_letter(pos, f"{type(e).__name__}: {e}")
+        delivery_dedup.release(delivery_id)
+        taiga_dedup.release(content_key)
+        raise
+    ack(pos)
+    delivery_dedup.finish(delivery_id, result)
+    taiga_dedup.finish(content_key, result)
+    return result
+
+
+def _open_spool() -> list:
+    global _SPOOL
+    _SPOOL = Spool(SPOOL_DIR, SPOOL_SEGMENT_MB * 1024 * 1024, SPOOL_FSYNC_INTERVAL_MS, SPOOL_FSYNC_BATCH)
+    return _SPOOL.open()
+
+
+def _decode(meta: Dict, body: bytes) -> Dict:
+    if meta["source"] == "github":
+        raw_payload = decode_github_payload(meta.get("headers", {}).get("X-GitHub-Event"), body)
+        if raw_payload is None:
+            raise json_codec.DecodeError("invalid JSON body")
+        return raw_payload
+    return json_codec.loads(body)
+
+
+def _replay(pending: list, inline: bool = False) -> int:
+    '''
+    Feeds the deliveries left in the spool by a previous run to the usual parse + persistence path.
+    A record that can not be decoded is moved to the dead letters, the replay goes on with the next one.
+    '''
+    count = 0
+    for pos, meta, body in _SPOOL.records(pending):
+        try:
+            raw_payload = _decode(meta, body)
+        except Exception as e:
+            dead_letter(pos, f"undecodable body: {e}")
+            continue
+        args = (meta["source"], raw_payload, meta.get("prj"), meta.get("quality_model"), meta.get("headers", {}), pos)
+        if inline:
+            try:
+                _run(*args)
+            except Exception:
+                logger.exception(f"Replay of spooled {meta['source']} delivery failed.")
+        else:
+            work_queue.submit_wait(f"replay:{meta['source']}:{meta.get('prj')}", _run, *args)
+        count += 1
+    logger.info(f"Replayed {count} spooled deliveries.")
+    return count
+
+
+def replay_dead_letters(directory: str) -> int:
+    '''
+    Processes again the dead-lettered deliveries of a spool directory, inline. The ones failing again are put back.
+    Returns the number processed.
+    '''
+    processed = 0
+    for meta, body, _ in take_dead_letters(directory):
+        try:
+            PROCESSORS[meta["source"]](_decode(meta, body), meta.get("prj"), meta.get("quality_model"), meta.get("headers", {}))
+            processed += 1
+        except Exception as e:
+            logger.exception(f"Dead-lettered {meta['source']} delivery for team {meta.get('prj')} failed again.")
+            append_dead_letter(directory, meta, body, f"{type(e).__name__}: {e}")
+    return processed
+
+
+def start() -> None:
+    '''
+    Opens the spool of this process (if enabled) and replays its backlog in the background, and starts the enrichers,
+    the outbox dispatcher and the milestone reconciliation. The MongoDB pool is pre-warmed in the background.
+    Called once per worker process, after the fork.
+    '''
+    global _PID
+    if _PID == os.getpid():
+        return
+    with _LOCK:
+        if _PID == os.getpid():
+            return
+        _PID = os.getpid()
+        # Open the MongoDB connections of this worker now rather than on its first webhook
+        threading.Thread(target=mongo_client.prewarm, name="mongo-prewarm", daemon=True).start()
+        metrics.register_gauge("ingest.queue_depth", work_queue.depth)
+        metrics.register_gauge("github.deliveries.dedup", delivery_dedup.dedup_rate)
+        enrichment.start()
+        if EVAL_OUTBOX_ENABLED:
+            eval_outbox.start()
+        if MILESTONE_STATS_SOURCE == "local":
+            milestone_aggregates.start()
+        if not SPOOL_DIR:
+            return
+        pending = _open_spool()
+        if pending:
+            threading.Thread(target=_replay, args=(pending,), name="spool-replay", daemon=True).start()
+
+
+def spool(source: str, body: bytes, prj: str, quality_model: str, headers: Dict) -> Optional[Position]:
+    '''
+    Appends a verified delivery to the spool of this process, None if the spool is disabled.
+    '''
+    if _SPOOL is None:
+        return None
+    meta = {"source": source, "prj": prj, "quality_model": quality_model, "headers": headers}
+    return _SPOOL.append(meta, body)
+
+
+def ack(pos: Optional[Position]) -> None:
+    '''
+    Marks a spooled delivery as processed, it will not be replayed.
+    '''
+    if pos is not None and _SPOOL is not None:
+        _SPOOL.ack(pos)
+
+
+def dead_letter(pos: Optional[Position], error: str) -> None:
+    '''
+    Moves a spooled delivery that could not be processed to the dead letters, it will not be replayed on restart.
+    '''
+    if pos is not None and _SPOOL is not None:
+        _SPOOL.dead_letter(pos, error)
+
+
+def ingest(source: str, raw_payload: Dict, body: bytes, prj: str, quality_model: str, headers: Dict):
+    '''
+    Spools a verified delivery and hands it to the ingestion workers.
+    Returns the response the webhook route must answer.
+    '''
+    start()
+    pos = spool(source, body, prj, quality_model, headers)
+    outcome = work_queue.submit(f"{source}:{prj}", _run, source, raw_payload, prj, quality_model, headers, pos)
+    if outcome[0] == "rejected":
+        # The sender gets a 503 and will redeliver it, keeping it would process it twice
+        ack(pos)
+        delivery_dedup.release(headers.get(delivery_dedup.DELIVERY_HEADER))
+    return work_queue.accepted_response(outcome)
+
+
+def shutdown(timeout: float = 30) -> bool:
+    '''
+    Waits up to timeout seconds for the queued deliveries of this process, then closes its spool. The deliveries not
+    finished in time stay in the spool (left open, the workers may still ack) and are replayed by the next worker.
+    Returns True if the queue was drained.
+    '''
+    drained = work_queue.drain(timeout)
+    if not drained:
+        logger.warning(f"{work_queue.depth()} deliveries still queued after {timeout}s, left in the spool.")
+    elif _SPOOL is not None and _PID == os.getpid():
+        _SPOOL.close()
+    return drained
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Replays the webhook deliveries left in the spool while LD Connect was down")
+    ap.add_argument("--spool-dir", default=SPOOL_DIR, help="Spool directory, by default the SPOOL_DIR setting")
+    ap.add_argument("--dead-letters", action="store_true", help="Retry the dead-lettered deliveries instead")
+    ns = ap.parse_args()
+    if not ns.spool_dir:
+        raise SystemExit("No spool directory configured, set SPOOL_DIR or use --spool-dir.")
+
+    SPOOL_DIR = ns.spool_dir
+    if ns.dead_letters:
+        logger.info(f"Processed {replay_dead_letters(SPOOL_DIR)} dead-lettered deliveries.")
+    else:
+        _replay(_open_spool(), inline=True)
+        _SPOOL.close()
+
+# In order to execute this script: python -m processing.ingest --spool-dir /data/spool [--dead-letters]
@@ -0,0 +1,286 @@
+'''
+Per-milestone statistics computed from the stored Taiga documents instead of the Taiga stats API.
+
+Every milestone has a document in "taiga_{prj}.milestones" with its point, user story and task counters. The Taiga
+processor keeps them current: when a task or user story is upserted or deleted, the contribution of its previous state
+is subtracted and the one of its new state added with a single $inc per milestone. A reconciliation pass compares the
+counters with the Taiga API and corrects the drift (missed webhooks, changes made while LD Connect was down).
+The counters of a project are built from its stored documents before its first change is applied, so the documents
+stored before the local stats were enabled count too. One worker builds them while the others wait (lease and state in
+"milestone_aggregates_state").
+'''
+
+import argparse
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, ReplaceOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from config.settings import MILESTONE_RECONCILE_SECONDS
+from config.logger_config import setup_logging
+from database.mongo_client import db, get_collection
+from datasources.requests.taiga_api_call import fetch_milestone_stats
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+AGGREGATE_FIELDS = ("total_points", "closed_points", "total_userstories", "completed_userstories",
+                    "total_tasks", "completed_tasks")
+LEASE_COLLECTION = "milestone_reconcile_lease"
+STATE_COLLECTION = "milestone_aggregates_state"
+BUILDING, BUILT = "building", "built"
+BUILD_LEASE_SECONDS = 300       # A builder that died is replaced after this long
+BUILD_POLL_SECONDS = 0.2
+
+_PID = None
+_LOCK = threading.Lock()
+_BUILT = set()              # Projects whose counters are known to be built
+
+
+def collection_name(prj: str) -> str:
+    return f"taiga_{prj}.milestones"
+
+
+def _contribution(kind: str, doc: Optional[Dict]) -> Tuple[Optional[str], Dict[str, float]]:
+    '''
+    Milestone of a stored task / user story and what it adds to the counters of that milestone.
+    '''
+    if not doc or not doc.get("milestone_id"):
+        return None, {}
+    closed = doc.get("is_closed") is True
+    if kind == "task":
+        return doc["milestone_id"], {"total_tasks": 1, "completed_tasks": int(closed)}
+    points = doc.get("total_points") or 0
+    return doc["milestone_id"], {"total_userstories": 1, "completed_userstories": int(closed),
+                                 "total_points": points, "closed_points": points if closed else 0}
+
+
+def stats(aggregate: Optional[Dict]) -> Dict[str, float]:
+    '''
+    milestone_* fields stored in the tasks and user stories, as returned by taiga_api_call.milestone_stats.
+    '''
+    if not aggregate:
+        return {}
+    return {f"milestone_{field}": aggregate.get(field, 0) for field in AGGREGATE_FIELDS}
+
+
+def apply_change(prj: str, kind: str, old: Optional[Dict], new: Optional[Dict]) -> Dict[str, float]:
+    '''
+    Moves the contribution of a task or user story (kind "task" / "userstory") from its previous state old to its
+    new state new (None when it did not exist / was deleted). Returns the stats of its milestone after the change,
+    empty if the new state has no milestone.
+    '''
+    changes = defaultdict(lambda: defaultdict(int))
+    project_ids = {}
+    for doc, sign in ((old, -1), (new, 1)):
+        milestone_id, deltas = _contribution(kind, doc)
+        if milestone_id is None:
+            continue
+        project_ids[milestone_id] = doc.get("project_id")
+        for field, value in deltas.items():
+            changes[milestone_id][field] += sign * value
+
+    coll = get_collection(collection_name(prj))
+    new_milestone = _contribution(kind, new)[0]
+    result = {}
+    for milestone_id, deltas in changes.items():
+        inc = {field: value for field, value in deltas.items() if value}
+        update = {"$setOnInsert": {"project_id": project_ids[milestone_id]}}
+        if inc:
+            update["$inc"] = inc
+        if milestone_id == new_milestone:
+            result = stats(coll.find_one_and_update({"_id": milestone_id}, update, upsert=True,
+                                                    return_document=ReturnDocument.AFTER))
+        elif inc:
+            coll.update_one({"_id": milestone_id}, update, upsert=True)
+    return result
+
+
+def _recompute(prj: str) -> int:
+    '''
+    Overwrites the counters of every milestone of a project with the ones computed from its stored documents.
+    '''
+    closed = {"$cond": [{"$eq": ["$is_closed", True]}, 1, 0]}
+    with_milestone = {"$match": {"milestone_id": {"$nin": ["", None]}}}
+    aggregates = defaultdict(lambda: dict.fromkeys(AGGREGATE_FIELDS, 0))
+
+    for row in get_collection(f"taiga_{prj}.tasks").aggregate([with_milestone, {"$group": {
+            "_id": "$milestone_id", "project_id": {"$first": "$project_id"},
+            "total_tasks": {"$sum": 1}, "completed_tasks": {"$sum": closed}}}]):
+        aggregates[row.pop("_id")].update(row)
+
+    points = {"$ifNull": ["$total_points", 0]}
+    for row in get_collection(f"taiga_{prj}.userstories").aggregate([with_milestone, {"$group": {
+            "_id": "$milestone_id", "project_id": {"$first": "$project_id"},
+            "total_userstories": {"$sum": 1}, "completed_userstories": {"$sum": closed},
+            "total_points": {"$sum": points},
+            "closed_points": {"$sum": {"$cond": [{"$eq": ["$is_closed", True]}, points, 0]}}}}]):
+        aggregates[row.pop("_id")].update(row)
+
+    coll = get_collection(collection_name(prj))
+    if aggregates:
+        coll.bulk_write([ReplaceOne({"_id": mid}, agg, upsert=True) for mid, agg in aggregates.items()], ordered=False)
+    coll.delete_many({"_id": {"$nin": list(aggregates)}})
+    logger.info(f"Rebuilt the aggregates of {len(aggregates)} milestones for team {prj}")
+    return len(aggregates)
+
+
+def _mark_built(prj: str, query: Dict) -> None:
+    get_collection(STATE_COLLECTION).update_one(
+        query, {"$set": {"state": BUILT, "rebuilt_at": datetime.utcnow()}, "$unset": {"owner": "", "lease_until": ""}},
+        upsert="owner" not in query)
+    _BUILT.add(prj)
+
+
+def rebuild(prj: str) -> int:
+    '''
+    Recomputes the counters of every milestone of a project from its stored tasks and user stories.
+    Run it after writing tasks / user stories without apply_change() (bulk recovery, switching MILESTONE_STATS_SOURCE
+    from "api" back to "local"). The webhooks do not wait for it: a change applied while it runs may be lost or
+    counted twice until the next reconciliation. Returns the number of milestones written.
+    '''
+    written = _recompute(prj)
+    _mark_built(prj, {"_id": prj})
+    return written
+
+
+def _claim_build(prj: str, owner: str) -> str:
+    '''
+    BUILT if the counters of a project are built, BUILDING if another caller is building them, else takes the build
+    lease (inserted first, or taken over from a builder past its lease) and returns owner.
+    '''
+    coll = get_collection(STATE_COLLECTION)
+    now = datetime.utcnow()
+    lease = {"owner": owner, "lease_until": now + timedelta(seconds=BUILD_LEASE_SECONDS)}
+    try:
+        before = coll.find_one_and_update({"_id": prj}, {"$setOnInsert": {"state": BUILDING, **lease}}, upsert=True,
+                                          return_document=ReturnDocument.BEFORE)
+    except DuplicateKeyError:
+        return BUILDING     # Inserted by another caller at the same time
+    if before is None:
+        return owner
+    if before.get("state", BUILT) == BUILT:
+        return BUILT
+    taken = coll.update_one({"_id": prj, "state": BUILDING, "lease_until": {"$lte": now}}, {"$set": lease})
+    return owner if taken.modified_count else BUILDING
+
+
+def ensure_built(prj: str) -> None:
+    '''
+    Builds the counters of a project before its first change is applied, if they were never built. One caller across
+    the processes builds them under a lease in STATE_COLLECTION, the others wait for it, so no change is applied while
+    the stored documents are being aggregated. Checked in MongoDB once per project and process.
+    '''
+    if prj in _BUILT:
+        return
+    owner = f"{os.getpid()}-{threading.get_ident()}-{uuid.uuid4().hex[:8]}"
+    while True:
+        claim = _claim_build(prj, owner)
+        if claim == BUILT:
+            _BUILT.add(prj)
+            return
+        if claim == owner:
+            break
+        time.sleep(BUILD_POLL_SECONDS)
+    try:
+        _recompute(prj)
+    except Exception:
+        # Let the next caller build them instead of waiting for the lease to expire
+        get_collection(STATE_COLLECTION).delete_one({"_id": prj, "owner": owner, "state": BUILDING})
+        raise
+    _mark_built(prj, {"_id": prj, "owner": owner})
+
+
+def reconcile(prj: str) -> int:
+    '''
+    Compares the counters of every milestone of a project with the Taiga API and overwrites the ones that drifted.
+    Returns the number of milestones corrected.
+    '''
+    coll = get_collection(collection_name(prj))
+    corrected = 0
+    for aggregate in coll.find({}):
+        try:
+            remote = fetch_milestone_stats(aggregate.get("project_id"), aggregate["_id"], prj)
+        except Exception as e:
+            logger.warning(f"Could not reconcile milestone {aggregate['_id']} of team {prj}: {e}")
+            continue
+        if not remote or remote == stats(aggregate):
+            continue
+        logger.info(f"Milestone {aggregate['_id']} of team {prj} drifted: local {stats(aggregate)}, Taiga {remote}")
+        coll.update_one({"_id": aggregate["_id"]},
+                        {"$set": {field: remote[f"milestone_{field}"] for field in AGGREGATE_FIELDS}})
+        corrected += 1
+    return corrected
+
+
+def projects() -> List[str]:
+    '''
+    Teams with Taiga documents stored.
+    '''
+    names = db.list_collection_names(filter={"name": {"$regex": r"^taiga_.+\.(tasks|userstories)$"}})
+    return sorted({name[len("taiga_"):name.rindex(".")] for name in names})
+
+
+def _reconcile_due() -> bool:
+    '''
+    Only one process reconciles per MILESTONE_RECONCILE_SECONDS, the one that moves the next run forward.
+    '''
+    now = datetime.utcnow()
+    try:
+        get_collection(LEASE_COLLECTION).find_one_and_update(
+            {"_id": "reconcile", "next_run": {"$lte": now}},
+            {"$set": {"next_run": now + timedelta(seconds=MILESTONE_RECONCILE_SECONDS)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def _loop() -> None:
+    while True:
+        try:
+            if _reconcile_due():
+                for prj in projects():
+                    reconcile(prj)
+        except PyMongoError as e:
+            logger.warning(f"Milestone reconciliation could not reach MongoDB: {e}")
+        except Exception:
+            logger.exception("Milestone reconciliation failed.")
+        time.sleep(min(MILESTONE_RECONCILE_SECONDS, 300))
+
+
+def start() -> None:
+    '''
+    Starts the periodic reconciliation thread of the current process, once per process (after the fork).
+    '''
+    global _PID
+    if _PID == os.getpid() or MILESTONE_RECONCILE_SECONDS <= 0:
+        return
+    with _LOCK:
+        if _PID == os.getpid():
+            return
+        _PID = os.getpid()
+        threading.Thread(target=_loop, name="milestone-reconcile", daemon=True).start()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Rebuilds or reconciles the per-milestone aggregates of the Taiga teams")
+    ap.add_argument("action", choices=["rebuild", "reconcile"],
+                    help="rebuild: recompute from the stored documents, reconcile: correct the drift against the Taiga API")
+    ap.add_argument("--prj", help="Only this team, by default every team with Taiga documents")
+    ns = ap.parse_args()
+    for prj in [ns.prj] if ns.prj else projects():
+        if ns.action == "rebuild":
+            rebuild(prj)
+        else:
+            logger.info(f"Team {prj}: {reconcile(prj)} milestones corrected")
+
+# In order to execute this script: python -m processing.milestone_aggregates rebuild --prj TeamA
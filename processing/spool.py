@@ -0,0 +1,373 @@
+'''
+Append-only spool of verified webhook deliveries.
+
+Every process claims a "lane" (a sub directory locked with flock) and appends its records to segment files of that lane.
+A segment is preallocated and memory-mapped, records are copied into the map and a background thread syncs the dirty
+pages to disk in batches. When a delivery has been processed it is acknowledged, and the checkpoint (segment, offset)
+advances over the contiguous prefix of acknowledged records. On restart the records after the checkpoint are replayed.
+A delivery whose processing fails is moved to the dead-letter file of the spool (dead_letter.jsonl, one JSON line per
+delivery with its meta, error and base64 body) and acknowledged, so it does not pin the checkpoint and the deliveries
+processed after it are not replayed again. `python -m processing.ingest --dead-letters` retries them.
+
+Record layout:  magic (4) | payload length (4) | crc32 (4) | meta length (4) | meta JSON | raw body
+'''
+
+import base64
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:     # Windows development machines, only one process uses the spool there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+_MAGIC = 0x4C44434E                 # "LDCN"
+_HEADER = struct.Struct("<III")     # magic, payload length, crc32 of the payload
+_META_LEN = struct.Struct("<I")
+_CHECKPOINT = "checkpoint.json"
+DEAD_LETTER = "dead_letter.jsonl"
+
+Position = Tuple[int, int]          # (segment number, offset just after the record)
+
+
+def _segment_name(seq: int) -> str:
+    return f"{seq:010d}.seg"
+
+
+def _list_segments(directory: str) -> list:
+    '''
+    Returns the segment numbers stored in a lane directory, in order.
+    '''
+    return sorted(int(f[:-4]) for f in os.listdir(directory) if f.endswith(".seg") and f[:-4].isdigit())
+
+
+def _read_records(directory: str, start: Position, wanted: Optional[Set[Position]] = None) -> Iterator[Tuple[Position, Dict, bytes]]:
+    '''
+    Yields (position, meta, body) for every valid record of a lane stored after <start> (only the <wanted> positions
+    if given, the payload of the others is skipped unread). The segments are read record by record from <start>, never
+    whole: the current one is preallocated to SPOOL_SEGMENT_BYTES and mostly zeros.
+    A zeroed area (preallocated space) or a torn record ends the segment.
+    '''
+    for seq in _list_segments(directory):
+        if seq < start[0]:
+            continue
+        with open(os.path.join(directory, _segment_name(seq)), "rb") as fh:
+            off = start[1] if seq == start[0] else 0
+            fh.seek(off)
+            while True:
+                header = fh.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                magic, length, crc = _HEADER.unpack(header)
+                if magic != _MAGIC:
+                    break
+                end = off + _HEADER.size + length
+                if wanted is not None and (seq, end) not in wanted:
+                    fh.seek(end)
+                    off = end
+                    continue
+                payload = fh.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    logger.warning(f"Torn record in spool segment {directory}/{_segment_name(seq)} at offset {off}, skipping the rest of the segment.")
+                    break
+                (meta_len,) = _META_LEN.unpack_from(payload, 0)
+                meta = json.loads(payload[_META_LEN.size:_META_LEN.size + meta_len])
+                yield (seq, end), meta, payload[_META_LEN.size + meta_len:]
+                off = end
+
+
+def _locked(fh) -> None:
+    if fcntl is not None:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+
+
+def append_dead_letter(directory: str, meta: Dict, body: bytes, error: str) -> None:
+    '''
+    Appends a delivery to the dead-letter file of a spool directory, shared by the lanes (locked while writing).
+    '''
+    line = json.dumps({"failed_at": time.time(), "error": error, "meta": meta,
+                       "body": base64.b64encode(body).decode("ascii")}, separators=(",", ":")) + "\n"
+    with open(os.path.join(directory, DEAD_LETTER), "a", encoding="utf-8") as fh:
+        _locked(fh)
+        fh.write(line)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def take_dead_letters(directory: str) -> List[Tuple[Dict, bytes, str]]:
+    '''
+    Removes and returns the (meta, body, error) of every dead-lettered delivery of a spool directory.
+    '''
+    path = os.path.join(directory, DEAD_LETTER)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r+", encoding="utf-8") as fh:
+        _locked(fh)
+        entries = [json.loads(line) for line in fh if line.strip()]
+        fh.seek(0)
+        fh.truncate()
+    return [(e["meta"], base64.b64decode(e["body"]), e["error"]) for e in entries]
+
+
+class Spool:
+    '''
+    Durable, segment-rotated spool of one process. Thread safe.
+    '''
+
+    def __init__(self, directory: str, segment_bytes: int, fsync_interval_ms: int, fsync_batch: int):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval_ms / 1000
+        self.fsync_batch = fsync_batch
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._lane_dir = None
+        self._lane_fh = None
+        self._seq = 0
+        self._fh = None
+        self._mm = None
+        self._size = 0
+        self._write_off = 0
+        self._dirty_from = None         # Lowest offset of the current segment not synced yet
+        self._unsynced = 0              # Records appended since the last sync
+        self._inflight = OrderedDict()  # position -> acknowledged flag, in append order
+        self._committed = (0, 0)
+        self._checkpoint_dirty = False
+
+    # ---------- lanes ----------
+
+    def _try_lock(self, lane_dir: str):
+        os.makedirs(lane_dir, exist_ok=True)
+        fh = open(os.path.join(lane_dir, "lock"), "a+")
+        if fcntl is None:
+            return fh
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fh
+        except OSError:
+            fh.close()
+            return None
+
+    def _claim_lane(self) -> None:
+        '''
+        Locks the first lane that no other living process holds. Lanes are reused across restarts, so a restarted
+        worker finds the backlog that its predecessor left.
+        '''
+        idx = 0
+        while True:
+            lane_dir = os.path.join(self.directory, f"lane-{idx}")
+            fh = self._try_lock(lane_dir)
+            if fh is not None:
+                self._lane_dir, self._lane_fh = lane_dir, fh
+                return
+            idx += 1
+
+    def _read_checkpoint(self, lane_dir: str) -> Position:
+        try:
+            with open(os.path.join(lane_dir, _CHECKPOINT), "r", encoding="utf-8") as fh:
+                cp = json.load(fh)
+            return cp["segment"], cp["offset"]
+        except (OSError, ValueError, KeyError):
+            return 0, 0
+
+    # ---------- segments ----------
+
+    def _open_segment(self, seq: int, min_size: int = 0) -> None:
+        self._seq = seq
+        self._size = max(self.segment_bytes, min_size)
+        path = os.path.join(self._lane_dir, _segment_name(seq))
+        self._fh = open(path, "w+b")
+        self._fh.truncate(self._size)         # Sparse preallocation, the unwritten area reads as zeros
+        self._mm = mmap.mmap(self._fh.fileno(), self._size)
+        self._write_off = 0
+        self._dirty_from = None
+
+    def _close_segment(self) -> None:
+        if self._mm is None:
+            return
+        self._sync()
+        self._mm.close()
+        self._fh.truncate(self._write_off)    # Closed segments end exactly at their last record
+        self._fh.close()
+        self._mm = self._fh = None
+
+    def _sync(self) -> None:
+        '''
+        Writes the dirty pages of the current segment to disk. Must be called with the lock held.
+        '''
+        if self._dirty_from is None:
+            return
+        start = self._dirty_from - self._dirty_from % mmap.PAGESIZE   # msync needs a page aligned offset
+        self._mm.flush(start, self._write_off - start)
+        self._dirty_from = None
+        self._unsynced = 0
+
+    def _write_checkpoint(self) -> None:
+        path = os.path.join(self._lane_dir, _CHECKPOINT)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"segment": self._committed[0], "offset": self._committed[1]}, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        self._checkpoint_dirty = False
+
+    def _drop_consumed_segments(self) -> None:
+        for seq in _list_segments(self._lane_dir):
+            if seq < self._committed[0] and seq != self._seq:
+                os.remove(os.path.join(self._lane_dir, _segment_name(seq)))
+
+    # ---------- public API ----------
+
+    def open(self) -> list:
+        '''
+        Claims a lane, starts a fresh segment and the sync thread.
+        Returns the positions of the records left unprocessed by a previous run, they must be replayed and acknowledged.
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        self._claim_lane()
+        self._committed = self._read_checkpoint(self._lane_dir)
+
+        pending = []
+        for pos, meta, body in _read_records(self._lane_dir, self._committed):
+            self._inflight[pos] = False
+            pending.append(pos)
+
+        existing = _list_segments(self._lane_dir)
+        self._open_segment((existing[-1] + 1) if existing else max(self._committed[0], 1))
+        if not pending:
+            # Nothing to replay, the checkpoint can jump to the new segment
+            self._committed = (self._seq, 0)
+            self._write_checkpoint()
+        pending.extend(self._adopt_orphan_lanes())
+
+        threading.Thread(target=self._sync_loop, name="spool-sync", daemon=True).start()
+        logger.info(f"Spool lane {self._lane_dir} opened, {len(pending)} deliveries pending replay.")
+        return pending
+
+    def _adopt_orphan_lanes(self) -> list:
+        '''
+        Copies the pending records of lanes that no process holds (e.g. the number of workers was reduced) into our lane.
+        Returns their new positions, they are replayed together with our own backlog.
+        '''
+        adopted = []
+        for name in sorted(os.listdir(self.directory)):
+            lane_dir = os.path.join(self.directory, name)
+            if not name.startswith("lane-") or lane_dir == self._lane_dir:
+                continue
+            fh = self._try_lock(lane_dir)
+            if fh is None or fcntl is None:
+                if fh is not None:
+                    fh.close()
+                continue
+            moved = [self.append(meta, body) for _, meta, body in _read_records(lane_dir, self._read_checkpoint(lane_dir))]
+            with self._lock:
+                self._sync()
+            shutil.rmtree(lane_dir, ignore_errors=True)
+            fh.close()
+            if moved:
+                logger.info(f"Adopted {len(moved)} pending deliveries from orphan spool {lane_dir}.")
+            adopted.extend(moved)
+        return adopted
+
+    def append(self, meta: Dict, body: bytes) -> Position:
+        '''
+        Appends a delivery to the spool and returns its position, used later to acknowledge it.
+        '''
+        meta_raw = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        payload = _META_LEN.pack(len(meta_raw)) + meta_raw + body
+        record_len = _HEADER.size + len(payload)
+
+        with self._lock:
+            if self._write_off + record_len > self._size:
+                self._close_segment()
+                self._open_segment(self._seq + 1, record_len)
+            off = self._write_off
+            _HEADER.pack_into(self._mm, off, _MAGIC, len(payload), zlib.crc32(payload))
+            self._mm[off + _HEADER.size:off + record_len] = payload
+            self._write_off = off + record_len
+            if self._dirty_from is None:
+                self._dirty_from = off
+            self._unsynced += 1
+            pos = (self._seq, self._write_off)
+            self._inflight[pos] = False
+            if self._unsynced >= self.fsync_batch:
+                self._wake.set()
+        return pos
+
+    def ack(self, pos: Position) -> None:
+        '''
+        Marks a delivery as processed. The checkpoint advances over the contiguous prefix of processed deliveries.
+        '''
+        with self._lock:
+            if pos not in self._inflight:
+                return
+            self._inflight[pos] = True
+            while self._inflight:
+                head, done = next(iter(self._inflight.items()))
+                if not done:
+                    break
+                self._inflight.popitem(last=False)
+                self._committed = head
+                self._checkpoint_dirty = True
+            if not self._inflight:
+                self._committed = (self._seq, self._write_off)
+
+    def dead_letter(self, pos: Position, error: str) -> None:
+        '''
+        Moves a delivery that could not be processed to the dead-letter file and acknowledges it.
+        '''
+        for _, meta, body in self.records([pos]):
+            append_dead_letter(self.directory, meta, body, error)
+            logger.error(f"Spooled {meta.get('source')} delivery for team {meta.get('prj')} moved to the dead letters: {error}")
+        self.ack(pos)
+
+    def records(self, positions: list) -> Iterator[Tuple[Position, Dict, bytes]]:
+        '''
+        Yields the stored (position, meta, body) of the given pending positions.
+        '''
+        wanted = set(positions)
+        if not wanted:
+            return
+        start = min(wanted)
+        with self._lock:
+            self._sync()
+        for pos, meta, body in _read_records(self._lane_dir, (start[0], 0), wanted):
+            yield pos, meta, body
+            wanted.discard(pos)
+            if not wanted:
+                return
+
+    def _sync_loop(self) -> None:
+        while True:
+            self._wake.wait(self.fsync_interval)
+            self._wake.clear()
+            try:
+                with self._lock:
+                    self._sync()
+                    if self._checkpoint_dirty:
+                        self._write_checkpoint()
+                        self._drop_consumed_segments()
+            except Exception:
+                logger.exception("Spool sync failed.")
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+            self._write_checkpoint()
+            if self._lane_fh is not None:
+                self._lane_fh.close()
+                self._lane_fh = None
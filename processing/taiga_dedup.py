@@ -0,0 +1,100 @@
+'''
+Short deduplication window of the Taiga deliveries, keyed on a hash of the verified body and the prj.
+
+Taiga sends no delivery ID and often sends the same body several times (retries, or several webhooks configured on
+one project), each of them parsed, upserted and notified to LD Eval. The first body of a (prj, content) pair within
+TAIGA_DEDUP_WINDOW seconds is processed, its copies are answered 200 without being spooled. The window is shared by
+the workers of the host through the SQLite shared cache, whose rows expire with it, so it holds the bodies of a burst of
+a whole course without a size limit. Without the shared cache each process keeps its own bounded window.
+A delivery that is not processed (answered with an error, or failing in the ingestion worker) releases its key, so
+Taiga's resend is processed.
+'''
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from config.settings import TAIGA_DEDUP_WINDOW, TAIGA_DEDUP_MEMORY
+from utils import metrics
+from utils.shared_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+_NS = "taiga_dedup"
+CONTENT_KEY_HEADER = "X-Taiga-Content-Key"     # Key of a delivery in the headers it is spooled and processed with
+
+_RECENT = OrderedDict()     # key -> monotonic expiry, oldest first (used without the shared cache)
+_LOCK = threading.Lock()
+
+
+def content_key(body, prj: Optional[str]) -> str:
+    '''
+    Digest of a delivery: blake2b of the prj and the raw body, as verified (no decoding).
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update((prj or "").encode())
+    digest.update(b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _add_local(key: str) -> bool:
+    now = time.monotonic()
+    with _LOCK:
+        expires_at = _RECENT.get(key)
+        if expires_at is not None and expires_at > now:
+            return False
+        _RECENT[key] = now + TAIGA_DEDUP_WINDOW
+        _RECENT.move_to_end(key)
+        while len(_RECENT) > TAIGA_DEDUP_MEMORY:
+            _RECENT.popitem(last=False)
+        return True
+
+
+def claim(key: str) -> Optional[Tuple[Dict, int]]:
+    '''
+    Opens the window of a delivery. Returns None if it must be processed, else the response to answer the copy with.
+    '''
+    if TAIGA_DEDUP_WINDOW <= 0:
+        return None
+    cache = shared_cache()
+    try:
+        first = cache.add(_NS, key, 1, TAIGA_DEDUP_WINDOW) if cache is not None else _add_local(key)
+    except sqlite3.Error as e:
+        logger.warning(f"Taiga deduplication window unavailable, processing the delivery: {e}")
+        first = _add_local(key)
+    if first:
+        metrics.inc("taiga.deliveries.unique")
+        return None
+    metrics.inc("taiga.deliveries.duplicate")
+    logger.info("Identical Taiga delivery received within the deduplication window, skipped.")
+    return {"status": "duplicate"}, 200
+
+
+def finish(key: Optional[str], result) -> None:
+    '''
+    Keeps the window of a delivery answered / processed with a 2xx, closes it otherwise.
+    '''
+    if not 200 <= result[1] < 300:
+        release(key)
+
+
+def release(key: Optional[str]) -> None:
+    '''
+    Closes the window of a delivery that was not processed (error answer, failed processing), so its resend is processed.
+    '''
+    if not key or TAIGA_DEDUP_WINDOW <= 0:
+        return
+    with _LOCK:
+        _RECENT.pop(key, None)
+    cache = shared_cache()
+    if cache is None:
+        return
+    try:
+        cache.delete(_NS, key)
+    except sqlite3.Error as e:
+        logger.warning(f"Could not release a Taiga delivery, its retry is dropped until the window ends: {e}")
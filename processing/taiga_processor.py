@@ -0,0 +1,155 @@
+from typing import Dict, Tuple
+import logging
+
+from pymongo import ReturnDocument
+
+from datasources.taiga_handler import parse_taiga_event
+from database.mongo_client import get_collection
+from routes.API_publisher.notification_coalescer import publish_event
+from processing.enrichment import new_batch, enqueue_milestone_stats
+from processing import milestone_aggregates
+from config.settings import ENRICHMENT_MODE, MILESTONE_STATS_SOURCE
+
+logger = logging.getLogger(__name__)
+
+
+# Mongo collection suffix for each supported Taiga event type
+TAIGA_COLLECTIONS = {
+    "userstory":        "userstories",
+    "relateduserstory": "userstories",
+    "issue":            "issues",
+    "task":             "tasks",
+    "epic":             "epics",
+}
+
+# Event types counted in the milestone aggregates, and the kind of document they are
+MILESTONE_KINDS = {"task": "task", "userstory": "userstory", "relateduserstory": "userstory"}
+
+
+def _upsert(coll, prj: str, event_type: str, key: str, parsed_data: Dict) -> None:
+    '''
+    Upserts a parsed document on its key. With local milestone stats the previous version is read in the same
+    round-trip to move its contribution in the milestone aggregates, and the stats of its milestone are stored in the
+    document when they changed.
+    '''
+    if MILESTONE_STATS_SOURCE != "local" or event_type not in MILESTONE_KINDS:
+        coll.update_one({key: parsed_data[key]}, {"$set": parsed_data}, upsert=True)
+        return
+
+    milestone_aggregates.ensure_built(prj)
+    old = coll.find_one_and_update({key: parsed_data[key]}, {"$set": parsed_data}, upsert=True,
+                                   return_document=ReturnDocument.BEFORE)
+    new = {**(old or {}), **parsed_data}
+    stats = milestone_aggregates.apply_change(prj, MILESTONE_KINDS[event_type], old, new)
+    # Most edits (description, assignee…) leave the counters as they were, the stored stats are still current then
+    if stats and any(new.get(field) != value for field, value in stats.items()):
+        coll.update_one({key: parsed_data[key]}, {"$set": stats})
+
+
+def process_taiga_event(raw_payload: Dict, prj: str, quality_model: str) -> Tuple[Dict, int]:
+    '''
+    Parses a verified Taiga delivery, upserts it in MongoDB and notifies LD_EVAL.
+    Runs in the ingestion workers, returns the (body, status) that the route would answer if it was processed inline.
+    '''
+    # Get important values from the payload
+    event_type= raw_payload.get("type","")
+    action_type= raw_payload.get("action","")
+    id = raw_payload.get("data",{}).get("id", "")
+
+    # Decide the Mongo collection name to write to, depending on the event type
+    if event_type not in TAIGA_COLLECTIONS:
+        return {"status": "ignored", "reason": "unsupported type"}, 200
+    collection_name = f"taiga_{prj}.{TAIGA_COLLECTIONS[event_type]}"
+
+    coll = get_collection(collection_name)
+
+    #Handle the deletion of a document before we parse the payload, to avoid data errors
+    if action_type == "delete":
+        logger.info(f"Deleting document from {collection_name}. ID={id}")
+        if not id:
+            return {"error": "No object ID"}, 400
+        if MILESTONE_STATS_SOURCE == "local" and event_type in MILESTONE_KINDS:
+            milestone_aggregates.ensure_built(prj)
+            old = coll.find_one_and_delete({f"{event_type}_id": id})
+            milestone_aggregates.apply_change(prj, MILESTONE_KINDS[event_type], old, None)
+        else:
+            coll.delete_one({f"{event_type}_id": id})
+        logger.info(f"Document with {event_type}={id} has been deleted.")
+        return {"status": "ok"}, 200
+
+    # Parse the raw JSON payload using the parse_taiga_event function. The milestone stats come from the local aggregates
+    # (filled by _upsert) or from the Taiga API, in deferred mode the enricher calls it later
+    local_stats = MILESTONE_STATS_SOURCE == "local"
+    parsed_data = parse_taiga_event(raw_payload, prj, enrich=not local_stats and ENRICHMENT_MODE != "deferred")
+    if local_stats:
+        parsed_data["milestone_stats_pending"] = False
+    logger.info("Taiga webhook request processed successfully.")
+
+    author_login = parsed_data["assigned_by"] #username of the author of the commit or issue
+
+    #If the event is a user story, identify the user story ID and upsert/insert it in the collection
+    if event_type in ["userstory", "relateduserstory"]:
+        # UP-SERT user stories in the same collection
+        user_story_id = parsed_data.get("userstory_id")
+        if not user_story_id:
+            return {"error": "No user story ID"}, 400
+
+        logger.info(f"Upserting user story with ID: {user_story_id}")
+        parsed_data["prj"] = prj
+        _upsert(coll, prj, event_type, "userstory_id", parsed_data)
+        logger.info(f"Inserting in MongoDB Taiga userstory for team {prj}")
+
+    #If the event is a taks , identify the task ID and upsert/insert it in the collection
+    elif event_type == "task":
+        task_id = parsed_data.get("task_id")
+        if not task_id:
+            return {"error": "No task ID"}, 400
+
+        logger.info(f"Upserting task with ID: {task_id}")
+        # Upsert instead of insert
+        parsed_data["prj"] = prj
+        _upsert(coll, prj, event_type, "task_id", parsed_data)
+        logger.info(f"Inserting in MongoDB Taiga task for team {prj}")
+
+    #If the event is an epic, identify the epic ID and upsert/insert it in the collection
+    elif event_type == "epic":
+        epic_id = parsed_data.get("epic_id")
+        if not epic_id:
+            return {"error": "No epic ID"}, 400
+
+        logger.info(f"Upserting epic with ID: {epic_id}")
+        # Upsert instead of insert
+        parsed_data["prj"] = prj
+        _upsert(coll, prj, event_type, "epic_id", parsed_data)
+        logger.info(f"Inserting in MongoDB Taiga epic for team {prj}")
+
+    # If the event is an issue, identify the issue ID and upsert/insert it in the collection
+    elif event_type == "issue":
+        issue_id = parsed_data.get("issue_id")
+        if not issue_id:
+            return {"error": "No issue ID"}, 400
+
+        logger.info(f"Upserting issue with ID: {issue_id}")
+        parsed_data["prj"] = prj
+        # Upsert instead of insert
+        _upsert(coll, prj, event_type, "issue_id", parsed_data)
+        logger.info(f"Inserting in MongoDB Taiga issue for team {prj}")
+
+    # Tasks and user stories stored without milestone stats are completed by the enricher, which notifies LD_EVAL afterwards
+    if parsed_data.get("milestone_stats_pending"):
+        key = "task_id" if event_type == "task" else "userstory_id"
+        batch = new_batch(event_type, prj, author_login, quality_model)
+        enqueue_milestone_stats(batch, prj, collection_name, key, parsed_data[key],
+                                parsed_data["project_id"], parsed_data["milestone_id"])
+        logger.info(f"Taiga {event_type} {parsed_data[key]} of team {prj} queued for milestone enrichment")
+        return {"status": "ok"}, 200
+
+    #COMMUNICATION WITH LD_EVAL USING API
+    logger.info(f"Notifying LD_EVAL about event: {event_type} for team with external_id: {prj} with quality_model: {quality_model}")
+    try:
+        publish_event(event_type, prj, author_login, quality_model)
+    except Exception as e:
+        logger.error(f"Error notifying LD_EVAL: {e}")
+        return {"error": "Failed to notify LD_EVAL"}, 500
+
+    return {"status": "ok"}, 200
@@ -0,0 +1,127 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Tuple
+
+from config.settings import (INGEST_QUEUE_SIZE, INGEST_WORKERS,
+                             INGEST_OVERFLOW_POLICY, INGEST_BLOCK_TIMEOUT)
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("reject", "block", "inline")
+
+_QUEUE = None          # queue.Queue shared by the workers of this process
+_WORKERS = []          # worker threads of this process
+_PID = None            # pid that started the workers, to restart them after a fork
+_LOCK = threading.Lock()
+
+
+def _worker_loop(jobs: queue.Queue) -> None:
+    '''
+    Loop executed by every worker thread. Takes a job from the queue and runs it, a failing job never kills the worker.
+    '''
+    while True:
+        job = jobs.get()
+        if job is None:             # Sentinel used by shutdown()
+            jobs.task_done()
+            return
+        name, fn, args = job
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception(f"Ingestion job {name} failed.")
+        finally:
+            jobs.task_done()
+
+
+def start() -> None:
+    '''
+    Starts the worker pool of the current process if it is not running yet.
+    It is called lazily on the first submit, so the threads are created after gunicorn forks the workers.
+    '''
+    global _QUEUE, _WORKERS, _PID
+    if _PID == os.getpid():
+        return
+    with _LOCK:
+        if _PID == os.getpid():
+            return
+        _QUEUE = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        _WORKERS = []
+        for idx in range(max(1, INGEST_WORKERS)):
+            t = threading.Thread(target=_worker_loop, args=(_QUEUE,), name=f"ingest-worker-{idx}", daemon=True)
+            t.start()
+            _WORKERS.append(t)
+        _PID = os.getpid()
+        if INGEST_OVERFLOW_POLICY not in OVERFLOW_POLICIES:
+            logger.warning(f"Unknown INGEST_OVERFLOW_POLICY {INGEST_OVERFLOW_POLICY!r}, deliveries will be rejected when the queue is full.")
+        logger.info(f"Ingestion queue started: {len(_WORKERS)} workers, size={INGEST_QUEUE_SIZE}, overflow={INGEST_OVERFLOW_POLICY}")
+
+
+def submit(name: str, fn: Callable, *args) -> Tuple[str, object]:
+    '''
+    Puts a job in the ingestion queue. Returns a tuple (outcome, result):
+      - ("queued", None)    the job will be processed by a worker
+      - ("inline", result)  the queue was full and the job was executed in the calling thread ('inline' policy)
+      - ("rejected", None)  the queue was full and the job was dropped ('reject' or 'block' policy)
+    '''
+    start()
+    job = (name, fn, args)
+    try:
+        if INGEST_OVERFLOW_POLICY == "block":
+            _QUEUE.put(job, timeout=INGEST_BLOCK_TIMEOUT)
+        else:
+            _QUEUE.put_nowait(job)
+        return "queued", None
+    except queue.Full:
+        pass
+
+    if INGEST_OVERFLOW_POLICY == "inline":
+        logger.warning(f"Ingestion queue full, processing {name} inline.")
+        return "inline", fn(*args)
+
+    logger.warning(f"Ingestion queue full, rejecting {name}.")
+    return "rejected", None
+
+
+def accepted_response(outcome: Tuple[str, object]):
+    '''
+    Translates the outcome of submit() into the response returned by the webhook routes.
+    '''
+    status, result = outcome
+    if status == "queued":
+        return {"status": "accepted"}, 202
+    if status == "inline":
+        return result
+    # GitHub and Taiga retry the delivery later if we answer with a 5xx
+    return {"status": "error", "message": "Ingestion queue full"}, 503, {"Retry-After": "5"}
+
+
+def depth() -> int:
+    '''
+    Number of jobs waiting in the queue of this process.
+    '''
+    return _QUEUE.qsize() if _QUEUE is not None else 0
+
+
+def drain(timeout: float = 30) -> bool:
+    '''
+    Waits until every queued job has been processed, or until the timeout expires.
+    Returns True if the queue is empty. Used to finish the in-flight work before the process exits.
+    '''
+    if _QUEUE is None or _PID != os.getpid():
+        return True
+    deadline = time.monotonic() + timeout
+    while _QUEUE.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return not _QUEUE.unfinished_tasks
+
+
+def submit_wait(name: str, fn: Callable, *args) -> None:
+    '''
+    Puts a job in the ingestion queue waiting as long as needed for a free slot, whatever the overflow policy.
+    Used to replay the spooled deliveries, which must never be dropped.
+    '''
+    start()
+    _QUEUE.put((name, fn, args))
@@ -1,29 +1,46 @@
 import requests
 import os
 import logging
+from typing import Dict, List, Optional
+from datasources.requests import http_client
 
 logger = logging.getLogger(__name__)
 
 
-def notify_eval_push(event_type: str,prj: str ,author_login: str , quality_model: str)-> None: 
-    '''
-    Function used to notify Component LD_Eval about the event that has been pushed to the database.
-    '''
-    
+def eval_url() -> str:
     host = os.getenv("EVAL_HOST", "localhost")
     port = os.getenv("EVAL_PORT", "5001")
-    url  = f"http://{host}:{port}/api/event"
-    
-    event_data = {
+    return f"http://{host}:{port}/api/event"
+
+
+def deliver_eval_event(event_data: Dict) -> None:
+    '''
+    Posts an event envelope to LD_Eval. Raises requests.RequestException if it could not be delivered.
+    '''
+    resp = http_client.post("eval", eval_url(), json=event_data)
+    resp.raise_for_status()
+    logger.debug(f"LD_Eval responded with {resp.status_code}: {resp.text}")
+
+
+def eval_envelope(event_type: str, prj: str, author_login: str, quality_model: str, event_count: int = 1,
+                  authors: Optional[List[str]] = None) -> Dict:
+    return {
         "event_type": event_type,
         "prj": prj,
         "author_login": author_login,  # Replace with actual author login if available
         "quality_model": quality_model,  # Replace with actual quality model if available
+        "event_count": event_count,
+        "authors": authors if authors is not None else [author_login],
     }
 
+
+def notify_eval_push(event_type: str,prj: str ,author_login: str , quality_model: str, event_count: int = 1, authors: Optional[List[str]] = None)-> None: 
+    '''
+    Function used to notify Component LD_Eval about the event that has been pushed to the database.
+    event_count is the number of events merged in this notification, authors the logins involved in them.
+    Errors are logged and swallowed, use the outbox (routes/API_publisher/eval_outbox.py) when delivery matters.
+    '''
     try:
-        resp = requests.post(url, json=event_data, timeout=5)
-        resp.raise_for_status()
-        print(f"LD_Eval responded with {resp.status_code}: {resp.json()}")
+        deliver_eval_event(eval_envelope(event_type, prj, author_login, quality_model, event_count, authors))
     except requests.RequestException as e:
-        print(f"Error al notificar a LD_Eval en {url}: {e}")
\ No newline at end of file
+        logger.error(f"Error al notificar a LD_Eval en {eval_url()}: {e}")
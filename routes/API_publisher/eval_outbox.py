@@ -0,0 +1,272 @@
+'''
+Transactional outbox of LD Eval notifications.
+
+The processors write a row in the "eval_outbox" collection right after the event documents are stored, instead of
+calling LD Eval in the request path. A dispatcher thread delivers the rows and deletes them once LD Eval accepted them
+(at-least-once: a crash between both steps sends the notification again). Only one dispatcher runs at a time across
+the worker processes, the one holding the lease in "eval_outbox_lease".
+
+Per project the rows are delivered in the order they were stored. Consecutive rows with the same (quality_model,
+event_type) are merged in one notification after the coalescing window (EVAL_COALESCE_WINDOW / EVAL_COALESCE_MAX_DELAY),
+and a project whose delivery fails is retried with exponential backoff without holding back the other projects. After
+EVAL_OUTBOX_MAX_ATTEMPTS failures the notification is moved to "eval_outbox_dead" so the project goes on; the dead rows
+are sent again with --replay-dead.
+'''
+
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from config.settings import (EVAL_COALESCE_WINDOW, EVAL_COALESCE_MAX_DELAY, EVAL_OUTBOX_BATCH, EVAL_OUTBOX_POLL_SECONDS,
+                             EVAL_OUTBOX_BACKOFF_BASE, EVAL_OUTBOX_BACKOFF_MAX, EVAL_OUTBOX_MAX_ATTEMPTS)
+from config.logger_config import setup_logging
+from database.mongo_client import get_collection
+from routes.API_publisher.API_event_publisher import deliver_eval_event
+from utils import metrics
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "eval_outbox"
+DEAD_COLLECTION = "eval_outbox_dead"
+LEASE_COLLECTION = "eval_outbox_lease"
+LEASE_SECONDS = 60
+
+_PID = None
+_LOCK = threading.Lock()
+_INDEX_READY = False
+
+
+def _outbox():
+    global _INDEX_READY
+    coll = get_collection(OUTBOX_COLLECTION)
+    if not _INDEX_READY:
+        coll.create_index([("prj", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)])
+        coll.create_index([("created_at", ASCENDING)])
+        _INDEX_READY = True
+    return coll
+
+
+def _dead():
+    return get_collection(DEAD_COLLECTION)
+
+
+def new_row(event_type: str, prj: str, author_login: str, quality_model: str) -> Dict:
+    now = datetime.utcnow()
+    return {"prj": prj, "quality_model": quality_model, "event_type": event_type,
+            "author_login": author_login, "created_at": now, "next_attempt_at": now, "attempts": 0}
+
+
+def enqueue(event_type: str, prj: str, author_login: str, quality_model: str) -> None:
+    '''
+    Stores a notification to be delivered to LD Eval. Must be called once the event documents are persisted.
+    '''
+    _outbox().insert_one(new_row(event_type, prj, author_login, quality_model))
+
+
+def _acquire_lease(owner: str) -> bool:
+    '''
+    Takes or renews the dispatcher lease. False if another process holds it.
+    '''
+    now = datetime.utcnow()
+    try:
+        get_collection(LEASE_COLLECTION).find_one_and_update(
+            {"_id": "dispatcher", "$or": [{"owner": owner}, {"lease_until": {"$lte": now}}]},
+            {"$set": {"owner": owner, "lease_until": now + timedelta(seconds=LEASE_SECONDS)}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        return False        # The lease exists and belongs to a live dispatcher
+    return True
+
+
+def _groups(rows: List[Dict]) -> List[List[Dict]]:
+    '''
+    Merges the consecutive rows of a project with the same (quality_model, event_type), so LD Eval still receives the
+    events of a project in the order they were stored (push, issues, push are three notifications).
+    '''
+    groups = []
+    for row in rows:
+        if groups and (groups[-1][0]["quality_model"], groups[-1][0]["event_type"]) == (row["quality_model"], row["event_type"]):
+            groups[-1].append(row)
+        else:
+            groups.append([row])
+    return groups
+
+
+def _due(group: List[Dict], now: datetime) -> bool:
+    '''
+    A group is sent when no row arrived during the quiet window, or its oldest row waited the max delay.
+    '''
+    if EVAL_COALESCE_WINDOW <= 0:
+        return True
+    first, last = group[0]["created_at"], group[-1]["created_at"]
+    return min(last + timedelta(seconds=EVAL_COALESCE_WINDOW),
+               first + timedelta(seconds=EVAL_COALESCE_MAX_DELAY)) <= now
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(EVAL_OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), EVAL_OUTBOX_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _insert_missing(coll, rows: List[Dict]) -> None:
+    '''
+    Inserts rows moved between the outbox and the dead collection, skipping the ones an interrupted move already copied.
+    '''
+    try:
+        coll.insert_many(rows, ordered=False)
+    except BulkWriteError as e:
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+
+
+def _bury(coll, group: List[Dict], error: str) -> None:
+    '''
+    Moves the rows of a notification out of attempts to the dead collection, the ones after it are delivered.
+    '''
+    buried_at = datetime.utcnow()
+    _insert_missing(_dead(), [{**r, "last_error": error, "dead_at": buried_at} for r in group])
+    coll.delete_many({"_id": {"$in": [r["_id"] for r in group]}})
+    metrics.inc("eval_outbox.dead", len(group))
+
+
+def _dispatch_project(prj: str, now: datetime) -> int:
+    '''
+    Delivers the due notifications of a project, in order, stopping at the first one not due or failing (unless it
+    ran out of attempts and is dead-lettered). Returns the number of rows delivered.
+    '''
+    coll = _outbox()
+    rows = list(coll.find({"prj": prj}).sort([("created_at", ASCENDING), ("_id", ASCENDING)]).limit(EVAL_OUTBOX_BATCH))
+    if not rows or rows[0]["next_attempt_at"] > now:
+        return 0            # Empty, or backing off after a failure
+
+    delivered = 0
+    for group in _groups(rows):
+        if not _due(group, now):
+            break           # Later groups wait too, the order of the project is kept
+        head = group[0]
+        authors = list(OrderedDict.fromkeys(r["author_login"] for r in group))
+        event_data = {
+            "event_type": head["event_type"],
+            "prj": prj,
+            "author_login": group[-1]["author_login"],
+            "quality_model": head["quality_model"],
+            "event_count": len(group),
+            "authors": authors,
+        }
+        try:
+            deliver_eval_event(event_data)
+        except Exception as e:
+            attempts = head["attempts"] + 1
+            metrics.inc("eval_outbox.failures")
+            if 0 < EVAL_OUTBOX_MAX_ATTEMPTS <= attempts:
+                _bury(coll, group, str(e))
+                logger.error(f"Giving up notifying LD_EVAL about {len(group)} {head['event_type']} events for team {prj} "
+                             f"after {attempts} attempts, moved to {DEAD_COLLECTION}: {e}")
+                continue
+            delay = _backoff(attempts)
+            coll.update_one({"_id": head["_id"]},
+                            {"$set": {"next_attempt_at": now + timedelta(seconds=delay), "last_error": str(e)},
+                             "$inc": {"attempts": 1}})
+            logger.warning(f"Error notifying LD_EVAL for team {prj} (attempt {attempts}), retrying in {delay:.1f}s: {e}")
+            break
+        coll.delete_many({"_id": {"$in": [r["_id"] for r in group]}})
+        delivered += len(group)
+        metrics.inc("eval_outbox.notifications")
+        metrics.inc("eval_outbox.delivered", len(group))
+        logger.info(f"Notified LD_EVAL about {len(group)} {head['event_type']} events for team {prj} with quality_model: {head['quality_model']}")
+    return delivered
+
+
+def dispatch_once(owner: str) -> int:
+    '''
+    One dispatcher round over every project with pending notifications. Returns the number of rows delivered.
+    '''
+    delivered = 0
+    for prj in _outbox().distinct("prj"):
+        if not _acquire_lease(owner):
+            break
+        delivered += _dispatch_project(prj, datetime.utcnow())
+    return delivered
+
+
+def lag() -> Dict[str, Optional[float]]:
+    '''
+    Rows waiting in the outbox, age in seconds of the oldest one and rows dead-lettered after running out of attempts.
+    '''
+    coll = _outbox()
+    oldest = coll.find_one({}, {"created_at": 1}, sort=[("created_at", ASCENDING)])
+    age = (datetime.utcnow() - oldest["created_at"]).total_seconds() if oldest else 0.0
+    return {"pending": coll.estimated_document_count(), "oldest_age_seconds": age,
+            "dead": _dead().estimated_document_count()}
+
+
+def replay_dead() -> int:
+    '''
+    Puts the dead-lettered notifications back in the outbox with their attempts reset, once LD Eval is fixed.
+    They keep their created_at, so they are delivered before the newer rows of their project. Returns the rows moved.
+    '''
+    dead = _dead()
+    rows = list(dead.find({}))
+    if not rows:
+        return 0
+    now = datetime.utcnow()
+    restored = [{**{k: v for k, v in r.items() if k not in ("dead_at", "last_error")}, "attempts": 0, "next_attempt_at": now}
+                for r in rows]
+    _insert_missing(_outbox(), restored)
+    dead.delete_many({"_id": {"$in": [r["_id"] for r in rows]}})
+    return len(rows)
+
+
+def _loop() -> None:
+    owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    while True:
+        try:
+            if _acquire_lease(owner):
+                dispatch_once(owner)
+        except PyMongoError as e:
+            logger.warning(f"Outbox dispatcher could not reach MongoDB: {e}")
+        except Exception:
+            logger.exception("Outbox dispatcher round failed.")
+        time.sleep(EVAL_OUTBOX_POLL_SECONDS)
+
+
+def start() -> None:
+    '''
+    Starts the dispatcher thread of the current process, once per process (after the fork).
+    '''
+    global _PID
+    if _PID == os.getpid():
+        return
+    with _LOCK:
+        if _PID == os.getpid():
+            return
+        _PID = os.getpid()
+        metrics.register_gauge("eval_outbox.lag", lag)
+        threading.Thread(target=_loop, name="eval-outbox", daemon=True).start()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Delivers the pending LD Eval notifications of the outbox")
+    ap.add_argument("--once", action="store_true", help="Run a single dispatcher round and exit instead of polling forever")
+    ap.add_argument("--replay-dead", action="store_true", help=f"Move the notifications of {DEAD_COLLECTION} back to the outbox and exit")
+    ns = ap.parse_args()
+    if ns.replay_dead:
+        logger.info(f"Moved {replay_dead()} dead notifications back to the outbox.")
+    elif ns.once:
+        logger.info(f"Delivered {dispatch_once(f'cli-{os.getpid()}')} outbox rows.")
+    else:
+        _loop()
+
+# In order to execute this script: python -m routes.API_publisher.eval_outbox --once
@@ -0,0 +1,113 @@
+'''
+Coalescer of LD Eval notifications. A student dragging ten cards on a board produces ten events, but LD Eval only needs
+to recalculate the metrics once: events are grouped by (prj, quality_model, event_type) and a single notification
+is sent per group, carrying how many events it stands for.
+
+With the outbox enabled (EVAL_OUTBOX_ENABLED) events are stored in Mongo instead and the outbox dispatcher applies the
+same window when delivering them; the in-memory groups below are only used without the outbox.
+'''
+
+import atexit
+import logging
+import os
+import threading
+import time
+
+from config.settings import EVAL_COALESCE_WINDOW, EVAL_COALESCE_MAX_DELAY, EVAL_OUTBOX_ENABLED
+from routes.API_publisher.API_event_publisher import notify_eval_push
+from routes.API_publisher import eval_outbox
+
+logger = logging.getLogger(__name__)
+
+_PENDING = {}          # key = (prj, quality_model, event_type) -> {"first", "last", "last_author", "count", "authors"}
+_COND = threading.Condition()
+_PID = None
+
+
+def _start() -> None:
+    global _PID
+    if _PID == os.getpid():
+        return
+    with _COND:
+        if _PID == os.getpid():
+            return
+        _PENDING.clear()       # Events inherited from the parent process are notified by the parent
+        _PID = os.getpid()
+        threading.Thread(target=_flush_loop, name="eval-coalescer", daemon=True).start()
+
+
+def publish_event(event_type: str, prj: str, author_login: str, quality_model: str) -> None:
+    '''
+    Registers an event to be notified to LD Eval. Must be called once the event documents are stored.
+    With the outbox it is written to Mongo and delivered by the dispatcher, otherwise it is coalesced in memory
+    (or notified right away with EVAL_COALESCE_WINDOW = 0).
+    '''
+    if EVAL_OUTBOX_ENABLED:
+        eval_outbox.enqueue(event_type, prj, author_login, quality_model)
+        return
+
+    if EVAL_COALESCE_WINDOW <= 0:
+        notify_eval_push(event_type, prj, author_login, quality_model)
+        return
+
+    _start()
+    now = time.monotonic()
+    with _COND:
+        entry = _PENDING.get((prj, quality_model, event_type))
+        if entry is None:
+            entry = {"first": now, "count": 0, "authors": []}
+            _PENDING[(prj, quality_model, event_type)] = entry
+        entry["last"] = now
+        entry["last_author"] = author_login
+        entry["count"] += 1
+        if author_login not in entry["authors"]:
+            entry["authors"].append(author_login)
+        _COND.notify()
+
+
+def _due(entry: dict) -> float:
+    '''
+    Moment at which a group must be flushed: end of the quiet window, capped by the max delay.
+    '''
+    return min(entry["last"] + EVAL_COALESCE_WINDOW, entry["first"] + EVAL_COALESCE_MAX_DELAY)
+
+
+def _take_due(force: bool = False) -> list:
+    now = time.monotonic()
+    ready = [key for key, entry in _PENDING.items() if force or _due(entry) <= now]
+    return [(key, _PENDING.pop(key)) for key in ready]
+
+
+def _send(groups: list) -> None:
+    for (prj, quality_model, event_type), entry in groups:
+        logger.info(f"Notifying LD_EVAL about {entry['count']} {event_type} events for team {prj} with quality_model: {quality_model}")
+        try:
+            notify_eval_push(event_type, prj, entry["last_author"], quality_model,
+                             event_count=entry["count"], authors=entry["authors"])
+        except Exception as e:
+            logger.error(f"Error notifying LD_EVAL: {e}")
+
+
+def _flush_loop() -> None:
+    while True:
+        with _COND:
+            now = time.monotonic()
+            timeout = min((_due(e) for e in _PENDING.values()), default=now + 60) - now
+            if timeout > 0:
+                _COND.wait(timeout)
+            groups = _take_due()
+        _send(groups)
+
+
+def flush() -> None:
+    '''
+    Sends every pending group right away. Called when the process exits.
+    '''
+    if _PID != os.getpid():
+        return
+    with _COND:
+        groups = _take_due(force=True)
+    _send(groups)
+
+
+atexit.register(flush)
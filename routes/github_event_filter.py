@@ -0,0 +1,43 @@
+'''
+Header-only routing of the GitHub deliveries. Most of the traffic of the student organizations are events LD Connect
+ignores (ping, create, delete, watch, check_run, status…) and pull requests that are not closed: they are answered
+right after the signature check, without decoding the body, spooling or queueing them.
+'''
+
+import re
+from typing import Optional
+
+from datasources.github_handler import EVENT_ROUTES
+from utils import metrics
+
+# GitHub serialises "action" as the first key of the payloads that have one, so it is read from the first bytes
+_ACTION = re.compile(rb'\A\s*\{\s*"action"\s*:\s*"([^"\\]*)"')
+_PEEK_BYTES = 256
+
+
+def peek_action(body) -> Optional[str]:
+    '''
+    Top-level "action" of a payload from its first bytes, None if it is not the first key (then decode it whole).
+    '''
+    match = _ACTION.match(bytes(body[:_PEEK_BYTES]))
+    return match.group(1).decode() if match else None
+
+
+def _metric_name(event: str) -> str:
+    return re.sub(r"[^a-z_]", "", (event or "").lower())[:40] or "unknown"
+
+
+def fast_reject(event: str, body) -> bool:
+    '''
+    True if the delivery can be answered as ignored from its event (and action) alone. Counted per event type in
+    the "github.fast_rejected.<event>" metrics.
+    '''
+    if event in EVENT_ROUTES:
+        actions = EVENT_ROUTES[event]
+        if actions is None:
+            return False
+        action = peek_action(body)
+        if action is None or action in actions:
+            return False
+    metrics.inc(f"github.fast_rejected.{_metric_name(event)}")
+    return True
@@ -0,0 +1,18 @@
+from flask import Blueprint, jsonify
+from utils.metrics import snapshot
+from config.logger_config import setup_logging
+import logging
+import os
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    # Counters are per worker process, the pid tells the scrapes of each worker apart
+    return jsonify({"pid": os.getpid(), "metrics": snapshot()}), 200
@@ -0,0 +1,43 @@
+'''
+Body handling shared by the webhook routes: the body is read once, the signature is verified over it and the same
+buffer is decoded with the fast JSON codec (utils/json_codec.py). Flask responses are encoded with that codec too.
+'''
+
+from typing import Optional, Tuple
+
+from flask.json.provider import JSONProvider
+
+from utils import json_codec
+
+
+def read_body(request) -> Tuple[bytes, memoryview]:
+    '''
+    Raw body of a Flask request, read a single time (Werkzeug keeps it for later get_data() calls), and a
+    memoryview over it for the HMAC and the decoding, so neither copies it.
+    '''
+    body = request.get_data(cache=True)
+    return body, memoryview(body)
+
+
+def decode(view: memoryview) -> Optional[object]:
+    '''
+    JSON payload of a verified body, None if it is empty or invalid.
+    '''
+    return json_codec.loads_or_none(view)
+
+
+class CodecJSONProvider(JSONProvider):
+    '''
+    Flask JSON provider backed by json_codec, used by jsonify() and the dicts returned by the routes.
+    '''
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs) -> str:
+        return json_codec.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return json_codec.loads(s.encode() if isinstance(s, str) else s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_codec.dumps(obj), mimetype=self.mimetype)
@@ -2,23 +2,14 @@ import hashlib
 import hmac
 
 
-def verify_github_signature(request, secret):
+def verify_github_signature(body, signature_header: str, secret: bytes) -> bool:
     """
-    Validates the GitHub HMAC signature on the incoming request.
-    
+    Validates the GitHub HMAC signature of a webhook delivery.
+    body is the raw request body as read once by the route (bytes or a memoryview over it, it is not copied),
+    signature_header the value of "X-Hub-Signature-256", e.g. "sha256=abc123...".
     """
-    # The signature sent by GitHub, e.g. "sha256=abc123..."
-    signature_header = request.headers.get("X-Hub-Signature-256", "")
-    
-    # The raw request body (as bytes), essential for computing HMAC
-    raw_body = request.data
-    
-    # Compute our own HMAC sha256
-    expected_signature = "sha256=" + hmac.new(
-        secret,
-        raw_body,
-        hashlib.sha256
-    ).hexdigest()
+    # Compute our own HMAC sha256 over the raw body
+    expected_signature = "sha256=" + hmac.new(secret, body, hashlib.sha256).hexdigest()
 
     # Safely compare the two
-    return hmac.compare_digest(expected_signature, signature_header)
+    return hmac.compare_digest(expected_signature.encode(), (signature_header or "").encode())
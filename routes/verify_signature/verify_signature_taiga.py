@@ -1,24 +1,19 @@
 import hashlib
 import hmac
 
-def verify_taiga_signature(request, secret):
-    """
-    Validates the Taiga HMAC-SHA1 signature on the incoming request.
 
+def verify_taiga_signature(body, signature_header: str, secret) -> bool:
+    """
+    Validates the Taiga HMAC-SHA1 signature of a webhook delivery.
+    body is the raw request body as read once by the route (bytes or a memoryview over it, it is not copied),
+    signature_header the value of "X-TAIGA-WEBHOOK-SIGNATURE".
     """
-    # Grab the signature from the header of the request
-    signature_header = request.headers.get("X-TAIGA-WEBHOOK-SIGNATURE", "")
-
-    # The raw request body, as bytes
-    raw_body = request.data
-
     # If the secret is a string, encode it to bytes
     if isinstance(secret, str):
         secret = secret.encode("utf-8")
 
     # Re-compute the HMAC (sha1)
-    mac = hmac.new(secret, msg=raw_body, digestmod=hashlib.sha1)
-    expected_sig = mac.hexdigest()
+    expected_sig = hmac.new(secret, msg=body, digestmod=hashlib.sha1).hexdigest()
 
     # Compare them
-    return hmac.compare_digest(expected_sig, signature_header)
+    return hmac.compare_digest(expected_sig.encode(), (signature_header or "").encode())
@@ -0,0 +1,117 @@
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from pymongo.errors import DuplicateKeyError
+
+from processing import delivery_dedup
+from processing.delivery_dedup import DONE, IN_PROGRESS
+
+
+def _matches(doc, query):
+    for field, cond in query.items():
+        if isinstance(cond, dict):
+            if field not in doc or not doc[field] <= cond["$lte"]:
+                return False
+        elif doc.get(field) != cond:
+            return False
+    return True
+
+
+class _Deliveries:
+    '''
+    The subset of a pymongo collection used by delivery_dedup, over a dict of documents.
+    '''
+    def __init__(self):
+        self.docs = {}
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        self.docs[doc["_id"]] = dict(doc)
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query["_id"])
+        if doc is None and upsert:
+            doc = self.docs[query["_id"]] = {"_id": query["_id"]}
+        elif doc is None or not _matches(doc, query):
+            return SimpleNamespace(modified_count=0)
+        doc.update(update.get("$set", {}))
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+        return SimpleNamespace(modified_count=1)
+
+    def find_one(self, query, projection=None):
+        return self.docs.get(query["_id"])
+
+    def delete_one(self, query):
+        if query["_id"] in self.docs and _matches(self.docs[query["_id"]], query):
+            del self.docs[query["_id"]]
+
+
+class DeliveryDedupTest(unittest.TestCase):
+    def setUp(self):
+        self.coll = _Deliveries()
+        for patcher in (mock.patch.object(delivery_dedup, "get_collection", return_value=self.coll),
+                        mock.patch.object(delivery_dedup, "_RECENT", delivery_dedup.OrderedDict()),
+                        mock.patch.object(delivery_dedup, "DELIVERY_DEDUP_TTL", 3600)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _other_worker(self):
+        '''
+        Forgets what this process saw, as if the next call came from another worker.
+        '''
+        delivery_dedup._RECENT.clear()
+
+    def test_first_delivery_is_claimed(self):
+        self.assertIsNone(delivery_dedup.claim("d-1"))
+        self.assertEqual(self.coll.docs["d-1"]["state"], IN_PROGRESS)
+
+    def test_redelivery_in_progress_is_answered_202(self):
+        delivery_dedup.claim("d-1")
+        self.assertEqual(delivery_dedup.claim("d-1")[1], 202)
+        self._other_worker()
+        self.assertEqual(delivery_dedup.claim("d-1")[1], 202)
+
+    def test_finished_with_2xx_redelivery_is_answered_200(self):
+        delivery_dedup.claim("d-1")
+        delivery_dedup.finish("d-1", ({"status": "accepted"}, 202))
+        self.assertEqual(self.coll.docs["d-1"]["state"], DONE)
+        self.assertNotIn("lease_until", self.coll.docs["d-1"])
+        self.assertEqual(delivery_dedup.claim("d-1"), ({"status": "duplicate", "delivery": "d-1"}, 200))
+        self._other_worker()
+        self.assertEqual(delivery_dedup.claim("d-1")[1], 200)
+
+    def test_finished_with_an_error_is_released(self):
+        delivery_dedup.claim("d-1")
+        delivery_dedup.finish("d-1", ({"error": "Invalid JSON"}, 400))
+        self.assertNotIn("d-1", self.coll.docs)
+        self.assertIsNone(delivery_dedup.claim("d-1"))
+
+    def test_release_does_not_drop_a_processed_delivery(self):
+        delivery_dedup.claim("d-1")
+        delivery_dedup.complete("d-1")
+        delivery_dedup.release("d-1")
+        self.assertEqual(self.coll.docs["d-1"]["state"], DONE)
+
+    def test_expired_lease_is_taken_over(self):
+        delivery_dedup.claim("d-1")
+        self.coll.docs["d-1"]["lease_until"] = datetime.utcnow() - timedelta(seconds=1)
+        self._other_worker()
+        self.assertIsNone(delivery_dedup.claim("d-1"))
+        self.assertGreater(self.coll.docs["d-1"]["lease_until"], datetime.utcnow())
+
+    def test_deliveries_without_id_are_always_processed(self):
+        self.assertIsNone(delivery_dedup.claim(None))
+        self.assertIsNone(delivery_dedup.claim(None))
+        delivery_dedup.finish(None, ({}, 202))
+        self.assertEqual(self.coll.docs, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from routes.API_publisher import eval_outbox
+
+
+class _Cursor(list):
+    def sort(self, keys):
+        return _Cursor(sorted(self, key=lambda r: tuple(r[k] for k, _ in keys)))
+
+    def limit(self, n):
+        return _Cursor(self[:n])
+
+
+class _Outbox:
+    '''
+    The subset of a pymongo collection used by _dispatch_project, over a dict of rows.
+    '''
+    def __init__(self, rows=()):
+        self.rows = {r["_id"]: r for r in rows}
+
+    def insert_many(self, rows, ordered=True):
+        for row in rows:
+            self.rows[row["_id"]] = row
+
+    def find(self, query):
+        return _Cursor(r for r in self.rows.values() if r["prj"] == query["prj"])
+
+    def update_one(self, query, update):
+        row = self.rows.get(query["_id"])
+        if row is not None:
+            row.update(update["$set"])
+            for field, value in update["$inc"].items():
+                row[field] += value
+
+    def delete_many(self, query):
+        for _id in query["_id"]["$in"]:
+            self.rows.pop(_id, None)
+
+
+def _rows(now, *event_types):
+    rows = []
+    for i, event_type in enumerate(event_types):
+        row = eval_outbox.new_row(event_type, "TeamA", f"student{i}", "AMEP")
+        row.update(_id=i, created_at=now - timedelta(minutes=10 - i), next_attempt_at=now - timedelta(minutes=10))
+        rows.append(row)
+    return rows
+
+
+class GroupsTest(unittest.TestCase):
+    def test_only_consecutive_rows_are_merged(self):
+        rows = _rows(datetime(2025, 3, 3, 12, 0, 0), "push", "push", "issues", "push")
+        groups = eval_outbox._groups(rows)
+        self.assertEqual([[r["_id"] for r in g] for g in groups], [[0, 1], [2], [3]])
+
+
+class DispatchProjectTest(unittest.TestCase):
+    def _dispatch(self, outbox, dead, deliver, now):
+        with mock.patch.object(eval_outbox, "_outbox", return_value=outbox), \
+             mock.patch.object(eval_outbox, "_dead", return_value=dead), \
+             mock.patch.object(eval_outbox, "deliver_eval_event", side_effect=deliver):
+            return eval_outbox._dispatch_project("TeamA", now)
+
+    def test_notifications_keep_the_order_of_the_project(self):
+        now = datetime(2025, 3, 3, 12, 0, 0)
+        outbox = _Outbox(_rows(now, "push", "issues", "push"))
+        delivered = []
+        self.assertEqual(self._dispatch(outbox, _Outbox(), delivered.append, now), 3)
+        self.assertEqual([(d["event_type"], d["authors"]) for d in delivered],
+                         [("push", ["student0"]), ("issues", ["student1"]), ("push", ["student2"])])
+        self.assertEqual(outbox.rows, {})
+
+    def test_group_out_of_attempts_is_dead_lettered_and_the_next_one_delivered(self):
+        now = datetime(2025, 3, 3, 12, 0, 0)
+        rows = _rows(now, "issues", "issues", "push")
+        rows[0]["attempts"] = 2
+        outbox, dead = _Outbox(rows), _Outbox()
+        delivered = []
+
+        def deliver(event_data):
+            if event_data["event_type"] == "issues":
+                raise RuntimeError("400 Bad Request")
+            delivered.append(event_data)
+
+        with mock.patch.object(eval_outbox, "EVAL_OUTBOX_MAX_ATTEMPTS", 3):
+            self.assertEqual(self._dispatch(outbox, dead, deliver, now), 1)
+
+        self.assertEqual([d["event_type"] for d in delivered], ["push"])
+        self.assertEqual(outbox.rows, {})
+        self.assertEqual(sorted(dead.rows), [0, 1])
+        self.assertEqual(dead.rows[0]["last_error"], "400 Bad Request")
+
+    def test_group_with_attempts_left_is_retried(self):
+        now = datetime(2025, 3, 3, 12, 0, 0)
+        rows = _rows(now, "issues", "push")
+        rows[0]["attempts"] = 1
+        outbox, dead = _Outbox(rows), _Outbox()
+
+        def deliver(event_data):
+            raise RuntimeError("LD Eval unavailable")
+
+        with mock.patch.object(eval_outbox, "EVAL_OUTBOX_MAX_ATTEMPTS", 3):
+            self.assertEqual(self._dispatch(outbox, dead, deliver, now), 0)
+
+        self.assertEqual(sorted(outbox.rows), [0, 1])
+        self.assertEqual(outbox.rows[0]["attempts"], 2)
+        self.assertEqual(dead.rows, {})
+
+    def test_failing_group_after_a_delivered_one_backs_off(self):
+        now = datetime(2025, 3, 3, 12, 0, 0)
+        outbox = _Outbox(_rows(now, "push", "push", "issues"))
+
+        delivered = []
+
+        def deliver(event_data):
+            if event_data["event_type"] == "issues":
+                raise RuntimeError("LD Eval unavailable")
+            delivered.append(event_data)
+
+        self.assertEqual(self._dispatch(outbox, _Outbox(), deliver, now), 2)
+
+        self.assertEqual([d["event_count"] for d in delivered], [2])
+        failed = outbox.rows[2]
+        self.assertEqual(list(outbox.rows), [2])
+        self.assertEqual(failed["attempts"], 1)
+        self.assertGreater(failed["next_attempt_at"], now)
+        self.assertEqual(failed["last_error"], "LD Eval unavailable")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import os
+import unittest
+
+from datasources import github_handler, taiga_handler
+from datasources.field_spec import Const, Field, compile_spec, interpret_spec
+from datasources.timestamps import to_madrid_local
+
+PAYLOADS = os.path.join(os.path.dirname(__file__), "payloads")
+
+
+def payload(name):
+    with open(os.path.join(PAYLOADS, f"{name}.json"), encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+TAIGA_SPECS = {
+    "issue": taiga_handler.ISSUE_SPEC,
+    "epic": taiga_handler.EPIC_SPEC,
+    "task": taiga_handler.TASK_SPEC,
+    "userstory": taiga_handler.USERSTORY_SPEC,
+    "relateduserstory": taiga_handler.RELATED_USERSTORY_SPEC,
+}
+TAIGA_WEBHOOKS = [f"taiga_{kind}" for kind in TAIGA_SPECS]
+
+GITHUB_SPECS = {
+    "github_push": github_handler.PUSH_SPEC,
+    "github_issues": github_handler.ISSUE_SPEC,
+    "github_pull_request": github_handler.PULL_REQUEST_SPEC,
+}
+
+
+class CompiledEqualsInterpretedTest(unittest.TestCase):
+    '''
+    The compiled extractors must build the same documents as the reference walk of the spec.
+    '''
+
+    def assertSameDocument(self, spec, origin, src):
+        self.assertEqual(compile_spec(spec, origin)(src), interpret_spec(spec, origin)(src))
+
+    def test_taiga_specs_on_every_webhook(self):
+        # Every spec against every payload: the paths another entity does not have (null milestone, no user story…)
+        # must fall back to the same defaults
+        for kind, spec in TAIGA_SPECS.items():
+            for name in TAIGA_WEBHOOKS:
+                with self.subTest(spec=kind, payload=name):
+                    self.assertSameDocument(spec, "webhook", payload(name))
+
+    def test_taiga_specs_on_api_objects(self):
+        for kind in ("task", "userstory"):
+            for name in ("taiga_api_task", "taiga_api_userstory"):
+                with self.subTest(spec=kind, payload=name):
+                    self.assertSameDocument(TAIGA_SPECS[kind], "api", payload(name))
+
+    def test_github_specs(self):
+        for name, spec in GITHUB_SPECS.items():
+            with self.subTest(payload=name):
+                self.assertSameDocument(spec, "webhook", payload(name))
+        for commit in payload("github_push")["commits"]:
+            self.assertSameDocument(github_handler.COMMIT_SPEC, "webhook", commit)
+
+    def test_module_extractors_match_their_spec(self):
+        task = payload("taiga_task")
+        self.assertEqual(taiga_handler.extract_task(task), interpret_spec(taiga_handler.TASK_SPEC, "webhook")(task))
+        pr = payload("github_pull_request")
+        self.assertEqual(github_handler.extract_pull_request(pr),
+                         interpret_spec(github_handler.PULL_REQUEST_SPEC, "webhook")(pr))
+
+    def test_deferred_transforms_are_applied_by_from_api(self):
+        obj = payload("taiga_api_task")
+        self.assertIn("created_date", taiga_handler.task_from_api.deferred)
+        self.assertEqual(taiga_handler.task_from_api(obj)["created_date"], obj["created_date"])
+        self.assertEqual(taiga_handler.from_api(taiga_handler.task_from_api, [obj]),
+                         [interpret_spec(taiga_handler.TASK_SPEC, "api")(obj)])
+
+    def test_related_userstory_is_keyed_on_the_user_story(self):
+        doc = taiga_handler.extract_related_userstory(payload("taiga_relateduserstory"))
+        self.assertEqual((doc["userstory_id"], doc["epic_id"], doc["epic_name"]), (5581205, 310445, "Authentication"))
+
+    def test_mutable_defaults_and_constants_are_not_shared(self):
+        spec = [Field("tags", "data.tags", None, []), Field("origin", Const({"source": "webhook"}))]
+        extract = compile_spec(spec, "webhook")
+        first = extract({})
+        first["tags"].append("changed")
+        first["origin"]["source"] = "changed"
+        self.assertEqual(extract({}), {"tags": [], "origin": {"source": "webhook"}})
+
+    def test_null_intermediate_object_counts_as_missing(self):
+        spec = [Field("milestone_name", "data.milestone.name", None, ""),
+                Field("created", "data.milestone.created_date", None, "", to_madrid_local)]
+        src = {"data": {"milestone": None}}
+        self.assertEqual(compile_spec(spec, "webhook")(src), {"milestone_name": "", "created": ""})
+        self.assertSameDocument(spec, "webhook", src)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import json
+import os
+import unittest
+
+from datasources import github_decoders
+from datasources.github_decoders import decode_github_payload, decode_typed
+from datasources.github_handler import parse_github_event
+
+PAYLOADS = os.path.join(os.path.dirname(__file__), "payloads")
+
+
+def body(name):
+    with open(os.path.join(PAYLOADS, f"{name}.json"), "rb") as fh:
+        return fh.read()
+
+
+def parse(event, payload):
+    return parse_github_event({**payload, "X-GitHub-Event": event}, "TeamA", enrich=False)
+
+
+@unittest.skipIf(github_decoders.msgspec is None, "msgspec is not installed, every payload is decoded whole")
+class SelectiveDecodingTest(unittest.TestCase):
+    def test_documents_equal_the_full_decoding(self):
+        for event in ("push", "issues", "pull_request"):
+            with self.subTest(event=event):
+                raw = body(f"github_{event}")
+                self.assertIsNotNone(decode_typed(event, raw))
+                self.assertEqual(parse(event, decode_github_payload(event, raw)), parse(event, json.loads(raw)))
+
+    def test_unread_objects_are_not_decoded(self):
+        push = decode_typed("push", body("github_push"))
+        self.assertNotIn("head_commit", push)
+        self.assertNotIn("pusher", push)
+        self.assertEqual(set(push["repository"]), {"full_name"})
+        self.assertNotIn("added", push["commits"][0])
+
+    def test_missing_paths_stay_missing(self):
+        # The second commit has no author.username, the parsers must see the default, not a null
+        push = decode_typed("push", body("github_push"))
+        self.assertNotIn("username", push["commits"][1]["author"])
+        self.assertEqual(parse("push", push)["commits"][1]["user"]["login"], "")
+
+    def test_unexpected_shape_falls_back_to_the_full_decoding(self):
+        payload = json.loads(body("github_push"))
+        payload["commits"] = {"0": payload["commits"][0]}      # An object where a list is expected
+        raw = json.dumps(payload).encode()
+        self.assertIsNone(decode_typed("push", raw))
+        self.assertEqual(decode_github_payload("push", raw), payload)
+
+
+class FullDecodingTest(unittest.TestCase):
+    def test_other_events_are_decoded_whole(self):
+        raw = b'{"zen": "Keep it logically awesome.", "hook_id": 1}'
+        self.assertIsNone(decode_typed("ping", raw))
+        self.assertEqual(decode_github_payload("ping", raw), {"zen": "Keep it logically awesome.", "hook_id": 1})
+
+    def test_invalid_json_is_none(self):
+        self.assertIsNone(decode_github_payload("issues", b'{"action": '))
+
+
+if __name__ == "__main__":
+    unittest.main()
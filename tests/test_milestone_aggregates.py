@@ -0,0 +1,110 @@
+import unittest
+from unittest import mock
+
+from pymongo import ReturnDocument
+
+from processing import milestone_aggregates
+from processing.milestone_aggregates import apply_change
+
+
+class _Milestones:
+    '''
+    The subset of a pymongo collection used by apply_change, over a dict of milestone documents.
+    '''
+    def __init__(self, docs=()):
+        self.docs = {d["_id"]: dict(d) for d in docs}
+        self.writes = 0
+
+    def _apply(self, query, update, upsert):
+        self.writes += 1
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            if not upsert:
+                return None
+            doc = self.docs[query["_id"]] = {"_id": query["_id"], **update.get("$setOnInsert", {})}
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+        return doc
+
+    def update_one(self, query, update, upsert=False):
+        self._apply(query, update, upsert)
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=ReturnDocument.BEFORE):
+        assert return_document == ReturnDocument.AFTER
+        return dict(self._apply(query, update, upsert))
+
+
+def _milestone(milestone_id, **counters):
+    return {"_id": milestone_id, "project_id": 5, **dict.fromkeys(milestone_aggregates.AGGREGATE_FIELDS, 0), **counters}
+
+
+def _task(milestone_id, closed=False):
+    return {"task_id": 11, "project_id": 5, "milestone_id": milestone_id, "is_closed": closed}
+
+
+def _userstory(milestone_id, points, closed=False):
+    return {"userstory_id": 9, "project_id": 5, "milestone_id": milestone_id, "is_closed": closed, "total_points": points}
+
+
+class ApplyChangeTest(unittest.TestCase):
+    def apply(self, milestones, kind, old, new):
+        with mock.patch.object(milestone_aggregates, "get_collection", return_value=milestones):
+            return apply_change("TeamA", kind, old, new)
+
+    def test_task_moving_between_milestones(self):
+        milestones = _Milestones([_milestone(1, total_tasks=3, completed_tasks=2), _milestone(2, total_tasks=1)])
+        result = self.apply(milestones, "task", _task(1, closed=True), _task(2, closed=True))
+
+        self.assertEqual((milestones.docs[1]["total_tasks"], milestones.docs[1]["completed_tasks"]), (2, 1))
+        self.assertEqual((milestones.docs[2]["total_tasks"], milestones.docs[2]["completed_tasks"]), (2, 1))
+        self.assertEqual(result["milestone_total_tasks"], 2)
+        self.assertEqual(result["milestone_completed_tasks"], 1)
+
+    def test_task_moving_to_a_new_milestone_creates_it(self):
+        milestones = _Milestones([_milestone(1, total_tasks=1)])
+        result = self.apply(milestones, "task", _task(1), _task(3))
+
+        self.assertEqual(milestones.docs[1]["total_tasks"], 0)
+        self.assertEqual(milestones.docs[3], {"_id": 3, "project_id": 5, "total_tasks": 1})
+        self.assertEqual(result["milestone_total_tasks"], 1)
+        self.assertEqual(result["milestone_total_points"], 0)
+
+    def test_task_closed_in_its_milestone(self):
+        milestones = _Milestones([_milestone(1, total_tasks=2, completed_tasks=0)])
+        result = self.apply(milestones, "task", _task(1), _task(1, closed=True))
+
+        self.assertEqual((milestones.docs[1]["total_tasks"], milestones.docs[1]["completed_tasks"]), (2, 1))
+        self.assertEqual(result["milestone_completed_tasks"], 1)
+        self.assertEqual(milestones.writes, 1)
+
+    def test_unchanged_task_only_reads_its_milestone(self):
+        milestones = _Milestones([_milestone(1, total_tasks=2, completed_tasks=1)])
+        result = self.apply(milestones, "task", _task(1, closed=True), _task(1, closed=True))
+
+        self.assertEqual((milestones.docs[1]["total_tasks"], milestones.docs[1]["completed_tasks"]), (2, 1))
+        self.assertEqual(result["milestone_total_tasks"], 2)
+
+    def test_task_removed_from_its_milestone(self):
+        milestones = _Milestones([_milestone(1, total_tasks=2, completed_tasks=1)])
+        result = self.apply(milestones, "task", _task(1, closed=True), _task(""))
+
+        self.assertEqual((milestones.docs[1]["total_tasks"], milestones.docs[1]["completed_tasks"]), (1, 0))
+        self.assertEqual(result, {})
+
+    def test_deleted_task(self):
+        milestones = _Milestones([_milestone(1, total_tasks=2)])
+        self.assertEqual(self.apply(milestones, "task", _task(1), None), {})
+        self.assertEqual(milestones.docs[1]["total_tasks"], 1)
+
+    def test_userstory_moving_between_milestones_moves_its_points(self):
+        milestones = _Milestones([_milestone(1, total_userstories=2, completed_userstories=1, total_points=8, closed_points=3),
+                                  _milestone(2)])
+        result = self.apply(milestones, "userstory", _userstory(1, 3, closed=True), _userstory(2, 5, closed=True))
+
+        self.assertEqual(milestones.docs[1], _milestone(1, total_userstories=1, completed_userstories=0, total_points=5, closed_points=0))
+        self.assertEqual(milestones.docs[2], _milestone(2, total_userstories=1, completed_userstories=1, total_points=5, closed_points=5))
+        self.assertEqual(result["milestone_closed_points"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
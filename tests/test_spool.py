@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from processing import spool
+from processing.spool import Spool, _read_records
+
+
+def _open(directory, segment_bytes=1 << 20):
+    s = Spool(directory, segment_bytes, fsync_interval_ms=60_000, fsync_batch=1_000)
+    return s, s.open()
+
+
+class SpoolTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        # The sync thread is driven by hand (_sync / _write_checkpoint) so the tests are deterministic
+        patcher = mock.patch.object(spool.threading, "Thread")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _crash(self, s):
+        '''
+        Stops using a spool without closing it, like a killed worker: the lane lock is released, the segment stays
+        preallocated.
+        '''
+        with s._lock:
+            s._sync()
+        s._lane_fh.close()
+
+    def test_records_round_trip(self):
+        s, pending = _open(self.dir)
+        self.assertEqual(pending, [])
+        deliveries = [({"source": "github", "prj": "TeamA", "n": i}, f"body {i}".encode() * (i + 1)) for i in range(5)]
+        positions = [s.append(meta, body) for meta, body in deliveries]
+
+        read = list(s.records(positions))
+        self.assertEqual([pos for pos, _, _ in read], positions)
+        self.assertEqual([(meta, body) for _, meta, body in read], deliveries)
+        self.assertEqual([meta["n"] for _, meta, _ in s.records([positions[3], positions[1]])], [1, 3])
+        s.close()
+
+    def test_records_rotate_to_a_new_segment(self):
+        s, _ = _open(self.dir, segment_bytes=256)
+        positions = [s.append({"n": i}, b"x" * 100) for i in range(4)]
+        self.assertGreater(positions[-1][0], positions[0][0])
+        self.assertEqual([meta["n"] for _, meta, _ in s.records(positions)], [0, 1, 2, 3])
+        s.close()
+
+    def test_unacknowledged_records_are_replayed_after_a_crash(self):
+        s, _ = _open(self.dir)
+        positions = [s.append({"n": i}, b"body") for i in range(4)]
+        s.ack(positions[0])
+        s.ack(positions[2])         # Not contiguous, the checkpoint stays after the first one
+        with s._lock:
+            s._write_checkpoint()
+        self._crash(s)
+
+        s2, pending = _open(self.dir)
+        self.assertEqual([meta["n"] for _, meta, _ in s2.records(pending)], [1, 2, 3])
+        s2.close()
+
+    def test_checkpoint_after_every_ack_leaves_nothing_to_replay(self):
+        s, _ = _open(self.dir)
+        for pos in [s.append({"n": i}, b"body") for i in range(3)]:
+            s.ack(pos)
+        with s._lock:
+            s._write_checkpoint()
+        self._crash(s)
+
+        s2, pending = _open(self.dir)
+        self.assertEqual(pending, [])
+        s2.close()
+
+    def test_torn_record_ends_the_segment(self):
+        s, _ = _open(self.dir)
+        positions = [s.append({"n": i}, b"body %d" % i) for i in range(3)]
+        self._crash(s)
+        # Corrupt the payload of the second record, as a write cut by a power loss would
+        path = os.path.join(s._lane_dir, spool._segment_name(positions[1][0]))
+        with open(path, "r+b") as fh:
+            fh.seek(positions[1][1] - 1)
+            fh.write(b"\xff")
+
+        with self.assertLogs(spool.logger, "WARNING"):
+            records = list(_read_records(s._lane_dir, (0, 0)))
+        self.assertEqual([meta["n"] for _, meta, _ in records], [0])
+
+    def test_dead_letter_is_acknowledged_and_taken_back(self):
+        s, _ = _open(self.dir)
+        positions = [s.append({"source": "taiga", "prj": "TeamA", "n": i}, b"body %d" % i) for i in range(2)]
+        with self.assertLogs(spool.logger, "ERROR"):
+            s.dead_letter(positions[0], "boom")
+        s.ack(positions[1])
+        self.assertEqual(s._inflight, {})
+
+        self.assertEqual(spool.take_dead_letters(self.dir), [({"source": "taiga", "prj": "TeamA", "n": 0}, b"body 0", "boom")])
+        self.assertEqual(spool.take_dead_letters(self.dir), [])
+        s.close()
+
+    @unittest.skipIf(spool.fcntl is None, "lanes are only adopted where flock is available")
+    def test_orphan_lane_is_adopted(self):
+        # Two workers, then the second one goes away with a pending delivery
+        s1, _ = _open(self.dir)
+        s2, _ = _open(self.dir)
+        self.assertNotEqual(s1._lane_dir, s2._lane_dir)
+        done = s2.append({"n": 0}, b"processed")
+        s2.append({"n": 1}, b"pending")
+        s2.ack(done)
+        with s2._lock:
+            s2._write_checkpoint()
+        self._crash(s2)
+        self._crash(s1)
+
+        # A single worker restarts: it takes the first lane and moves the backlog of the orphan one into it
+        s3, pending = _open(self.dir)
+        self.assertEqual(s3._lane_dir, s1._lane_dir)
+        self.assertEqual([(meta, body) for _, meta, body in s3.records(pending)], [({"n": 1}, b"pending")])
+        self.assertFalse(os.path.exists(s2._lane_dir))
+        s3.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
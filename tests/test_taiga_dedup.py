@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from processing import taiga_dedup
+from utils.shared_cache import SharedCache
+
+BODY = b'{"action": "change", "type": "task", "data": {"id": 6402571}}'
+
+
+class _TaigaDedupCases:
+    '''
+    Claim / finish / release of the deduplication window, run with and without the shared cache.
+    '''
+
+    def setUp(self):
+        for patcher in (mock.patch.object(taiga_dedup, "shared_cache", return_value=self.cache()),
+                        mock.patch.object(taiga_dedup, "_RECENT", taiga_dedup.OrderedDict()),
+                        mock.patch.object(taiga_dedup, "TAIGA_DEDUP_WINDOW", 30)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.key = taiga_dedup.content_key(BODY, "TeamA")
+
+    def test_copy_within_the_window_is_answered_200(self):
+        self.assertIsNone(taiga_dedup.claim(self.key))
+        self.assertEqual(taiga_dedup.claim(self.key), ({"status": "duplicate"}, 200))
+
+    def test_key_depends_on_the_project_and_the_body(self):
+        self.assertNotEqual(self.key, taiga_dedup.content_key(BODY, "TeamB"))
+        self.assertNotEqual(self.key, taiga_dedup.content_key(BODY + b" ", "TeamA"))
+        self.assertEqual(self.key, taiga_dedup.content_key(BODY, "TeamA"))
+
+    def test_finished_with_2xx_keeps_the_window(self):
+        taiga_dedup.claim(self.key)
+        taiga_dedup.finish(self.key, ({"status": "accepted"}, 202))
+        self.assertIsNotNone(taiga_dedup.claim(self.key))
+
+    def test_finished_with_an_error_releases_the_window(self):
+        taiga_dedup.claim(self.key)
+        taiga_dedup.finish(self.key, ({"error": "Invalid event type"}, 400))
+        self.assertIsNone(taiga_dedup.claim(self.key))
+
+    def test_released_key_is_processed_again(self):
+        taiga_dedup.claim(self.key)
+        taiga_dedup.release(self.key)
+        self.assertIsNone(taiga_dedup.claim(self.key))
+
+    def test_release_without_key_is_a_no_op(self):
+        taiga_dedup.claim(self.key)
+        taiga_dedup.release(None)
+        self.assertIsNotNone(taiga_dedup.claim(self.key))
+
+
+class LocalWindowTest(_TaigaDedupCases, unittest.TestCase):
+    def cache(self):
+        return None
+
+
+class SharedWindowTest(_TaigaDedupCases, unittest.TestCase):
+    def cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        return SharedCache(os.path.join(directory, "shared_cache.db"))
+
+    def test_window_is_shared_by_the_processes(self):
+        taiga_dedup.claim(self.key)
+        taiga_dedup._RECENT.clear()     # Another process only sees the shared cache
+        self.assertIsNotNone(taiga_dedup.claim(self.key))
+
+
+if __name__ == "__main__":
+    unittest.main()
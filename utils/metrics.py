@@ -0,0 +1,54 @@
+'''
+Process-local metrics registry. Counters are incremented by the code paths they describe, gauges are callables
+evaluated when the metrics are read (GET /metrics), so they cost nothing between scrapes.
+'''
+
+import logging
+import threading
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+_COUNTERS: Dict[str, float] = {}
+_GAUGES: Dict[str, Callable[[], object]] = {}
+_LOCK = threading.Lock()
+
+
+def inc(name: str, value: float = 1) -> None:
+    '''
+    Adds value to the counter name, creating it on first use.
+    '''
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + value
+
+
+def register_gauge(name: str, fn: Callable[[], object]) -> None:
+    '''
+    Registers a gauge, fn is called on every read and must return a number or a dict of numbers.
+    '''
+    with _LOCK:
+        _GAUGES[name] = fn
+
+
+def counters(prefix: str = "") -> Dict[str, float]:
+    '''
+    Returns the counters whose name starts with prefix, without evaluating the gauges.
+    '''
+    with _LOCK:
+        return {name: value for name, value in _COUNTERS.items() if name.startswith(prefix)}
+
+
+def snapshot() -> Dict[str, object]:
+    '''
+    Returns the current value of every counter and gauge. A failing gauge is reported as None.
+    '''
+    with _LOCK:
+        values = dict(_COUNTERS)
+        gauges = dict(_GAUGES)
+    for name, fn in gauges.items():
+        try:
+            values[name] = fn()
+        except Exception as e:
+            logger.warning(f"Gauge {name} could not be read: {e}")
+            values[name] = None
+    return values
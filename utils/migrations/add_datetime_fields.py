@@ -0,0 +1,121 @@
+'''
+Adds the native datetime fields (<field>_dt, UTC) to the GitHub and Taiga documents stored before the parsers wrote them.
+
+The documents of every team collection are walked in _id order by batches, each batch written with one unordered
+bulk_write. The last _id done is checkpointed in the "migrations" collection after every batch, so an interrupted run
+resumes where it stopped. Documents that already have the fields are skipped, running it twice is harmless.
+'''
+
+import argparse
+import logging
+import re
+from datetime import datetime
+from typing import Dict, List
+
+from pymongo import UpdateOne
+
+from config.logger_config import setup_logging
+from database.mongo_client import db, get_collection
+from datasources import github_handler, taiga_handler
+from datasources.field_spec import Field
+from datasources.timestamps import DATETIME_SUFFIX, to_utc_datetime
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_COLLECTION = "migrations"
+MIGRATION = "datetime_fields"
+
+
+def _converted(spec: List[Field]) -> List[str]:
+    return [f.target[:-len(DATETIME_SUFFIX)] for f in spec if f.transform is to_utc_datetime]
+
+
+# Collection name pattern -> string date fields of its documents. The singular Taiga names are the collections the
+# recovery script wrote to (taiga_{prj}.{event}) before it used the ones of the webhooks
+COLLECTIONS = {
+    r"^github_.+\.commits$":                _converted(github_handler.COMMIT_SPEC),
+    r"^github_.+\.pull_requests$":          _converted(github_handler.PULL_REQUEST_SPEC),
+    r"^taiga_.+\.(tasks|task)$":            _converted(taiga_handler.TASK_SPEC),
+    r"^taiga_.+\.(userstories|userstory)$": _converted(taiga_handler.USERSTORY_SPEC),
+    r"^taiga_.+\.(issues|issue)$":          _converted(taiga_handler.ISSUE_SPEC),
+    r"^taiga_.+\.(epics|epic)$":            _converted(taiga_handler.EPIC_SPEC),
+}
+
+
+def _datetime_fields(doc: Dict, fields: List[str]) -> Dict[str, datetime]:
+    '''
+    $set of the missing datetime fields of a stored document.
+    '''
+    update = {}
+    for field in fields:
+        target = f"{field}{DATETIME_SUFFIX}"
+        if target not in doc and field in doc:
+            update[target] = to_utc_datetime(doc[field])
+    return update
+
+
+def migrate_collection(name: str, fields: List[str], batch_size: int = 1000) -> int:
+    '''
+    Adds the datetime fields to the documents of a collection, resuming from its checkpoint.
+    Returns the number of documents updated by this run.
+    '''
+    checkpoints = get_collection(CHECKPOINT_COLLECTION)
+    checkpoint_id = f"{MIGRATION}:{name}"
+    checkpoint = checkpoints.find_one({"_id": checkpoint_id}) or {}
+    if checkpoint.get("done"):
+        logger.info(f"{name}: already migrated")
+        return 0
+
+    coll = get_collection(name)
+    projection = {field: 1 for field in fields} | {f"{field}{DATETIME_SUFFIX}": 1 for field in fields}
+    last_id = checkpoint.get("last_id")
+    updated = 0
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(coll.find(query, projection).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        operations = []
+        for doc in batch:
+            update = _datetime_fields(doc, fields)
+            if update:
+                operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+        if operations:
+            updated += coll.bulk_write(operations, ordered=False).modified_count
+        last_id = batch[-1]["_id"]
+        checkpoints.update_one({"_id": checkpoint_id}, {"$set": {"last_id": last_id, "updated_at": datetime.utcnow()},
+                                                        "$inc": {"updated": len(operations)}}, upsert=True)
+
+    checkpoints.update_one({"_id": checkpoint_id}, {"$set": {"done": True, "updated_at": datetime.utcnow()}}, upsert=True)
+    logger.info(f"{name}: {updated} documents updated")
+    return updated
+
+
+def collections(prj: str = None) -> List[tuple]:
+    '''
+    (collection name, date fields) of the stored team collections, only the ones of prj if given.
+    '''
+    result = []
+    for name in sorted(db.list_collection_names()):
+        if prj and not name.startswith((f"github_{prj}.", f"taiga_{prj}.")):
+            continue
+        for pattern, fields in COLLECTIONS.items():
+            if re.match(pattern, name):
+                result.append((name, fields))
+    return result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Adds the native <field>_dt datetime fields to the stored documents")
+    ap.add_argument("--prj", help="Only this team, by default every team")
+    ap.add_argument("--batch-size", type=int, default=1000, help="Documents read and written per bulk_write")
+    ap.add_argument("--restart", action="store_true", help="Forget the checkpoints and walk the collections again")
+    ns = ap.parse_args()
+    targets = collections(ns.prj)
+    if ns.restart:
+        get_collection(CHECKPOINT_COLLECTION).delete_many({"_id": {"$in": [f"{MIGRATION}:{name}" for name, _ in targets]}})
+    total = sum(migrate_collection(name, fields, ns.batch_size) for name, fields in targets)
+    logger.info(f"Datetime fields added to {total} documents in {len(targets)} collections")
+
+# In order to execute this script: python -m utils.migrations.add_datetime_fields --prj TeamA
@@ -1,4 +1,4 @@
-import argparse, requests
+import argparse
 from typing import Dict, Iterable, Optional, List
 from datetime import datetime, timezone
 from pymongo import UpdateOne
@@ -10,6 +10,7 @@ from datasources.github_handler import parse_github_event
 from config.logger_config import setup_logging
 from routes.API_publisher.API_event_publisher import notify_eval_push
 from config.settings import GITHUB_TOKEN
+from datasources.requests import http_client
 
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -39,7 +40,7 @@ def gh_paginated(url: str, headers: Dict[str, str]) -> Iterable[Dict]:
     Gets paginated results from a GitHub API endpoint. With this each call to the API returns a suitable JSON
     '''
     while url:
-        r = requests.get(url, headers=headers, timeout=30)
+        r = http_client.get("github", url, headers=headers, timeout=(3, 30))
         r.raise_for_status()
         yield from r.json()
         url = r.links.get("next", {}).get("url")
@@ -1,4 +1,4 @@
-import argparse, re, requests
+import argparse
 from pymongo import UpdateOne
 from datetime import datetime, timezone
 from typing import Optional, Dict, List
@@ -6,11 +6,14 @@ from dateutil import tz, parser as dtparser   # pip install python-dateutil
 import logging
 
 from database.mongo_client import get_collection
+from datasources.taiga_handler import task_from_api, issue_from_api, epic_from_api, userstory_from_api, from_api
 from utils.taiga_token.get_taiga_token import get_token
 from routes.API_publisher.API_event_publisher import notify_eval_push
+from datasources.requests import http_client
 from config.logger_config import setup_logging
 
-from config.settings import TAIGA_USERNAME, TAIGA_PASSWORD
+from processing import milestone_aggregates
+from config.settings import TAIGA_USERNAME, TAIGA_PASSWORD, MILESTONE_STATS_SOURCE
 
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -32,7 +35,7 @@ def get_username_id(token: str) -> int:
     With this ID we canfind the projects that the user is a member of.
     '''
     h = {"Authorization": f"Bearer {token}"}
-    r = requests.get(f"https://api.taiga.io/api/v1/users/me", headers=h, timeout=10)
+    r = http_client.get("taiga", f"https://api.taiga.io/api/v1/users/me", headers=h)
     r.raise_for_status()
     return r.json()["id"]
 
@@ -40,7 +43,7 @@ def get_username_id(token: str) -> int:
 def get_project_id_by_slug(slug: str) -> int:
     """Resolve Taiga project ID from slug without authentication (public projects)."""
     url = "https://api.taiga.io/api/v1/projects/by_slug"
-    r = requests.get(url, params={"slug": slug}, timeout=10)
+    r = http_client.get("taiga", url, params={"slug": slug})
     if r.status_code == 200:
         return r.json()["id"]
     if r.status_code in (401, 403):
@@ -57,7 +60,7 @@ def get_project_id_by_username_id(project_name: str, token: str) -> int:
     '''
     h = {"Authorization": f"Bearer {token}"}
     uid = get_username_id(token)
-    r = requests.get(f"https://api.taiga.io/api/v1/projects", headers=h, params={"member": uid}, timeout=10)
+    r = http_client.get("taiga", f"https://api.taiga.io/api/v1/projects", headers=h, params={"member": uid})
     r.raise_for_status()
     for p in r.json():
         if p["name"].lower() == project_name.lower():
@@ -82,7 +85,7 @@ def fetch_entities(entity: str, project: int, start: Optional[datetime] = None,
     if start: params["modified_date__gte"] = start.astimezone(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")      # See if there is a start date to fetch data, if there is add it to the params
     if end:   params["modified_date__lte"] = end.astimezone(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")        # See if there is a end date to fetch data, if there is add it to the params
 
-    r = requests.get(f"https://api.taiga.io/api/v1/{endpoint_path}", headers=headers, params=params, timeout=30)  # In the request we add the headers and params
+    r = http_client.get("taiga", f"https://api.taiga.io/api/v1/{endpoint_path}", headers=headers, params=params, timeout=(3, 30))  # In the request we add the headers and params
     r.raise_for_status()
     return r.json()
 
@@ -99,126 +102,7 @@ def upsert(coll, docs: list[dict], key: str) -> int:
     return res.matched_count + len(res.upserted_ids)
 
 
-# Converters from API Schema to MongoDB Schema
-def task_from_api(j: dict, prj: str) -> dict:
-    '''
-    Converts a task JSON object from the Taiga API to a MongoDB document schema.
-    '''
-    m = j.get("milestone_extra_info") or {}
-    us = j.get("user_story_extra_info") or {}
-    return {
-        "task_id":        j["id"],
-        "action_type":    "import",
-        "assigned_by":    "backfill",
-        "assigned_to":    (j.get("assigned_to_extra_info") or {}).get("username"),
-        "created_date":   j["created_date"],
-        "custom_attributes": j.get("custom_attributes_values") or {},
-        "estimated_finish": m.get("estimated_finish"),
-        "estimated_start":  m.get("estimated_start"),
-        "event_type":     "task",
-        "finished_date":  j["finished_date"],
-        "is_closed":      j["status_extra_info"]["is_closed"],
-        "milestone_closed": m.get("closed"),
-        "milestone_created_date": m.get("created_date"),
-        "milestone_id":   j.get("milestone"),
-        "milestone_modified_date": m.get("modified_date"),
-        "milestone_name": m.get("name"),
-        "modified_date":  j["modified_date"],
-        "prj":            prj,
-        "reference":      j["ref"],
-        "status":         j["status_extra_info"]["name"],
-        "subject":        j["subject"],
-        "team_name":      j["project_extra_info"]["name"],
-        "userstory_id":   j.get("user_story"),
-        "userstory_is_closed": us.get("is_closed"),   
-    }
-
-
-def issue_from_api(j: dict, prj: str) -> dict:
-    '''
-    Converts a isue JSON object from the Taiga API to a MongoDB document schema.
-    '''
-    return {
-        "issue_id":    j["id"],
-        "action_type": "import",
-        "assigned_by":  "backfill",
-        "assigned_to": (j.get("assigned_to_extra_info") or {}).get("username"),
-        "created_date":  j["created_date"],
-        "description": j.get("description"),
-        "due_date":    j.get("due_date"),
-        "event_type":  "issue",
-        "finished_date": j.get("finished_date"),
-        "is_closed":   (j.get("status_extra_info") or {}).get("is_closed"),
-        "modified_date": j["modified_date"],
-        "priority":    (j.get("priority_extra_info") or {}).get("name"),
-        "prj":         prj,
-        "severity":    (j.get("severity_extra_info") or {}).get("name"),
-        "status":      (j.get("status_extra_info") or {}).get("name"),
-        "subject":     j["subject"],
-        "team_name":   j["project_extra_info"]["name"],
-        "type":        (j.get("type_extra_info") or {}).get("name"),    
-    }
-
-
-def epic_from_api(j: dict, prj: str) -> dict:
-    '''
-    Converts an epic JSON object from the Taiga API to a MongoDB document schema.
-    '''
-    return {
-        "epic_id":      j["id"],
-        "action_type":  "import",
-        "assigned_by":   "backfill",
-        "created_date":  j["created_date"],
-        "event_type":   "epic",
-        "is_closed":    (j.get("status_extra_info") or {}).get("is_closed"),
-        "modified_date": j["modified_date"],
-        "prj":          prj,
-        "project_id":    j["project_extra_info"]["id"],
-        "status":       (j.get("status_extra_info") or {}).get("name"),
-        "subject":      j["subject"],
-        "team_name":    j["project_extra_info"]["name"],
-    }
-    
-    
-def userstory_from_api(j: dict, prj: str) -> dict:
-    '''
-    Converts an userstory JSON object from the Taiga API to a MongoDB document schema.
-    '''
-    m = j.get("milestone_extra_info") or {}
-    desc = j.get("description") or ""
-    pattern = bool(re.search(r"as\s+.*?\s+i want\s+.*?\s+so that\s+.*", desc, re.I))
-    raw_points = j.get("points")          # puede ser list | "" | None
-    if isinstance(raw_points, list):
-        total = sum((p.get("value") or 0) for p in raw_points)
-    else:
-        total = 0
-
-    return {
-        "userstory_id": j["id"],
-        "action_type": "import",
-        "assigned_by":   "backfill",
-        "created_date":  j["created_date"],
-        "custom_attributes": j.get("custom_attributes_values") or {},
-        "estimated_finish": m.get("estimated_finish"),
-        "estimated_start":  m.get("estimated_start"),
-        "event_type":  "userstory",
-        "is_closed":   (j.get("status_extra_info") or {}).get("is_closed"),
-        "milestone_closed": m.get("closed"),
-        "milestone_created_date": m.get("created_date"),
-        "milestone_id":   j.get("milestone"),
-        "milestone_modified_date": m.get("modified_date"),
-        "milestone_name": m.get("name"),
-        "modified_date": j["modified_date"],
-        "pattern": pattern,
-        "priority": (j.get("custom_attributes_values") or {}).get("Priority"),        
-        "prj":         prj,
-        "status":      (j.get("status_extra_info") or {}).get("name"),
-        "subject":     j["subject"],
-        "team_name":   j["project_extra_info"]["name"],
-        "total_points":  total,
-    }
-    
-
+# The converters from the API schema to the MongoDB schema are compiled from the same specs as the webhook parsers
 ENTITY_ENDPOINT = {
     "task":        ("tasks",        task_from_api,        "task_id"),
     "issue":       ("issues",       issue_from_api,       "issue_id"),
@@ -265,8 +149,10 @@ def main(argv: list[str] | None = None):
     for event in events: # Iterate over the events to backfill
         endpoint, converter, key = ENTITY_ENDPOINT[event]
         raw = fetch_entities(event, pid, start, end)   # Get the raw data from the Taiga API for the event
-        docs = [converter(r, ns.prj) for r in raw]        # Convert the raw data to the MongoDB schema using the converter function
-        coll = get_collection(f"taiga_{ns.prj}.{event}")  # Get the MongoDB collection for the event
+        docs = from_api(converter, raw)                  # Convert the raw data to the MongoDB schema, dates to Madrid local time in one batch
+        for d in docs:
+            d["prj"] = ns.prj
+        coll = get_collection(f"taiga_{ns.prj}.{endpoint}")  # Same MongoDB collection as the webhooks of the event
         n    = upsert(coll, docs, key)                        # Upsert the documents
         total += n
         print(f" • {event:<12} → {n:>4} documents")          # Print total number of documments
@@ -280,6 +166,10 @@ def main(argv: list[str] | None = None):
         
         
 
+    # The bulk upserts bypass the milestone counters, recompute them from the stored documents
+    if MILESTONE_STATS_SOURCE == "local" and {"task", "userstory"} & set(events):
+        milestone_aggregates.rebuild(ns.prj)
+
     span = "all time" if not (start or end) else \
            f"from {ns.from_date or '…'} to {ns.to_date or '…'}"
     print(f"{total} documents inserted({span})")
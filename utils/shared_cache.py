@@ -0,0 +1,191 @@
+'''
+Cache shared by every worker process of a host, stored in a SQLite database in WAL mode (readers never wait on the
+writer, a read is a few microseconds).
+
+Entries are JSON values with an absolute expiry. get_or_load() collapses the misses of all the processes: the first one
+takes a short lease on the key and loads it, the others wait for its value instead of calling the loader too, so a
+cold start logs in to Taiga once per credential and host rather than once per worker. Entries can be refreshed ahead
+of their expiry by the first caller that sees them in the refresh window, while the others keep using the old value.
+'''
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional, Tuple
+
+from config.settings import SHARED_CACHE_PATH
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entries (ns TEXT, key TEXT, value TEXT, expires_at REAL, PRIMARY KEY (ns, key)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS leases (ns TEXT, key TEXT, owner TEXT, until REAL, PRIMARY KEY (ns, key)) WITHOUT ROWID",
+)
+_PURGE_EVERY = 256          # Writes between two deletions of the expired rows
+
+_INSTANCE = None
+_INSTANCE_LOCK = threading.Lock()
+
+
+def _prepare_private(path: str) -> None:
+    '''
+    The cache holds API tokens. Its directory is created 0700 and the database file 0600 before SQLite opens it:
+    SQLite gives the -wal / -shm files the permissions of the database file, so none of them is readable by others.
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    elif os.stat(directory).st_mode & 0o077:
+        logger.warning(f"Shared cache directory {directory} is accessible by other users, prefer a private one.")
+    os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+    for name in (path, f"{path}-wal", f"{path}-shm"):
+        try:
+            os.chmod(name, 0o600)       # Created by an older version with the default umask
+        except FileNotFoundError:
+            pass
+
+
+class SharedCache:
+    def __init__(self, path: str, lease_seconds: float = 30):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        self._writes = 0
+        _prepare_private(path)
+        conn = self._conn()
+        for statement in _SCHEMA:
+            conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        '''
+        One connection per thread and process, SQLite connections can not be shared between them.
+        '''
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, ns: str, key: str) -> Optional[Tuple[object, float]]:
+        '''
+        Returns (value, expires_at) of a live entry, None if it is missing or expired.
+        '''
+        row = self._conn().execute("SELECT value, expires_at FROM entries WHERE ns = ? AND key = ? AND expires_at > ?",
+                                   (ns, key, time.time())).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set(self, ns: str, key: str, value, ttl: float) -> None:
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO entries (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                     (ns, key, json.dumps(value), time.time() + ttl))
+        self._writes += 1
+        if self._writes % _PURGE_EVERY == 0:
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+
+    def add(self, ns: str, key: str, value, ttl: float) -> bool:
+        '''
+        Stores an entry only if the key is missing or expired, atomically across the processes of the host.
+        True if it was stored, False if a live entry was already there.
+        '''
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM entries WHERE ns = ? AND key = ? AND expires_at <= ?", (ns, key, now))
+            cur = conn.execute("INSERT OR IGNORE INTO entries (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                               (ns, key, json.dumps(value), now + ttl))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._writes += 1
+        if self._writes % _PURGE_EVERY == 0:
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        return cur.rowcount == 1
+
+    def delete(self, ns: str, key: str) -> None:
+        self._conn().execute("DELETE FROM entries WHERE ns = ? AND key = ?", (ns, key))
+
+    def _acquire(self, ns: str, key: str, owner: str) -> bool:
+        '''
+        Takes the load lease of a key, False if another caller (of any process) holds a live one.
+        '''
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE ns = ? AND key = ? AND until <= ?", (ns, key, now))
+            cur = conn.execute("INSERT OR IGNORE INTO leases (ns, key, owner, until) VALUES (?, ?, ?, ?)",
+                               (ns, key, owner, now + self.lease_seconds))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cur.rowcount == 1
+
+    def _release(self, ns: str, key: str, owner: str) -> None:
+        self._conn().execute("DELETE FROM leases WHERE ns = ? AND key = ? AND owner = ?", (ns, key, owner))
+
+    def _load(self, ns: str, key: str, loader: Callable[[], object], ttl: float, owner: str):
+        try:
+            value = loader()
+            self.set(ns, key, value, ttl)
+            return value
+        finally:
+            self._release(ns, key, owner)
+
+    def get_or_load(self, ns: str, key: str, loader: Callable[[], object], ttl: float, refresh_before: float = 0):
+        '''
+        Returns the value of key, calling loader() when it is missing or expired. Only one caller per host loads
+        a key at a time, the others wait for its result. Entries with less than refresh_before seconds left are
+        reloaded by the first caller that sees them, the rest keep answering the current value meanwhile.
+        '''
+        owner = f"{os.getpid()}-{threading.get_ident()}-{uuid.uuid4().hex[:8]}"
+        entry = self.get(ns, key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at - time.time() > refresh_before or not self._acquire(ns, key, owner):
+                metrics.inc(f"shared_cache.{ns}.hits")
+                return value
+            metrics.inc(f"shared_cache.{ns}.refreshes")
+            try:
+                return self._load(ns, key, loader, ttl, owner)
+            except Exception as e:
+                logger.warning(f"Refresh of {ns} entry failed, keeping the current value: {e}")
+                return value
+
+        metrics.inc(f"shared_cache.{ns}.misses")
+        while True:
+            if self._acquire(ns, key, owner):
+                entry = self.get(ns, key)       # Stored by a caller that released the lease in between
+                if entry is not None:
+                    self._release(ns, key, owner)
+                    return entry[0]
+                return self._load(ns, key, loader, ttl, owner)
+            # Another caller is loading it, wait for its value (or for its lease to expire if it died)
+            time.sleep(0.05)
+            entry = self.get(ns, key)
+            if entry is not None:
+                metrics.inc(f"shared_cache.{ns}.collapsed")
+                return entry[0]
+
+
+def shared_cache() -> Optional[SharedCache]:
+    '''
+    Cache of this host, None when SHARED_CACHE_PATH is empty (every process keeps its own data then).
+    '''
+    global _INSTANCE
+    if not SHARED_CACHE_PATH:
+        return None
+    if _INSTANCE is None:
+        with _INSTANCE_LOCK:
+            if _INSTANCE is None:
+                _INSTANCE = SharedCache(SHARED_CACHE_PATH)
+    return _INSTANCE
@@ -1,4 +1,4 @@
-import requests
+from datasources.requests import http_client
 
 
 def get_token(payload:dict) -> str: 
@@ -12,7 +12,7 @@ def get_token(payload:dict) -> str:
 
 
     # Send the POST request to log in
-    response = requests.post(login_url, json=payload)
+    response = http_client.post("taiga", login_url, json=payload)
     response.raise_for_status()  # Will raise an error if the response status is not 200
 
     # Parse the JSON response
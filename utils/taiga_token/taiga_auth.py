@@ -1,32 +1,44 @@
-import requests, logging, time
+import hashlib, logging, time
+from config.settings import TAIGA_TOKEN_TTL, TAIGA_TOKEN_REFRESH_SECONDS
+from datasources.requests import http_client
+from utils.shared_cache import shared_cache
 
 log = logging.getLogger(__name__)
-_TOKENS = {}          # key = (username, password) -> token
+_TOKENS = {}          # key = (username, password) -> token, only used without the shared cache
+
+
+def _login(username: str, password: str) -> str:
+    payload = {
+        "username": username,
+        "password": password,
+        "type": "normal"
+    }
+    r = http_client.post("taiga", "https://api.taiga.io/api/v1/auth", json=payload)
+    r.raise_for_status()
+    log.info(f"New Taiga token acquired successfully, expires in {TAIGA_TOKEN_TTL // 3600}h.")
+    return r.json()["auth_token"]
+
 
 def get_taiga_token(username:str, password: str) -> str:
     '''
-    Tool to get a Taiga API token and cache it for 23 hours (In taiga documentation, says the token expires in 24h).
-    If the token is about to expire (less than 60 seconds left), it will request a new one.
+    Tool to get a Taiga API token and cache it for TAIGA_TOKEN_TTL (In taiga documentation, says the token expires in 24h).
+    The token is shared by the worker processes of the host (utils/shared_cache.py), so only one of them logs in per
+    credential, and it is renewed TAIGA_TOKEN_REFRESH_SECONDS before it expires.
     This avoids making too many requests to the Taiga API for the token.
     '''
-    
-    
+    cache = shared_cache()
+    if cache is not None:
+        # The password only takes part in the key as a digest, it is never written to disk
+        key = f"{username}:{hashlib.sha256(password.encode()).hexdigest()[:16]}"
+        return cache.get_or_load("taiga_token", key, lambda: _login(username, password),
+                                 ttl=TAIGA_TOKEN_TTL, refresh_before=TAIGA_TOKEN_REFRESH_SECONDS)
+
     key = (username, password)
     token, exp = _TOKENS.get(key, (None, 0))
     
     # If the token is not set or is about to expire, request a new one
-    if token is None or exp - time.time() < 60:
-        payload = {
-            "username": username,
-            "password": password,
-            "type": "normal"
-        }
-        r = requests.post("https://api.taiga.io/api/v1/auth", json=payload, timeout=(2, 5))
-        r.raise_for_status()
-        
-        token = r.json()["auth_token"]
-        exp = time.time() + 23 * 3600
-        _TOKENS[key] = (token, exp)
-        log.info("New Taiga token acquired successfully, expires in 23h.")
+    if token is None or exp - time.time() < TAIGA_TOKEN_REFRESH_SECONDS:
+        token = _login(username, password)
+        _TOKENS[key] = (token, time.time() + TAIGA_TOKEN_TTL)
 
     return token
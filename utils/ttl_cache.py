@@ -0,0 +1,131 @@
+'''
+Thread-safe in-process cache with LRU eviction, per-entry TTL and single-flight loading.
+
+Concurrent misses for the same key wait on one call of the loader instead of calling it each. Entries past their TTL
+but within the stale window are still answered while a single background load refreshes them (stale-while-revalidate).
+Hits, misses, stale answers, collapsed misses and load errors are exported as counters in utils.metrics.
+'''
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    '''
+    A load in progress, shared by the callers that missed the same key.
+    '''
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    def __init__(self, name: str, maxsize: int, ttl: float, stale_ttl: float = 0):
+        '''
+        name prefixes the exported counters, ttl is the freshness in seconds and stale_ttl how long past it an entry
+        may still be answered while it is refreshed (0 disables stale-while-revalidate).
+        '''
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()      # key -> (fresh_until, stale_until, value), least recently used first
+        self._flights = {}              # key -> _Flight
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        metrics.register_gauge(f"{name}.size", lambda: len(self._data))
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], object]):
+        '''
+        Returns the cached value of key, calling loader() (once, whatever the number of concurrent callers) when it is
+        missing or expired. Errors of the loader are raised to every caller waiting on it and nothing is cached.
+        '''
+        if self._pid != os.getpid():
+            self._after_fork()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                fresh_until, stale_until, value = entry
+                if now < fresh_until:
+                    self._data.move_to_end(key)
+                    metrics.inc(f"{self.name}.hits")
+                    return value
+                if now < stale_until:
+                    self._data.move_to_end(key)
+                    metrics.inc(f"{self.name}.stale_hits")
+                    if key not in self._flights:
+                        flight = self._flights[key] = _Flight()
+                        threading.Thread(target=self._load, args=(key, loader, flight),
+                                         name=f"{self.name}-refresh", daemon=True).start()
+                    return value
+                del self._data[key]
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                metrics.inc(f"{self.name}.misses")
+            else:
+                metrics.inc(f"{self.name}.collapsed")
+
+        if leader:
+            self._load(key, loader, flight)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _after_fork(self) -> None:
+        '''
+        The loads in progress belong to threads of the parent process, they would never complete in this one.
+        '''
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._pid = os.getpid()
+
+    def _load(self, key: Hashable, loader: Callable[[], object], flight: _Flight) -> None:
+        try:
+            flight.value = loader()
+            self.put(key, flight.value)
+        except Exception as e:
+            flight.error = e
+            metrics.inc(f"{self.name}.load_errors")
+            logger.warning(f"Cache {self.name} could not load {key}: {e}")
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def put(self, key: Hashable, value) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (now + self.ttl, now + self.ttl + self.stale_ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        '''
+        Counters of this cache, as exported in utils.metrics.
+        '''
+        prefix = f"{self.name}."
+        return {name[len(prefix):]: value for name, value in metrics.counters(prefix).items()}
@@ -1,6 +1,7 @@
-import pymongo
 import requests
-from config.settings import MONGO_URI, MONGO_DB, GITHUB_TOKEN, WEBHOOK_URL_GITHUB
+from datasources.requests import http_client
+from database.mongo_client import get_db
+from config.settings import GITHUB_TOKEN, WEBHOOK_URL_GITHUB
 
 
 
@@ -15,7 +16,7 @@ def list_github_hooks(owner, repo)-> list:
         "Accept": "application/vnd.github.v3+json",
         "Authorization": f"Bearer {GITHUB_TOKEN}"
     }
-    resp = requests.get(url, headers=headers)
+    resp = http_client.get("github", url, headers=headers)
     resp.raise_for_status()
     return resp.json()
 
@@ -30,7 +31,7 @@ def delete_github_hook(owner, repo, hook_id):
         "Accept": "application/vnd.github.v3+json",
         "Authorization": f"Bearer {GITHUB_TOKEN}"
     }
-    resp = requests.delete(url, headers=headers)
+    resp = http_client.delete("github", url, headers=headers)
     resp.raise_for_status()
     return resp
 
@@ -40,8 +41,7 @@ def delete_all_github_webhooks(webhook_url_github):
     '''
     This function deletes all the webhooks created on the repositories of the database.
     '''
-    mongo_client = pymongo.MongoClient(MONGO_URI) # URI to connect to the database
-    db = mongo_client[MONGO_DB] # Name of the database
+    db = get_db() # Database of the settings, same client options as the service
     # We get all collections with 'commits' in their name and store them in a list. From them we will extract the repositories names and owners.
     all_collections = db.list_collection_names()
     github_commit_collections = [c for c in all_collections if "commit" in c]
@@ -1,6 +1,7 @@
-import pymongo
 import requests
-from config.settings import MONGO_URI, MONGO_DB, WEBHOOK_URL_TAIGA
+from datasources.requests import http_client
+from database.mongo_client import get_db
+from config.settings import WEBHOOK_URL_TAIGA
 
 
 
@@ -11,7 +12,7 @@ def list_taiga_hooks(project_id, token):
     headers = {
         "Authorization": f"Bearer {token}"
     }
-    resp = requests.get(url, headers=headers)
+    resp = http_client.get("taiga", url, headers=headers)
     resp.raise_for_status()
     return resp.json()
 
@@ -23,7 +24,7 @@ def delete_taiga_hook(hook_id, token):
     headers = {
         "Authorization": f"Bearer {token}"
     }
-    resp = requests.delete(url, headers=headers)
+    resp = http_client.delete("taiga", url, headers=headers)
     resp.raise_for_status()
     return resp
 
@@ -33,8 +34,7 @@ def delete_taiga_hook(hook_id, token):
 
 def delete_all_taiga_webhooks(token, webhook_url_taiga):
     
-    mongo_client = pymongo.MongoClient(MONGO_URI) # URI to connect to the database
-    db = mongo_client[MONGO_DB] # Name of the database
+    db = get_db() # Database of the settings, same client options as the service
 
 
     # We get all collections with 'epic' in their name and store them in a list. From them we will extract the projectsid of all the taiga projects active.